@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class AdConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ad'
+
+    def ready(self):
+        from . import signals, database
+        connection_created.connect(database.configure_connection)
+        post_migrate.connect(signals.setup_search_index, sender=self)
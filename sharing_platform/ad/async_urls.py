@@ -0,0 +1,16 @@
+from django.urls import path, re_path
+from .async_views import AsyncShowAdItem, AsyncAdCatalog, AsyncExchangeAdList, AsyncExchangeInitList, AsyncOfferEvents
+
+# JSON-варианты представлений чтения из ad.urls для ASGI-сервера (те же пути под префиксом ad/async/)
+urlpatterns = [
+    path("show/<uuid:id_>/", AsyncShowAdItem.as_view(), name="async-show-ad"),
+    path("exchange-create-list/<uuid:id_>/", AsyncExchangeInitList.as_view(), name="async-exchange-init-list"),
+    path("catalog/my/", AsyncAdCatalog.as_view(), name="async-all-ad-my"),
+    path("catalog/tome/", AsyncAdCatalog.as_view(), name="async-all-ad-tome"),
+    path("catalog/request/", AsyncAdCatalog.as_view(), name="async-all-ad-can_request"),
+    path("catalog/all-my-items/", AsyncAdCatalog.as_view(), name="async-all-ad-my-ad-items"),
+    path("catalog/", AsyncAdCatalog.as_view(), name="async-all-ad"),
+    re_path("exchange-request-list/(?P<id_>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})/(?P<type_>in|out|all)/",
+            AsyncExchangeAdList.as_view(), name="async-offer-request-list"),
+    path("events/", AsyncOfferEvents.as_view(), name="async-offer-events"),  # Server-Sent Events: предложения обмена
+]
@@ -0,0 +1,151 @@
+""" Асинхронные (ASGI) варианты JSON-представлений чтения: каталог, страница предмета, списки обменов.
+Запросы к БД выполняются асинхронными методами ORM. Они проходят через sync_to_async(thread_sensitive=True), то есть
+выполняются по очереди в одном потоке: выигрыш - в том, что ожидание БД не занимает поток сервера, а не в
+параллельных запросах. Наборы записей и фильтры берутся у синхронных представлений (ad.views), вывод совпадает
+с их ответами в формате JSON (?format=json). Аутентификация - те же классы DRF, что и у синхронных представлений
+(DEFAULT_AUTHENTICATION_CLASSES: токен, сессия, Basic).
+AsyncOfferEvents - поток Server-Sent Events с событиями предложений обмена пользователя (ad.events). """
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND, \
+    HTTP_422_UNPROCESSABLE_ENTITY
+from .events import get_event_backend
+from .fast_serializers import FastJSONRenderer
+from .loaders import ObjectLoader
+from .models import AdItem
+from .replicas import replica_reads
+from .serializers import AdItemSerializer
+from .views import AdCatalog, CatalogPagination, ExchangeAdList, ExchangeInitList
+
+
+class AsyncJSONView(View):
+    login_required = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user, request.auth = await sync_to_async(self.authenticate)(request)
+        except AuthenticationFailed as error:  # Неверный токен или пароль
+            return self.json_response({"detail": str(error.detail)}, status=HTTP_401_UNAUTHORIZED)
+        if self.login_required and not request.user.is_authenticated:
+            return self.json_response({"detail": str(NotAuthenticated.default_detail)}, status=HTTP_403_FORBIDDEN)
+        try:
+            with replica_reads():
+                return await super().dispatch(request, *args, **kwargs)
+        except NotFound as error:  # Неверный курсор
+            return self.json_response({"detail": str(error.detail)}, status=HTTP_404_NOT_FOUND)
+
+    @staticmethod
+    def authenticate(request) -> tuple:
+        """ Пользователь и данные аутентификации, как их определил бы APIView. Ленивый пользователь
+        AuthenticationMiddleware (сессия) загружается здесь же - в асинхронном коде он обращался бы к БД синхронно. """
+        drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        return drf_request.user, drf_request.auth
+
+    @staticmethod
+    def json_response(data=None, status=HTTP_200_OK) -> HttpResponse:
+        return HttpResponse(b"" if data is None else FastJSONRenderer().render(data), status=status,
+                            content_type=FastJSONRenderer.media_type)
+
+    async def paginate(self, view, queryset) -> dict:
+        """ Страница в формате ValuesListMixin.list синхронного представления view. """
+        request = Request(self.request)  # query_params для постраничного вывода
+        paginator = CatalogPagination()
+        ordering = [field.lstrip("-") for field in paginator.get_ordering(queryset, view)]
+        page = await paginator.apaginate_queryset(view.values_serializer.values(queryset, *ordering), request, view)
+        return paginator.get_paginated_data(view.values_serializer.serialize(page, {"request": request}))
+
+
+class AsyncAdCatalog(AsyncJSONView):
+    async def get(self, request):
+        if not AdCatalog.validate_params(request.GET):
+            return self.json_response(status=HTTP_422_UNPROCESSABLE_ENTITY)
+        view = AdCatalog(request=request)
+        queryset = view.filter_queryset(view.get_queryset())
+        data = await self.paginate(view, queryset)
+        data["facets"] = await sync_to_async(view.get_facets)()
+        return self.json_response(data)
+
+
+class AsyncShowAdItem(AsyncJSONView):
+    async def get(self, request, id_):
+        ad_item = await AdItem.objects.select_related(*ObjectLoader.ad_item_related).filter(id=id_).afirst()
+        if ad_item is None:
+            return self.json_response(status=HTTP_404_NOT_FOUND)
+        return self.json_response(AdItemSerializer(ad_item, context={"request": Request(request)}).data)
+
+
+class AsyncExchangeAdList(AsyncJSONView):
+    login_required = True
+
+    async def get(self, request, id_, type_):
+        view = ExchangeAdList(request=request, current_ad_id=id_, type=type_)
+        if not await AdItem.objects.filter(id=id_).aexists():
+            return self.json_response(status=HTTP_404_NOT_FOUND)
+        return self.json_response(await self.paginate(view, view.filter_queryset(view.get_queryset())))
+
+
+class AsyncExchangeInitList(AsyncJSONView):
+    login_required = True
+
+    async def get(self, request, id_):
+        view = ExchangeInitList(request=request, my_ad_id=id_)
+        if not await AdItem.objects.filter(id=id_).aexists():
+            return self.json_response(status=HTTP_404_NOT_FOUND)
+        return self.json_response(await self.paginate(view, view.filter_queryset(None)))
+
+
+class AsyncOfferEvents(AsyncJSONView):
+    """ Поток text/event-stream. Первое сообщение - ready (новое подключение) или reset (пропущенные события
+    недоступны - списки нужно перезагрузить), далее события offer_* с номером в поле id. При переподключении
+    браузер передаёт номер последнего полученного события (Last-Event-ID), пропущенные события повторяются.
+    Поток закрывается через AD_EVENT_STREAM_MAX_DURATION сек., клиент переподключается без потерь. """
+    login_required = True
+    retry_ms = 3000  # Задержка переподключения EventSource
+
+    async def get(self, request):
+        last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+        try:
+            last_event_id = None if last_event_id is None else int(last_event_id)
+        except ValueError:
+            last_event_id = None
+        response = StreamingHttpResponse(self.stream(request.user.id, last_event_id),
+                                         content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # Не буферизовать в обратном прокси
+        return response
+
+    async def stream(self, user_id, last_event_id):
+        backend = get_event_backend()
+        subscription = backend.subscribe(user_id)  # До повтора: события, опубликованные во время повтора, не теряются
+        try:
+            yield f"retry: {self.retry_ms}\n\n".encode()
+            events = None if last_event_id is None else backend.replay(user_id, last_event_id)
+            if events is None:
+                yield self.message("ready" if last_event_id is None else "reset", {}, backend.current_id())
+                events = []
+            sent_id = events[-1].id if events else last_event_id
+            for event in events:
+                yield self.message(event.type, event.data, event.id)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + getattr(settings, "AD_EVENT_STREAM_MAX_DURATION", 300)
+            while not subscription.lost:
+                timeout = min(getattr(settings, "AD_EVENT_KEEPALIVE", 15), deadline - loop.time())
+                if timeout <= 0:
+                    break
+                event = await subscription.get(timeout)
+                if event is None:
+                    yield b": keepalive\n\n"  # Соединение не закрывается прокси по простою
+                elif sent_id is None or event.id > sent_id:
+                    yield self.message(event.type, event.data, event.id)
+        finally:
+            backend.unsubscribe(subscription)
+
+    @staticmethod
+    def message(event_type, data, id_) -> bytes:
+        return b"id: %d\nevent: %s\ndata: %s\n\n" % (id_, event_type.encode(), FastJSONRenderer().render(data))
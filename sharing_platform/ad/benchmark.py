@@ -0,0 +1,158 @@
+""" Общие инструменты замеров производительности: синтетический набор данных и статистика замеров.
+Используются management-командами benchmark_*; запускаются на отдельной (тестовой) БД. """
+import gc
+import os
+import time
+import uuid
+import random
+import statistics
+import tempfile
+import tracemalloc
+import typing
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, setup_databases, teardown_databases, override_settings
+from .models import AdItem, ArticleCategory, ExchangeProposal
+from .exchange import rebuild_pending_state
+from .counters import rebuild_user_counters
+from .facets import rebuild_facet_counts
+from .search import get_search_backend
+
+
+BENCHMARK_PASSWORD = "benchmark"
+WORDS = ("мышь", "утюг", "колесо", "фреза", "резец", "велосипед", "лампа", "стол", "книга", "кабель",
+         "монитор", "чайник", "гитара", "куртка", "палатка", "рюкзак", "дрель", "ключ", "насос", "часы")
+
+
+class Dataset(typing.NamedTuple):
+    users: list
+    categories: list
+    item_ids: list
+
+
+@contextmanager
+def benchmark_database(verbosity=0, on_disk=False):
+    """ Временная БД (как при запуске тестов) - рабочие данные не затрагиваются.
+    on_disk - тестовая БД SQLite в файле, а не в памяти: нужно для замеров режима журнала и блокировок. """
+    test_settings = connection.settings_dict["TEST"]
+    if on_disk and connection.vendor == "sqlite" and not test_settings.get("NAME"):
+        test_settings["NAME"] = os.path.join(tempfile.gettempdir(), f"benchmark_{os.getpid()}.sqlite3")
+    old_config = setup_databases(verbosity=verbosity, interactive=False, aliases={"default"})
+    try:
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+
+
+def seed_dataset(users=50, categories=30, items=10000, proposals=10000, batch_size=5000, seed=1) -> Dataset:
+    """ Заполнить БД синтетическими пользователями, категориями, предметами и предложениями обмена.
+    Записи вставляются пачками (bulk_create), производные структуры (поисковый индекс, счётчики) строятся в конце. """
+    rnd = random.Random(seed)
+    password = make_password(BENCHMARK_PASSWORD)
+    User.objects.bulk_create([User(username=f"bench_{i}", password=password) for i in range(users)],
+                             batch_size=batch_size)
+    user_list = list(User.objects.filter(username__startswith="bench_").order_by("id"))
+    ArticleCategory.objects.bulk_create([ArticleCategory(name=f"bench category {i}") for i in range(categories)],
+                                        batch_size=batch_size)
+    category_list = list(ArticleCategory.objects.filter(name__startswith="bench category").order_by("id"))
+    item_ids, item_owners = [], {}
+    with transaction.atomic():
+        batch = []
+        for i in range(items):
+            owner = rnd.choice(user_list)
+            item = AdItem(id=str(uuid.uuid4()), name=" ".join(rnd.sample(WORDS, 2)) + f" {i}",
+                          description=" ".join(rnd.sample(WORDS, 5)), category=rnd.choice(category_list),
+                          owner=owner, status=rnd.choice("ab"))
+            item_ids.append(item.id)
+            item_owners[item.id] = owner.id
+            batch.append(item)
+            if len(batch) >= batch_size:
+                AdItem.objects.bulk_create(batch)
+                batch = []
+        AdItem.objects.bulk_create(batch)
+    with transaction.atomic():
+        batch, pending_pairs = [], set()
+        for i in range(proposals if len(item_ids) > 1 else 0):
+            sender_id, receiver_id = rnd.sample(item_ids, 2)
+            if item_owners[sender_id] == item_owners[receiver_id]:
+                continue
+            status = rnd.choices("psr", weights=(8, 1, 1))[0]
+            if status == "p" and (sender_id, receiver_id) in pending_pairs:
+                continue  # Одно ожидающее предложение на пару (ad_proposal_pending_pair_uniq)
+            if status == "p":
+                pending_pairs.add((sender_id, receiver_id))
+            batch.append(ExchangeProposal(id=str(uuid.uuid4()), sender_id=sender_id, receiver_id=receiver_id,
+                                          status=status))
+            if len(batch) >= batch_size:
+                ExchangeProposal.objects.bulk_create(batch)
+                batch = []
+        ExchangeProposal.objects.bulk_create(batch)
+    rebuild_pending_state()
+    rebuild_user_counters()
+    rebuild_facet_counts()
+    get_search_backend().rebuild(batch_size=batch_size)
+    return Dataset(user_list, category_list, item_ids)
+
+
+def percentile(values: typing.Sequence[float], percent: int) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+class Measurement:
+    """ Замеры одной операции: время выполнения, кол-во SQL-запросов, пиковое потребление памяти. """
+    def __init__(self, name):
+        self.name = name
+        self.timings: typing.List[float] = []
+        self.queries: typing.List[int] = []
+        self.peak_memory = 0
+        self.errors = 0
+
+    def run(self, func: typing.Callable, iterations: int):
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                ok = func()
+                self.timings.append(time.perf_counter() - started)
+            self.queries.append(len(context))
+            self.errors += 0 if ok else 1
+        gc.collect()
+        tracemalloc.start()  # Память меряется отдельным прогоном - трассировка замедляет выполнение
+        try:
+            func()
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def as_dict(self) -> dict:
+        return {
+            "queries": max(self.queries, default=0),
+            "p50_ms": round(percentile(self.timings, 50) * 1000, 3),
+            "p99_ms": round(percentile(self.timings, 99) * 1000, 3),
+            "peak_kb": round(self.peak_memory / 1024, 1),
+            "errors": self.errors
+        }
+
+
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float) -> typing.List[str]:
+    """ Регрессии относительно сохранённого базового замера.
+    Кол-во запросов и ошибок не должно расти вовсе, время и память - не более чем на долю tolerance. """
+    regressions = []
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        for key in ("queries", "errors"):
+            if result[key] > base.get(key, 0):
+                regressions.append(f"{name}: {key} {base.get(key, 0)} -> {result[key]}")
+        for key in ("p50_ms", "p99_ms", "peak_kb"):
+            if key in base and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} -> {result[key]}")
+    return regressions
@@ -0,0 +1,60 @@
+""" Кеш категорий предметов и производных от них данных (варианты выбора, отрисованная форма фильтра).
+Категории меняются редко: данные хранятся в памяти процесса с ограниченным сроком жизни (AD_CATEGORY_CACHE_TTL)
+и сбрасываются сигналами сохранения/удаления ArticleCategory. Если задан общий кеш (AD_CATEGORY_CACHE_ALIAS),
+в нём хранится номер версии - сброс в одном процессе становится виден остальным. """
+import time
+import typing
+from threading import Lock
+from django.conf import settings
+from django.core.cache import caches
+from .models import ArticleCategory
+
+
+VERSION_KEY = "ad:categories:version"
+
+
+class CategoryCache:
+    def __init__(self):
+        self._entries: typing.Dict[str, typing.Tuple[float, typing.Any, typing.Any]] = {}  # ключ -> (истекает, версия, значение)
+        self._lock = Lock()
+
+    @property
+    def ttl(self) -> float:
+        return getattr(settings, "AD_CATEGORY_CACHE_TTL", 300)
+
+    @staticmethod
+    def shared_cache():
+        alias = getattr(settings, "AD_CATEGORY_CACHE_ALIAS", None)
+        return None if alias is None else caches[alias]
+
+    def version(self):
+        shared = self.shared_cache()
+        return None if shared is None else shared.get_or_set(VERSION_KEY, 0, timeout=None)
+
+    def get(self, key: str, build: typing.Callable[[], typing.Any]):
+        """ Значение по ключу; при отсутствии, истечении срока или смене версии вычисляется заново (build). """
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic() and entry[1] == version:
+            return entry[2]
+        value = build()
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, version, value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+        shared = self.shared_cache()
+        if shared is not None:
+            shared.set(VERSION_KEY, time.time_ns(), timeout=None)  # Не повторяет прежние номера, даже если ключ был вытеснен
+
+
+category_cache = CategoryCache()
+
+
+def get_categories(max_count: int) -> typing.List[typing.Tuple[int, str]]:
+    """ Первые max_count категорий: список пар (id, название). """
+    return category_cache.get(f"categories:{max_count}", lambda: list(
+        ArticleCategory.objects.order_by("id")[:max_count].values_list("id", "name")))
@@ -0,0 +1,123 @@
+""" Сводные счётчики пользователя (UserExchangeCounters) для панели /ad/dashboard/.
+Изменяются приращениями в тех же транзакциях, что и данные: создание и удаление предметов (ad.signals,
+загрузка пачкой), создание, отзыв, принятие, отклонение и истечение предложений (ad.exchange).
+Все приращения одной операции применяются одним UPDATE. Расхождения исправляет rebuild_user_counters
+(команда reconcile_user_counters). """
+import typing
+from collections import Counter, defaultdict
+from django.contrib.auth.models import User
+from django.db.models import Case, When, F, Value, Count, IntegerField
+from django.db.models.functions import Greatest
+from .models import AdItem, ExchangeProposal, UserExchangeCounters
+
+
+COUNTER_FIELDS = ("items_count", "pending_in_count", "pending_out_count", "completed_count")
+REBUILD_BATCH_SIZE = 1000
+
+Deltas = typing.Dict[typing.Any, typing.Counter[str]]  # id пользователя -> {поле: приращение}
+
+
+def new_deltas() -> Deltas:
+    return defaultdict(Counter)
+
+
+def add_pending_deltas(deltas: Deltas, rows: typing.Iterable[tuple], sign=-1) -> Deltas:
+    """ rows - (id владельца предмета-отправителя, id владельца предмета-получателя) ожидающих предложений. """
+    for sender_owner_id, receiver_owner_id in rows:
+        deltas[sender_owner_id]["pending_out_count"] += sign
+        deltas[receiver_owner_id]["pending_in_count"] += sign
+    return deltas
+
+
+def update_user_counters(deltas: Deltas):
+    """ Применить приращения одним UPDATE (CASE по пользователю). Значения не опускаются ниже нуля.
+    Пользователям без строки счётчиков она создаётся пересчётом. """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if user_id is not None and any(delta.values())}
+    if not deltas:
+        return
+    changes = {}
+    for field in COUNTER_FIELDS:
+        whens = [When(user_id=user_id, then=Greatest(F(field) + delta[field], Value(0),
+                                                            output_field=IntegerField()))
+                 for user_id, delta in deltas.items() if delta[field]]
+        if whens:
+            changes[field] = Case(*whens, default=F(field), output_field=IntegerField())
+    updated = UserExchangeCounters.objects.filter(user_id__in=deltas).update(**changes)
+    if updated < len(deltas):
+        existing = set(UserExchangeCounters.objects.filter(user_id__in=deltas).values_list("user_id", flat=True))
+        rebuild_user_counters([user_id for user_id in deltas if user_id not in existing])
+
+
+def compute_user_counters(user_ids: typing.Iterable) -> typing.Dict[typing.Any, typing.Dict[str, int]]:
+    """ Значения счётчиков, посчитанные по таблицам AdItem и ExchangeProposal. """
+    user_ids = list(user_ids)
+    result = {user_id: dict.fromkeys(COUNTER_FIELDS, 0) for user_id in user_ids}
+    pending = ExchangeProposal.objects.filter(status="p")
+    completed = ExchangeProposal.objects.filter(status="s")
+    queries = (  # (поле, набор записей, столбец с id пользователя)
+        ("items_count", AdItem.objects.all(), "owner_id"),
+        ("pending_out_count", pending, "sender__owner_id"),
+        ("pending_in_count", pending, "receiver__owner_id"),
+        ("completed_count", completed, "sender_owner_id"),
+        ("completed_count", completed, "receiver_owner_id"),
+    )
+    for field, queryset, key in queries:
+        rows = queryset.filter(**{f"{key}__in": user_ids}).order_by().values(key).annotate(counter=Count("id"))
+        for row in rows:
+            result[row[key]][field] += row["counter"]
+    return result
+
+
+def find_drifted_users(batch_size=REBUILD_BATCH_SIZE) -> typing.List:
+    """ id пользователей, у которых сохранённые счётчики расходятся с пересчитанными (без записи). """
+    drifted = []
+    user_ids = list(User.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        drifted.extend(_drifted(compute_user_counters(batch), batch))
+    return drifted
+
+
+def rebuild_user_counters(user_ids: typing.Optional[typing.Iterable] = None,
+                          batch_size=REBUILD_BATCH_SIZE) -> typing.List:
+    """ Пересчитать счётчики пользователей (по умолчанию всех) и записать их (INSERT ... ON CONFLICT UPDATE).
+    Возвращает id пользователей, у которых сохранённые значения расходились с пересчитанными. """
+    if user_ids is None:
+        user_ids = User.objects.order_by("id").values_list("id", flat=True).iterator()
+    drifted = []
+    batch = []
+    for user_id in user_ids:
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            drifted.extend(_rebuild_batch(batch))
+            batch = []
+    drifted.extend(_rebuild_batch(batch))
+    return drifted
+
+
+def _rebuild_batch(user_ids: list) -> list:
+    if not user_ids:
+        return []
+    expected = compute_user_counters(user_ids)
+    drifted = _drifted(expected, user_ids)
+    if drifted:
+        UserExchangeCounters.objects.bulk_create(
+            [UserExchangeCounters(user_id=user_id, **expected[user_id]) for user_id in drifted],
+            update_conflicts=True, unique_fields=("user",), update_fields=COUNTER_FIELDS)
+    return drifted
+
+
+def _drifted(expected: dict, user_ids: list) -> list:
+    stored = {row["user_id"]: row for row in UserExchangeCounters.objects.filter(user_id__in=user_ids).values(
+        "user_id", *COUNTER_FIELDS)}
+    return [user_id for user_id, values in expected.items()
+            if any(stored.get(user_id, {}).get(field) != value for field, value in values.items())]
+
+
+def get_user_counters(user_id) -> UserExchangeCounters:
+    counters = UserExchangeCounters.objects.filter(user_id=user_id).first()
+    if counters is None:
+        rebuild_user_counters([user_id])
+        counters = UserExchangeCounters.objects.get(user_id=user_id)
+    return counters
+
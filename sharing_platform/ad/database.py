@@ -0,0 +1,33 @@
+""" Настройка соединений с БД при подключении (сигнал connection_created).
+Для SQLite: ожидание блокировки вместо немедленной ошибки "database is locked", отображение файла БД в память,
+кеш страниц и временные таблицы в памяти. Набор PRAGMA дополняется настройкой AD_SQLITE_PRAGMAS.
+Журнал WAL (читатели не блокируются транзакциями записи) включается явно: PRAGMA journal_mode меняет сам файл БД,
+а не только соединение. Вместе с WAL устанавливается synchronous=NORMAL (в режиме WAL данные не теряются при сбое
+приложения); в режиме журнала отката NORMAL не применяется. """
+import typing
+from django.conf import settings
+
+
+DEFAULT_SQLITE_PRAGMAS = {
+    "busy_timeout": 5000,  # мс
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16000,  # Отрицательное значение - объём в КБ
+    "temp_store": "memory",
+}
+WAL_PRAGMAS = {"synchronous": "normal"}  # Дополняют journal_mode=wal, если не заданы явно
+FILE_ONLY_PRAGMAS = ("journal_mode", "mmap_size")  # Для БД в памяти не применяются
+
+
+def sqlite_pragmas(in_memory=False) -> typing.Dict[str, typing.Any]:
+    pragmas = {**DEFAULT_SQLITE_PRAGMAS, **getattr(settings, "AD_SQLITE_PRAGMAS", {})}
+    if str(pragmas.get("journal_mode", "")).lower() == "wal":
+        pragmas = {**WAL_PRAGMAS, **pragmas}
+    return {name: value for name, value in pragmas.items()
+            if value is not None and not (in_memory and name in FILE_ONLY_PRAGMAS)}
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return  # Параметры остальных СУБД задаются в DATABASES (OPTIONS, CONN_MAX_AGE)
+    for name, value in sqlite_pragmas(in_memory=connection.is_in_memory_db()).items():
+        connection.connection.execute(f"PRAGMA {name} = {value}")
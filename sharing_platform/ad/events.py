@@ -0,0 +1,149 @@
+""" События предложений обмена для потока Server-Sent Events (/ad/async/events/).
+ad.exchange публикует событие после фиксации транзакции (offer_created, offer_cancelled, offer_accepted,
+offer_rejected); получатели - владельцы обоих предметов предложения. Бэкенд выбирается настройкой
+AD_EVENT_BACKEND (путь до класса). InProcessEventBackend раздаёт события подписчикам своего процесса и хранит
+последние AD_EVENT_HISTORY_SIZE событий для повтора после переподключения (заголовок Last-Event-ID).
+Поток требует ASGI: под WSGI Django собирает асинхронный ответ целиком, и каждая страница держала бы рабочий поток
+до AD_EVENT_STREAM_MAX_DURATION, не доставив ни одного события (см. is_event_stream_enabled). """
+import time
+import asyncio
+import threading
+import typing
+from collections import deque
+from functools import lru_cache
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class Event(typing.NamedTuple):
+    id: int
+    type: str
+    user_ids: frozenset  # Получатели
+    data: dict
+
+
+class Subscription:
+    """ Очередь событий одного подключения. Доставка - в цикле событий подписчика (из любого потока). """
+    def __init__(self, user_id, limit: int):
+        self.user_id = user_id
+        self.limit = limit
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.lost = False  # Подписчик не успевал забирать события - поток закрывается, клиент переподключается
+
+    def deliver(self, event: Event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # Цикл событий подключения уже закрыт
+            pass
+
+    def _put(self, event: Event):
+        if self.lost:
+            return
+        if self.queue.qsize() >= self.limit:
+            self.lost = True
+            event = None  # Пробуждает ожидающий get()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> typing.Optional[Event]:
+        """ Следующее событие; None - истекло время ожидания или подписка потеряна. """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BaseEventBackend:
+    def publish(self, event_type: str, user_ids: typing.Iterable, data: dict):
+        raise NotImplementedError
+
+    def subscribe(self, user_id) -> Subscription:
+        """ Вызывается в цикле событий подключения. """
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription):
+        raise NotImplementedError
+
+    def replay(self, user_id, last_event_id: int) -> typing.Optional[typing.List[Event]]:
+        """ События пользователя после last_event_id. None - часть событий недоступна (клиенту нужно
+        перезагрузить списки). """
+        raise NotImplementedError
+
+    def current_id(self) -> int:
+        """ Номер последнего опубликованного события - точка отсчёта для нового подключения. """
+        raise NotImplementedError
+
+
+class InProcessEventBackend(BaseEventBackend):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers: typing.Dict[typing.Any, typing.Set[Subscription]] = {}
+        self.history: typing.Deque[Event] = deque(maxlen=getattr(settings, "AD_EVENT_HISTORY_SIZE", 1000))
+        # Номера событий растут и между перезапусками процесса: старый Last-Event-ID не совпадёт с новыми
+        self.last_id = time.time_ns() // 1000
+
+    def publish(self, event_type, user_ids, data):
+        user_ids = frozenset(user_id for user_id in user_ids if user_id is not None)
+        with self.lock:
+            self.last_id += 1
+            event = Event(self.last_id, event_type, user_ids, data)
+            self.history.append(event)
+            subscriptions = [subscription for user_id in user_ids for subscription in self.subscribers.get(user_id, ())]
+        for subscription in subscriptions:
+            subscription.deliver(event)
+        return event
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, getattr(settings, "AD_EVENT_QUEUE_SIZE", 100))
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscribers.pop(subscription.user_id, None)
+
+    def replay(self, user_id, last_event_id):
+        with self.lock:
+            history = list(self.history)
+        if last_event_id > self.last_id or (history and last_event_id < history[0].id - 1) or \
+                (not history and last_event_id != self.last_id):
+            return None
+        return [event for event in history if event.id > last_event_id and user_id in event.user_ids]
+
+    def current_id(self):
+        return self.last_id
+
+
+def is_event_stream_enabled(request) -> bool:
+    """ Подключать ли страницы к потоку событий: настройка AD_EVENT_STREAM_ENABLED, при None - только
+    если запрос обслуживается ASGI-сервером. request - запрос Django или DRF. """
+    enabled = getattr(settings, "AD_EVENT_STREAM_ENABLED", None)
+    if enabled is not None:
+        return enabled
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+@lru_cache(maxsize=None)
+def get_event_backend() -> BaseEventBackend:
+    return import_string(getattr(settings, "AD_EVENT_BACKEND", "ad.events.InProcessEventBackend"))()
+
+
+def publish_proposal_events(event_type: str, rows: typing.Iterable[tuple]):
+    """ Опубликовать событие по каждому предложению после фиксации текущей транзакции.
+    rows - (id предложения, id предмета-отправителя, id предмета-получателя, id их владельцев). """
+    rows = list(rows)
+    if not rows:
+        return
+
+    def publish():
+        backend = get_event_backend()
+        for proposal_id, sender_id, receiver_id, sender_owner_id, receiver_owner_id in rows:
+            backend.publish(event_type, (sender_owner_id, receiver_owner_id),
+                            {"id": str(proposal_id), "sender": str(sender_id), "receiver": str(receiver_id)})
+    transaction.on_commit(publish)
@@ -0,0 +1,323 @@
+""" Изменение предложений обмена и денормализованное состояние ожидающих обменов.
+Счётчики AdItem.pending_out_count / AdItem.pending_in_count позволяют спискам каталога (/my/, /tome/, /request/)
+не строить подзапросы по таблице ExchangeProposal. Функции счётчиков вызываются внутри транзакции,
+изменяющей предложение.
+Создание, принятие, отклонение и отзыв предложения выполняются условными UPDATE/DELETE: условие повторяет
+прочитанное состояние (статус предложения, владелец и версия предмета). Если параллельный запрос успел
+изменить запись, UPDATE не затрагивает строк и операция отменяется исключением ExchangeConflict. """
+import typing
+import datetime
+from collections import Counter
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Count, Subquery, OuterRef, Value, Case, When, IntegerField
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .counters import new_deltas, add_pending_deltas, update_user_counters
+from .events import publish_proposal_events
+from .journal import record_changes, journal_batch, ITEM, PROPOSAL, CREATE, UPDATE
+from .models import AdItem, ExchangeProposal
+from .response_cache import response_cache, item_tag
+
+
+class ExchangeConflict(Exception):
+    """ Предложение или предметы изменены параллельным запросом - операция не выполнена. """
+
+
+class DuplicateProposal(ExchangeConflict):
+    """ Ожидающее предложение для этой пары предметов уже есть. """
+
+
+def register_pending(sender_id, receiver_id):
+    """ Создано новое ожидающее предложение обмена. """
+    AdItem.objects.filter(id=sender_id).update(pending_out_count=F("pending_out_count") + 1)
+    AdItem.objects.filter(id=receiver_id).update(pending_in_count=F("pending_in_count") + 1)
+
+
+def release_pending(pairs: typing.Iterable[tuple]):
+    """ Предложения перестали быть ожидающими (отозваны, приняты, отклонены или удалены).
+     pairs - последовательность (sender_id, receiver_id); None - счётчик этой стороны уже пересчитан. """
+    shift_pending(pairs, -1)
+
+
+def shift_pending(pairs: typing.Iterable[tuple], sign: int):
+    """ Изменить счётчики предметов пар (sender_id, receiver_id) на sign за каждое предложение - одним UPDATE
+    (CASE по предмету). Значения не опускаются ниже нуля. """
+    pairs = list(pairs)
+    changes = {}
+    ids = set()
+    for field_name, counter in (("pending_out_count", Counter(str(pair[0]) for pair in pairs if pair[0] is not None)),
+                                ("pending_in_count", Counter(str(pair[1]) for pair in pairs if pair[1] is not None))):
+        if counter:
+            changes[field_name] = Case(*(When(id=id_, then=Greatest(F(field_name) + sign * value, Value(0),
+                                                                   output_field=IntegerField()))
+                                         for id_, value in counter.items()),
+                                       default=F(field_name), output_field=IntegerField())
+            ids.update(counter)
+    if changes:
+        AdItem.objects.filter(id__in=ids).update(**changes)
+
+
+def _expected_count(field_name):
+    return Coalesce(Subquery(
+        ExchangeProposal.objects.filter(status="p", **{field_name: OuterRef("id")}).order_by().values(
+            field_name).annotate(counter=Count("id")).values("counter")
+    ), Value(0))
+
+
+def find_inconsistent_items():
+    """ Предметы, у которых счётчики разошлись с таблицей ExchangeProposal. """
+    return AdItem.objects.annotate(
+        expected_out=_expected_count("sender_id"),
+        expected_in=_expected_count("receiver_id")
+    ).exclude(pending_out_count=F("expected_out"), pending_in_count=F("expected_in"))
+
+
+def rebuild_pending_state() -> int:
+    """ Пересчитать счётчики всех предметов одним запросом UPDATE. """
+    return AdItem.objects.update(pending_out_count=_expected_count("sender_id"),
+                                 pending_in_count=_expected_count("receiver_id"))
+
+
+def _event_row(proposal: ExchangeProposal) -> tuple:
+    return proposal.id, proposal.sender_id, proposal.receiver_id, proposal.sender.owner_id, proposal.receiver.owner_id
+
+
+def create_proposal(sender: AdItem, receiver: AdItem, user_id, **fields) -> ExchangeProposal:
+    """ Новое ожидающее предложение от владельца user_id предмета sender.
+    Условные UPDATE счётчиков заодно проверяют владельцев предметов на момент записи; повторное
+    ожидающее предложение той же пары отсекает частичный уникальный индекс (ad_proposal_pending_pair_uniq). """
+    try:
+        with transaction.atomic():
+            if not AdItem.objects.filter(id=sender.id, owner_id=user_id).update(
+                    pending_out_count=F("pending_out_count") + 1):
+                raise ExchangeConflict
+            if not AdItem.objects.filter(id=receiver.id, owner_id=receiver.owner_id).exclude(owner_id=user_id).update(
+                    pending_in_count=F("pending_in_count") + 1):
+                raise ExchangeConflict
+            update_user_counters(add_pending_deltas(new_deltas(), [(user_id, receiver.owner_id)], sign=1))
+            proposal = ExchangeProposal.objects.create(sender=sender, receiver=receiver, **fields)
+            publish_proposal_events("offer_created", [(proposal.id, sender.id, receiver.id, user_id, receiver.owner_id)])
+            return proposal
+    except IntegrityError as error:
+        raise DuplicateProposal from error
+
+
+def accept_proposal(proposal: ExchangeProposal) -> int:
+    """ Принять предложение: предметы меняются владельцами, остальные ожидающие предложения с участием
+    обоих предметов отклоняются одним UPDATE. Возвращает кол-во отклонённых предложений.
+    Ожидающих предложений у обоих предметов не остаётся - их счётчики обнуляются тем же UPDATE, что меняет владельца.
+    Этот UPDATE блокирует строки предметов до выборки отклоняемых предложений: create_proposal начинает с UPDATE
+    тех же строк, поэтому новое предложение либо зафиксировано раньше и попадёт в выборку, либо будет ждать
+    фиксации и получит ExchangeConflict (владелец уже сменился). """
+    sender, receiver = proposal.sender, proposal.receiver
+    item_ids = {str(sender.id), str(receiver.id)}
+    old_owners = {str(sender.id): sender.owner_id, str(receiver.id): receiver.owner_id}
+    with transaction.atomic():
+        if not ExchangeProposal.objects.filter(id=proposal.id, status="p").update(
+                status="s", sender_owner_id=sender.owner_id, receiver_owner_id=receiver.owner_id):
+            raise ExchangeConflict
+        for item, new_owner_id in ((sender, receiver.owner_id), (receiver, sender.owner_id)):
+            if not AdItem.objects.filter(id=item.id, owner_id=item.owner_id, version=item.version).update(
+                    owner_id=new_owner_id, version=F("version") + 1, pending_out_count=0, pending_in_count=0):
+                raise ExchangeConflict  # Предмет уже передан другим обменом
+        rows = ExchangeProposal.objects.select_for_update(of=("self",)).filter(
+            Q(sender_id__in=item_ids) | Q(receiver_id__in=item_ids), status="p"
+        ).values_list("id", "sender_id", "receiver_id", "sender__owner_id", "receiver__owner_id")
+        # Владельцы предметов отклоняемых предложений - до смены владельцев
+        rejected = [(id_, sender_id, receiver_id, old_owners.get(str(sender_id), sender_owner_id),
+                     old_owners.get(str(receiver_id), receiver_owner_id))
+                    for id_, sender_id, receiver_id, sender_owner_id, receiver_owner_id in rows]
+        if rejected:
+            ExchangeProposal.objects.filter(id__in=[row[0] for row in rejected]).update(status="r")
+            # Счётчики второй стороны отклонённых предложений
+            release_pending([tuple(None if str(id_) in item_ids else id_ for id_ in row[1:3]) for row in rejected])
+        record_changes([(PROPOSAL, UPDATE, proposal.id), *((PROPOSAL, UPDATE, row[0]) for row in rejected),
+                        (ITEM, UPDATE, sender.id), (ITEM, UPDATE, receiver.id)])
+        deltas = add_pending_deltas(new_deltas(), [(sender.owner_id, receiver.owner_id),
+                                                   *(row[3:] for row in rejected)])
+        for user_id in (sender.owner_id, receiver.owner_id):
+            deltas[user_id]["completed_count"] += 1
+        update_user_counters(deltas)
+        publish_proposal_events("offer_accepted", [(proposal.id, sender.id, receiver.id, sender.owner_id,
+                                                    receiver.owner_id)])
+        publish_proposal_events("offer_rejected", rejected)
+        response_cache.invalidate([*(item_tag(id_) for row in rejected for id_ in row[1:3]),
+                                   *(item_tag(id_) for id_ in item_ids)])
+    proposal.status = "s"
+    sender.owner, receiver.owner = receiver.owner, sender.owner
+    for item in (sender, receiver):
+        item.version, item.pending_out_count, item.pending_in_count = item.version + 1, 0, 0
+    return len(rejected)
+
+
+def reject_proposal(proposal: ExchangeProposal):
+    with transaction.atomic():
+        if not ExchangeProposal.objects.filter(id=proposal.id, status="p").update(status="r"):
+            raise ExchangeConflict
+        release_pending([(proposal.sender_id, proposal.receiver_id)])
+        record_changes([(PROPOSAL, UPDATE, proposal.id)])
+        update_user_counters(add_pending_deltas(new_deltas(), [(proposal.sender.owner_id, proposal.receiver.owner_id)]))
+        publish_proposal_events("offer_rejected", [_event_row(proposal)])
+        response_cache.invalidate([item_tag(proposal.sender_id), item_tag(proposal.receiver_id)])
+    proposal.status = "r"
+
+
+def cancel_proposal(proposal: ExchangeProposal):
+    """ Отозвать (удалить) ожидающее предложение. """
+    with transaction.atomic():
+        deleted, _ = ExchangeProposal.objects.filter(id=proposal.id, status="p").delete()
+        if not deleted:
+            raise ExchangeConflict
+        release_pending([(proposal.sender_id, proposal.receiver_id)])
+        update_user_counters(add_pending_deltas(new_deltas(), [(proposal.sender.owner_id, proposal.receiver.owner_id)]))
+        publish_proposal_events("offer_cancelled", [_event_row(proposal)])
+
+
+def expired_proposals(max_age: datetime.timedelta):
+    return ExchangeProposal.objects.filter(status="p", created_at__lt=timezone.now() - max_age)
+
+
+def expire_proposals(max_age: datetime.timedelta, batch_size: typing.Optional[int] = None) -> int:
+    """ Отклонить ожидающие предложения старше max_age. Каждая пачка (batch_size, по умолчанию
+    AD_PROPOSAL_EXPIRE_BATCH_SIZE) - отдельная короткая транзакция из одного UPDATE статуса и UPDATE счётчиков.
+    Возвращает кол-во отклонённых предложений. """
+    batch_size = batch_size or getattr(settings, "AD_PROPOSAL_EXPIRE_BATCH_SIZE", 1000)
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(expired_proposals(max_age).select_for_update(of=("self",)).order_by(
+                "created_at", "id").values_list("id", "sender_id", "receiver_id", "sender__owner_id",
+                                                "receiver__owner_id")[:batch_size])
+            if not rows:
+                return total
+            ExchangeProposal.objects.filter(id__in=[row[0] for row in rows]).update(status="r")
+            release_pending([row[1:3] for row in rows])
+            record_changes((PROPOSAL, UPDATE, row[0]) for row in rows)
+            update_user_counters(add_pending_deltas(new_deltas(), [row[3:] for row in rows]))
+            publish_proposal_events("offer_rejected", rows)
+            response_cache.invalidate(item_tag(id_) for row in rows for id_ in row[1:3])
+        total += len(rows)
+
+
+# Пакетные операции (представления offer/bulk/, offer/bulk/cancel/, exchange/bulk/). Пакет выполняется одной
+# транзакцией: проверка владельцев и статусов - несколькими запросами на весь пакет, результат - по каждому элементу.
+# Элемент, не прошедший проверку, не отменяет остальные.
+
+def create_proposals(pairs: typing.Sequence[tuple], user_id) -> typing.List[tuple]:
+    """ Предложения пар (id предмета пользователя user_id, id предмета другого пользователя).
+    Возвращает (результат, id предложения) по каждой паре: created, duplicate, forbidden, invalid, not_found. """
+    results: typing.List[tuple] = [None] * len(pairs)
+    pairs = [(str(sender_id), str(receiver_id)) for sender_id, receiver_id in pairs]
+    with transaction.atomic():
+        owners = dict(AdItem.objects.select_for_update().filter(
+            id__in={id_ for pair in pairs for id_ in pair}).values_list("id", "owner_id"))
+        owners = {str(id_): owner_id for id_, owner_id in owners.items()}
+        existing = set(ExchangeProposal.objects.filter(
+            status="p", sender_id__in={pair[0] for pair in pairs}, receiver_id__in={pair[1] for pair in pairs}
+        ).values_list("sender_id", "receiver_id"))
+        existing = {(str(sender_id), str(receiver_id)) for sender_id, receiver_id in existing}
+        new = []
+        for index, pair in enumerate(pairs):
+            sender_owner_id, receiver_owner_id = owners.get(pair[0]), owners.get(pair[1])
+            if sender_owner_id is None or receiver_owner_id is None:
+                results[index] = ("not_found", None)
+            elif sender_owner_id != user_id:
+                results[index] = ("forbidden", None)
+            elif receiver_owner_id == user_id:
+                results[index] = ("invalid", None)  # Обмен с самим собой
+            elif pair in existing:
+                results[index] = ("duplicate", None)
+            else:
+                existing.add(pair)
+                new.append((index, ExchangeProposal(sender_id=pair[0], receiver_id=pair[1], status="p"),
+                            receiver_owner_id))
+        if not new:
+            return results
+        # Параллельно созданное предложение той же пары пропускается уникальным индексом
+        ExchangeProposal.objects.bulk_create([proposal for _, proposal, _ in new], ignore_conflicts=True)
+        created = set(ExchangeProposal.objects.filter(id__in=[proposal.id for _, proposal, _ in new]).values_list(
+            "id", flat=True))
+        rows = []
+        for index, proposal, receiver_owner_id in new:
+            if proposal.id in created:
+                results[index] = ("created", proposal.id)
+                rows.append((proposal.id, proposal.sender_id, proposal.receiver_id, user_id, receiver_owner_id))
+            else:
+                results[index] = ("duplicate", None)
+        shift_pending([row[1:3] for row in rows], 1)
+        record_changes((PROPOSAL, CREATE, row[0]) for row in rows)  # bulk_create не отправляет сигналы post_save
+        update_user_counters(add_pending_deltas(new_deltas(), [row[3:] for row in rows], sign=1))
+        publish_proposal_events("offer_created", rows)
+        response_cache.invalidate(item_tag(id_) for row in rows for id_ in row[1:3])
+    return results
+
+
+def _pending_rows(ids) -> typing.Dict[str, tuple]:
+    """ Ожидающие предложения: id -> (id, sender_id, receiver_id, id владельца отправителя, id владельца получателя). """
+    rows = ExchangeProposal.objects.select_for_update(of=("self",)).filter(id__in=set(ids), status="p").values_list(
+        "id", "sender_id", "receiver_id", "sender__owner_id", "receiver__owner_id")
+    return {str(row[0]): row for row in rows}
+
+
+def _check_party(ids, rows: dict, user_id, owner_index: int) -> typing.Tuple[list, list]:
+    """ Результат проверки каждого id (None - проверка пройдена) и строки прошедших проверку предложений. """
+    results, allowed, seen = [], [], set()
+    for id_ in map(str, ids):
+        row = rows.get(id_)
+        if row is None:
+            results.append("not_found")
+        elif row[owner_index] != user_id:
+            results.append("forbidden")
+        elif id_ in seen:
+            results.append("duplicate")
+        else:
+            seen.add(id_)
+            allowed.append(row)
+            results.append(None)
+    return results, allowed
+
+
+def cancel_proposals(ids: typing.Sequence, user_id) -> typing.List[str]:
+    """ Отозвать ожидающие предложения от предметов пользователя user_id.
+    Результат по каждому id: cancelled, duplicate, forbidden, not_found. """
+    with transaction.atomic(), journal_batch():  # Записи журнала из обработчиков post_delete - одним INSERT
+        results, rows = _check_party(ids, _pending_rows(ids), user_id, owner_index=3)
+        if rows:
+            ExchangeProposal.objects.filter(id__in=[row[0] for row in rows]).delete()
+            release_pending([row[1:3] for row in rows])
+            update_user_counters(add_pending_deltas(new_deltas(), [row[3:] for row in rows]))
+            publish_proposal_events("offer_cancelled", rows)
+    return [result or "cancelled" for result in results]
+
+
+def decide_proposals(decisions: typing.Sequence[tuple], user_id) -> typing.List[str]:
+    """ Ответы получателя user_id: последовательность (id предложения, "accept" | "reject").
+    Отклонения выполняются вместе, принятия - по очереди (каждое отклоняет остальные предложения своих предметов;
+    предложение, отклонённое так раньше в пакете, получает результат conflict).
+    Результат по каждому элементу: accepted, rejected, conflict, duplicate, forbidden, not_found. """
+    ids = [id_ for id_, _ in decisions]
+    with transaction.atomic(), journal_batch():
+        rows = _pending_rows(ids)
+        results, _ = _check_party(ids, rows, user_id, owner_index=4)
+        rejected = [str(id_) for (id_, type_), result in zip(decisions, results) if result is None and type_ == "reject"]
+        accepted = [str(id_) for (id_, type_), result in zip(decisions, results) if result is None and type_ == "accept"]
+        if rejected:
+            rows = [rows[id_] for id_ in rejected]
+            ExchangeProposal.objects.filter(id__in=[row[0] for row in rows]).update(status="r")
+            release_pending([row[1:3] for row in rows])
+            record_changes((PROPOSAL, UPDATE, row[0]) for row in rows)
+            update_user_counters(add_pending_deltas(new_deltas(), [row[3:] for row in rows]))
+            publish_proposal_events("offer_rejected", rows)
+            response_cache.invalidate(item_tag(id_) for row in rows for id_ in row[1:3])
+        outcome = dict.fromkeys(rejected, "rejected")
+        proposals = {str(proposal.id): proposal for proposal in ExchangeProposal.objects.select_related(
+            "sender", "receiver").filter(id__in=accepted)} if accepted else {}
+        for id_ in accepted:
+            try:
+                accept_proposal(proposals[id_])  # Собственная точка сохранения: при конфликте откатывается только она
+                outcome[id_] = "accepted"
+            except ExchangeConflict:
+                outcome[id_] = "conflict"
+    return [result or outcome[str(id_)] for id_, result in zip(ids, results)]
+
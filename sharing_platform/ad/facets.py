@@ -0,0 +1,93 @@
+""" Фасеты каталога: кол-во предметов по категориям и состояниям для формы фильтра.
+Общий каталог (/catalog/ без ключевых слов) читает их из таблицы CatalogFacet (строка на пару категория-состояние),
+которая изменяется приращениями в тех же транзакциях, что и предметы (ad.signals, загрузка пачкой). Для поиска по
+ключевым словам и списков пользователя кол-во считается одним запросом с группировкой по уже суженному набору.
+Фасет каждого измерения учитывает фильтр другого измерения, но не свой: выбранная категория не скрывает остальные. """
+import typing
+from collections import Counter
+from django.db.models import Case, When, F, Q, Value, Count, IntegerField, QuerySet
+from django.db.models.functions import Greatest
+from .models import AdItem, CatalogFacet, ITEM_CONDITION
+
+
+FacetKey = typing.Tuple[int, str]  # (id категории, состояние)
+
+
+def update_facet_counts(deltas: typing.Mapping[FacetKey, int]):
+    """ Применить приращения одним UPDATE (CASE по паре). Отсутствующие строки создаются пересчётом. """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    pairs = Q()
+    for category_id, status in deltas:
+        pairs |= Q(category_id=category_id, status=status)
+    updated = CatalogFacet.objects.filter(pairs).update(items_count=Case(
+        *(When(category_id=category_id, status=status,
+               then=Greatest(F("items_count") + delta, Value(0), output_field=IntegerField()))
+          for (category_id, status), delta in deltas.items()),
+        default=F("items_count"), output_field=IntegerField()))
+    if updated < len(deltas):
+        rebuild_facet_counts({category_id for category_id, _ in deltas})
+
+
+def compute_facet_counts(category_ids: typing.Optional[typing.Iterable[int]] = None) -> typing.Dict[FacetKey, int]:
+    queryset = AdItem.objects.all() if category_ids is None else AdItem.objects.filter(category_id__in=category_ids)
+    return {(row["category_id"], row["status"]): row["items_count"]
+            for row in queryset.order_by().values("category_id", "status").annotate(items_count=Count("id"))}
+
+
+def _drifted(category_ids) -> typing.Tuple[typing.Dict[FacetKey, int], typing.List[FacetKey]]:
+    expected = compute_facet_counts(category_ids)
+    stored = CatalogFacet.objects.all() if category_ids is None else \
+        CatalogFacet.objects.filter(category_id__in=category_ids)
+    stored = {(row[0], row[1]): row[2] for row in stored.values_list("category_id", "status", "items_count")}
+    for key in stored:
+        expected.setdefault(key, 0)
+    return expected, [key for key, value in expected.items() if stored.get(key) != value]
+
+
+def find_drifted_facets() -> typing.List[FacetKey]:
+    """ Пары, у которых сохранённое кол-во расходится с таблицей AdItem (без записи). """
+    return _drifted(None)[1]
+
+
+def rebuild_facet_counts(category_ids: typing.Optional[typing.Iterable[int]] = None) -> typing.List[FacetKey]:
+    """ Пересчитать фасеты категорий (по умолчанию всех) и записать расхождения (INSERT ... ON CONFLICT UPDATE).
+    Возвращает исправленные пары. """
+    expected, drifted = _drifted(None if category_ids is None else list(category_ids))
+    if drifted:
+        CatalogFacet.objects.bulk_create(
+            [CatalogFacet(category_id=category_id, status=status, items_count=expected[(category_id, status)])
+             for category_id, status in drifted],
+            update_conflicts=True, unique_fields=("category", "status"), update_fields=("items_count",))
+    return drifted
+
+
+def summarize(rows: typing.Iterable[dict], category_id: typing.Optional[int] = None,
+              status: typing.Optional[str] = None) -> dict:
+    """ rows - словари с ключами category_id, category__name, status, items_count. """
+    categories: typing.Counter[tuple] = Counter()
+    statuses: typing.Counter[str] = Counter()
+    for row in rows:
+        if status is None or row["status"] == status:
+            categories[(row["category_id"], row["category__name"])] += row["items_count"]
+        if category_id is None or row["category_id"] == category_id:
+            statuses[row["status"]] += row["items_count"]
+    return {
+        "category": [{"id": id_, "name": name, "count": count}
+                     for (id_, name), count in sorted(categories.items(), key=lambda item: item[0][1]) if count],
+        "status": [{"value": value, "count": statuses[value]} for value, _ in ITEM_CONDITION]
+    }
+
+
+def catalog_facets(category_id: typing.Optional[int] = None, status: typing.Optional[str] = None) -> dict:
+    """ Фасеты общего каталога из таблицы CatalogFacet - один запрос, не зависящий от кол-ва предметов. """
+    return summarize(CatalogFacet.objects.filter(items_count__gt=0).values(
+        "category_id", "category__name", "status", "items_count"), category_id, status)
+
+
+def queryset_facets(queryset: QuerySet, category_id: typing.Optional[int] = None,
+                    status: typing.Optional[str] = None) -> dict:
+    """ Фасеты набора предметов queryset (без фильтров категории и состояния) - запрос с группировкой. """
+    return summarize(queryset.order_by().values("category_id", "category__name", "status").annotate(
+        items_count=Count("id")), category_id, status)
@@ -0,0 +1,145 @@
+""" Быстрый путь чтения для JSON-списков: строки выбираются через QuerySet.values(), поля сериализатора
+один раз сводятся в таблицу (ключ результата, ключ строки, функция преобразования), экземпляры моделей
+и объекты полей на каждую строку не создаются. Результат совпадает с выводом исходного сериализатора. """
+import typing
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.templatetags.static import static
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .models import AdItem
+from .thumbnails import thumbnail_url, PLACEHOLDER_IMAGE
+
+try:
+    import orjson  # requirements.txt; без него FastJSONRenderer работает как обычный JSONRenderer (json)
+except ImportError:
+    orjson = None
+
+
+class CompiledField(typing.NamedTuple):
+    name: str  # Ключ в результате
+    key: typing.Optional[str]  # Ключ строки values(); None - значение вычисляется по всей строке (method)
+    convert: typing.Optional[typing.Callable]  # None - значение без преобразования
+    default: typing.Any = None
+    method: typing.Optional[typing.Callable] = None  # method(row, context)
+
+
+class ValuesSerializer:
+    """ Таблица полей, собранная по сериализатору DRF. Поля, которые нельзя вычислить по значениям строки
+    (SerializerMethodField и т.п.), задаются в methods: имя -> (ключи строки, функция(row, context)). """
+    def __init__(self, serializer_class, methods: typing.Optional[dict] = None):
+        self.serializer_class = serializer_class
+        self.methods = methods or {}
+        self._fields: typing.Optional[typing.List[CompiledField]] = None
+
+    @property
+    def fields(self) -> typing.List[CompiledField]:
+        if self._fields is None:
+            self._fields = [self._compile(name, field) for name, field in self.serializer_class().fields.items()
+                            if not field.write_only]
+        return self._fields
+
+    def _compile(self, name, field) -> CompiledField:
+        default = None if field.default is serializers.empty else field.default
+        if name in self.methods:
+            return CompiledField(name, None, None, default, self.methods[name][1])
+        if isinstance(field, serializers.SerializerMethodField) or field.source == "*":
+            raise ImproperlyConfigured(f"Поле {name} нужно задать в methods")
+        key = "__".join(field.source_attrs)
+        if isinstance(field, serializers.RelatedField):
+            return CompiledField(name, key, None, default)  # values() возвращает первичный ключ связанной записи
+        if isinstance(field, (serializers.CharField, serializers.BooleanField, serializers.IntegerField)) and \
+                not isinstance(field, (serializers.EmailField, serializers.RegexField)):
+            return CompiledField(name, key, _simple_converter(field), default)
+        return CompiledField(name, key, field.to_representation, default)
+
+    def value_keys(self, queryset) -> typing.List[str]:
+        """ Ключи для queryset.values(): поля модели и аннотации; отсутствующие аннотации заменяются default. """
+        keys = [key for field in self.fields for key in self._row_keys(field) if _is_available(queryset, key)]
+        return list(dict.fromkeys(keys))
+
+    def _row_keys(self, field: CompiledField) -> tuple:
+        if field.method is not None:
+            return self.methods[field.name][0]
+        return field.key,
+
+    def values(self, queryset, *extra_keys):
+        return queryset.values(*dict.fromkeys([*self.value_keys(queryset), *extra_keys]))
+
+    def serialize(self, rows: typing.Iterable[dict], context: typing.Optional[dict] = None) -> typing.List[dict]:
+        context = context or {}
+        fields = self.fields
+        result = []
+        for row in rows:
+            item = {}
+            for field in fields:
+                if field.method is not None:
+                    item[field.name] = field.method(row, context)
+                    continue
+                value = row.get(field.key, field.default)
+                item[field.name] = value if value is None or field.convert is None else field.convert(value)
+            result.append(item)
+        return result
+
+
+def _simple_converter(field) -> typing.Optional[typing.Callable]:
+    """ Для простых полей to_representation сводится к приведению типа. """
+    if isinstance(field, serializers.BooleanField):
+        return bool
+    if isinstance(field, serializers.IntegerField):
+        return int
+    return str
+
+
+def _is_available(queryset, key: str) -> bool:
+    if key in queryset.query.annotations:
+        return True
+    try:
+        queryset.model._meta.get_field(key.split("__")[0])
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def image_url(row: dict, context: dict) -> typing.Optional[str]:
+    """ Как serializers.ImageField: абсолютный URL файла (при наличии request в контексте). """
+    name = row["image"]
+    if not name:
+        return None
+    url = AdItem._meta.get_field("image").storage.url(name)
+    request = context.get("request", None)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def list_thumb_url(row: dict, context: dict) -> str:
+    """ Миниатюра по имени исходного файла: достаточно несохраняемого экземпляра с одним полем image. """
+    if not row["image"]:
+        return static(PLACEHOLDER_IMAGE)
+    return thumbnail_url(AdItem(id=row["id"], image=row["image"]), "list_thumb")
+
+
+IMAGE_FIELDS = {"image": (("image",), image_url), "list_thumb": (("id", "image"), list_thumb_url)}
+
+
+class FastJSONRenderer(JSONRenderer):
+    """ JSONRenderer, кодирующий через orjson. Ответ кодируется один раз.
+    Если orjson не установлен, используется стандартный кодировщик JSONRenderer; активный - в encoder. """
+    encoder = "orjson" if orjson is not None else "json"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=JSONEncoder().default)
+
+
+class ValuesListMixin:
+    """ JSON-вариант списка через values_serializer: .values() + ValuesSerializer.serialize. """
+    values_serializer: typing.Optional[ValuesSerializer] = None
+
+    def list(self, request, *args, **kwargs):
+        if self.values_serializer is None or not self._is_ajax_request(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = [field.lstrip("-") for field in self.paginator.get_ordering(queryset, self)]
+        page = self.paginate_queryset(self.values_serializer.values(queryset, *ordering))
+        return self.get_paginated_response(self.values_serializer.serialize(page, self.get_serializer_context()))
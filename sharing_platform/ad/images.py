@@ -0,0 +1,97 @@
+""" Приём изображений предметов: удаление метаданных (EXIF и пр.), ограничение размеров, перекодирование
+и сохранение под именем-хешем содержимого. Одинаковые изображения разных предметов хранятся одним файлом. """
+import io
+import typing
+import hashlib
+from PIL import Image, ImageOps, UnidentifiedImageError
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db.models.fields.files import ImageField, ImageFieldFile
+from django.utils.translation import gettext
+
+
+ALPHA_FORMATS = ("PNG", "WEBP")  # Форматы AD_IMAGE_FORMAT с прозрачностью; для остальных (JPEG) фон заливается белым
+
+
+def get_options() -> dict:
+    return {
+        "max_size": tuple(getattr(settings, "AD_IMAGE_MAX_SIZE", (1600, 1600))),
+        "format": getattr(settings, "AD_IMAGE_FORMAT", "WEBP"),
+        "quality": getattr(settings, "AD_IMAGE_QUALITY", 80)
+    }
+
+
+class IngestedContent(ContentFile):
+    """ Результат ingest_image: повторно не перекодируется. """
+
+
+def ingest_image(file) -> IngestedContent:
+    """ Перекодированное изображение с именем <sha256>.<формат>.
+    Метаданные не переносятся: новый файл собирается только из пикселей исходника. """
+    options = get_options()
+    try:
+        file.seek(0)
+        with Image.open(file) as source:
+            image = ImageOps.exif_transpose(source)  # Ориентация из EXIF применяется до удаления метаданных
+            image.thumbnail(options["max_size"])
+            image = convert_mode(image, options["format"])
+        buffer = io.BytesIO()
+        image.save(buffer, format=options["format"], quality=options["quality"])
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        raise ValidationError(gettext("invalid_image"))
+    content = buffer.getvalue()
+    return IngestedContent(content, name=f"{hashlib.sha256(content).hexdigest()}.{options['format'].lower()}")
+
+
+def convert_mode(image: Image.Image, image_format: str) -> Image.Image:
+    """ RGB или RGBA в зависимости от того, поддерживает ли целевой формат прозрачность. """
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    if not has_alpha:
+        return image.convert("RGB")
+    image = image.convert("RGBA")
+    if image_format.upper() in ALPHA_FORMATS:
+        return image
+    background = Image.new("RGB", image.size, "white")
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def content_addressed_path(instance, filename) -> str:
+    """ images/ab/ab12...webp - первые символы хеша разносят файлы по подкаталогам. """
+    return f"images/{filename[:2]}/{filename}"
+
+
+class IngestedImageFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        if not isinstance(content, IngestedContent):
+            content = ingest_image(content)
+        name = self.field.generate_filename(self.instance, content.name)
+        if self.storage.exists(name):
+            self.name = name  # Такое изображение уже загружено - используется существующий файл
+        else:
+            self.name = self.storage.save(name, content, max_length=self.field.max_length)
+            # Новый файл: если запись не попадёт в БД, его удаляет discard_written_images
+            self.instance.__dict__.setdefault("_written_images", []).append((self.storage, self.name))
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+        if save:
+            self.instance.save()
+    save.alters_data = True
+
+
+def discard_written_images(instances: typing.Iterable):
+    """ Удалить файлы, записанные для экземпляров, которые не удалось сохранить (откат транзакции). """
+    for instance in instances:
+        for storage, name in instance.__dict__.pop("_written_images", ()):
+            storage.delete(name)
+
+
+class IngestedImageField(ImageField):
+    """ ImageField, сохраняющий изображение через ingest_image.
+    Файл может принадлежать нескольким записям, поэтому удалять его вместе с записью нельзя. """
+    attr_class = IngestedImageFieldFile
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("upload_to", content_addressed_path)
+        super().__init__(*args, **kwargs)
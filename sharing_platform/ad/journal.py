@@ -0,0 +1,111 @@
+""" Журнал изменений предметов и предложений обмена (ChangeJournal) и чтение его для ленты /api/changes/.
+Записи добавляются в той же транзакции, что и изменение: сохранение и удаление - обработчиками сигналов (ad.signals),
+изменения через QuerySet.update и bulk_create - явным вызовом record_changes (ad.exchange, загрузка пачкой).
+Внутри блока journal_batch() записи накапливаются и добавляются одним INSERT при выходе из блока.
+Изменения денормализованных счётчиков (pending_*_count) в журнал не попадают - они следуют из записей предложений.
+Потребитель читает записи с номером больше since. Записывающие в журнал транзакции выполняются по очереди: от
+добавления записи до фиксации транзакция держит блокировку журнала (SQLite допускает одну пишущую транзакцию
+на всю БД, для PostgreSQL - pg_advisory_xact_lock). Поэтому номера фиксируются в порядке возрастания: если видна
+запись с номером N, все записи с меньшими номерами уже зафиксированы или отменены, и лента не пропустит
+запись, зафиксированную позже. """
+import datetime
+import typing
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import connections, router, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from .models import AdItem, ExchangeProposal, ChangeJournal, JOURNAL_MODELS, JOURNAL_ACTIONS
+
+
+ITEM, PROPOSAL = "i", "p"
+CREATE, UPDATE, DELETE = "c", "u", "d"
+MODEL_NAMES = dict(JOURNAL_MODELS)
+ACTION_NAMES = dict(JOURNAL_ACTIONS)
+# Поля текущего состояния записи в ленте
+FEED_FIELDS = {
+    ITEM: (AdItem, ("id", "name", "description", "image", "category_id", "owner_id", "status", "created_at",
+                    "version")),
+    PROPOSAL: (ExchangeProposal, ("id", "status", "sender_id", "receiver_id", "created_at")),
+}
+
+Change = typing.Tuple[str, str, typing.Any]  # (модель, действие, id записи)
+JOURNAL_LOCK_KEY = 0x61646A6E  # Ключ pg_advisory_xact_lock журнала ("adjn")
+
+_batch: ContextVar[typing.Optional[typing.List[Change]]] = ContextVar("ad_journal_batch", default=None)
+
+
+def record_changes(changes: typing.Iterable[Change]):
+    changes = list(changes)
+    batch = _batch.get()
+    if batch is not None:
+        batch.extend(changes)
+    elif changes:
+        using = router.db_for_write(ChangeJournal)
+        with transaction.atomic(using=using, savepoint=False):
+            lock_journal(using)
+            ChangeJournal.objects.using(using).bulk_create([ChangeJournal(model=model, action=action, object_id=id_)
+                                                            for model, action, id_ in changes])
+
+
+def lock_journal(using: str):
+    """ Блокировка журнала до конца текущей транзакции: транзакции, получившие номера позже, фиксируются позже. """
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [JOURNAL_LOCK_KEY])
+    # SQLite: блокировку записи всей БД транзакция держит с первой записи до фиксации
+
+
+@contextmanager
+def journal_batch():
+    """ Записи журнала внутри блока (в т.ч. из обработчиков сигналов) добавляются одним INSERT в конце блока.
+    Блок должен выполняться внутри транзакции изменения. """
+    if _batch.get() is not None:  # Вложенный блок - записи попадут во внешний
+        yield
+        return
+    token = _batch.set([])
+    try:
+        yield
+        changes = _batch.get()
+    finally:
+        _batch.reset(token)
+    record_changes(changes)
+
+
+def last_seq() -> int:
+    return ChangeJournal.objects.aggregate(last=Max("seq"))["last"] or 0  # MAX по ключу - без просмотра таблицы
+
+
+def is_pruned(since: int) -> bool:
+    """ Записи после since уже удалены по сроку хранения - потребителю нужна полная синхронизация. """
+    first = ChangeJournal.objects.aggregate(first=Min("seq"))["first"]
+    return first is not None and since + 1 < first
+
+
+def read_changes(since: int, limit: int, batch_size: int) -> typing.Iterator[dict]:
+    """ Записи журнала после since (не более limit) с текущим состоянием изменённых записей (None - запись удалена).
+    Журнал читается пачками по batch_size, состояние записей пачки - одним запросом на модель. """
+    while limit > 0:
+        size = min(batch_size, limit)
+        entries = list(ChangeJournal.objects.filter(seq__gt=since).order_by("seq").values_list(
+            "seq", "model", "object_id", "action")[:size])
+        if not entries:
+            return
+        states = {}
+        for model, (model_class, fields) in FEED_FIELDS.items():
+            ids = {object_id for _, entry_model, object_id, _ in entries if entry_model == model}
+            if ids:
+                states.update({(model, row["id"]): row for row in model_class.objects.filter(id__in=ids).values(*fields)})
+        for seq, model, object_id, action in entries:
+            yield {"seq": seq, "model": MODEL_NAMES[model], "id": object_id, "action": ACTION_NAMES[action],
+                   "data": states.get((model, object_id))}
+        since = entries[-1][0]
+        limit -= len(entries)
+        if len(entries) < size:
+            return
+
+
+def prune_journal(max_age: datetime.timedelta) -> int:
+    deleted, _ = ChangeJournal.objects.filter(created_at__lt=timezone.now() - max_age).delete()
+    return deleted
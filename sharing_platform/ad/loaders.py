@@ -0,0 +1,54 @@
+""" Загрузка предметов и предложений обмена в рамках одного HTTP-запроса.
+Каждая запись читается из БД не более одного раза, владелец и категория подтягиваются тем же запросом (JOIN). """
+import typing
+from django.http import HttpRequest
+from .models import AdItem, ExchangeProposal
+
+
+class ObjectLoader:
+    """ Карта идентичности (identity map): ключ - строковое представление первичного ключа.
+    Отсутствующие в БД записи тоже запоминаются (None), чтобы не запрашивать их повторно. """
+    ad_item_related = ("owner", "category")
+    proposal_related = ("sender__owner", "sender__category", "receiver__owner", "receiver__category")
+
+    def __init__(self):
+        self._ad_items: typing.Dict[str, typing.Optional[AdItem]] = {}
+        self._proposals: typing.Dict[str, typing.Optional[ExchangeProposal]] = {}
+
+    def ad_item(self, id_) -> typing.Optional[AdItem]:
+        return self.ad_items(id_)[0]
+
+    def ad_items(self, *ids) -> typing.List[typing.Optional[AdItem]]:
+        """ Вернуть предметы в порядке ids. Недостающие в карте загружаются одним запросом. """
+        keys = [str(id_) for id_ in ids]
+        missing = [key for key in dict.fromkeys(keys) if key not in self._ad_items]
+        if missing:
+            loaded = {str(item.pk): item for item in
+                      AdItem.objects.select_related(*self.ad_item_related).filter(id__in=missing)}
+            for key in missing:
+                self._ad_items[key] = loaded.get(key, None)
+        return [self._ad_items[key] for key in keys]
+
+    def proposal(self, id_, status: typing.Optional[str] = None) -> typing.Optional[ExchangeProposal]:
+        """ Предложение обмена вместе с обоими предметами и их владельцами.
+        status - дополнительное условие; предложение с другим статусом считается отсутствующим. """
+        key = str(id_)
+        if key not in self._proposals:
+            proposal = ExchangeProposal.objects.select_related(*self.proposal_related).filter(id=id_).first()
+            self._proposals[key] = proposal
+            if proposal is not None:
+                self._ad_items.setdefault(str(proposal.sender.pk), proposal.sender)
+                self._ad_items.setdefault(str(proposal.receiver.pk), proposal.receiver)
+        proposal = self._proposals[key]
+        if proposal is not None and status is not None and not proposal.status == status:
+            return None
+        return proposal
+
+
+def get_loader(request) -> ObjectLoader:
+    """ Загрузчик, привязанный к текущему запросу (для rest_framework.request.Request - к исходному HttpRequest). """
+    http_request: HttpRequest = getattr(request, "_request", request)
+    loader = getattr(http_request, "ad_object_loader", None)
+    if loader is None:
+        loader = http_request.ad_object_loader = ObjectLoader()
+    return loader
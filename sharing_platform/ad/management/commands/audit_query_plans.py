@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from ad.benchmark import benchmark_database, seed_dataset
+from .benchmark_endpoints import Scenarios, route_names
+
+
+EXPLAINED_STATEMENTS = ("SELECT", "UPDATE", "DELETE")
+ALLOWED_SCANS = (
+    "ad_articlecategory",  # Справочник категорий: читается целиком (с ограничением кол-ва) и кешируется
+    "ad_catalogfacet",  # Сводная таблица фасетов: строка на пару (категория, состояние), читается целиком
+)
+
+
+class Command(BaseCommand):
+    help = "Выполнить запросы всех маршрутов ad/ и api/ на синтетическом наборе данных и проверить их планы " \
+           "(EXPLAIN QUERY PLAN): полный просмотр таблицы без индекса считается ошибкой"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=2000)
+        parser.add_argument("--proposals", type=int, default=2000)
+        parser.add_argument("--route", action="append", default=[], help="Проверить только указанные маршруты")
+        parser.add_argument("--verbose-plans", action="store_true", help="Вывести планы всех запросов")
+
+    def handle(self, *args, **options):
+        if not connection.vendor == "sqlite":
+            raise CommandError("Разбор планов реализован для SQLite")
+        with benchmark_database(verbosity=options["verbosity"]):
+            dataset = seed_dataset(items=options["items"], proposals=options["proposals"])
+            connection.cursor().execute("ANALYZE")  # Статистика для планировщика, как в рабочей БД
+            problems = self.audit(dataset, set(options["route"]), options["verbose_plans"])
+        if problems:
+            raise CommandError("Полный просмотр таблиц:\n" + "\n".join(problems))
+        self.stdout.write(self.style.SUCCESS("Полных просмотров таблиц не обнаружено"))
+
+    def audit(self, dataset, only, verbose) -> list:
+        scenarios = Scenarios.create(dataset, iterations=1)
+        problems, seen = [], set()
+        for name in route_names():
+            if only and name not in only:
+                continue
+            for mode in ("json", "html"):
+                queries = []
+                with connection.execute_wrapper(self.collect(queries)):
+                    scenarios.get(name, mode)()
+                for sql, params in queries:
+                    if not sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS) or sql in seen:
+                        continue
+                    seen.add(sql)
+                    plan = self.explain(sql, params)
+                    if verbose:
+                        self.stdout.write(f"{name}[{mode}]: {sql}\n    " + "\n    ".join(plan))
+                    problems.extend(f"{name}[{mode}]: {line}\n    {sql}" for line in plan if self.is_full_scan(line))
+        return problems
+
+    @staticmethod
+    def collect(queries: list):
+        """ Запросы запоминаются с параметрами: план строится так же, как при выполнении (с привязкой значений). """
+        def wrapper(execute, sql, params, many, context):
+            if not many:
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+        return wrapper
+
+    @staticmethod
+    def explain(sql, params) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    @staticmethod
+    def is_full_scan(detail: str) -> bool:
+        """ "SCAN t" / "SCAN TABLE t" без индекса (SQLite 3.36+ и более ранние версии).
+        Виртуальная таблица просматривается целиком, если модуль не принял ни одного условия:
+        "SCAN t VIRTUAL TABLE INDEX 0:" (пустая строка индекса после двоеточия). """
+        words = detail.split()
+        if not words or not words[0] == "SCAN" or "USING" in words:
+            return False
+        if "VIRTUAL" in words:
+            return detail.rstrip().endswith(":")
+        table = words[2] if len(words) > 2 and words[1] == "TABLE" else words[1] if len(words) > 1 else ""
+        return table not in ALLOWED_SCANS and not table.startswith("CONSTANT")
@@ -0,0 +1,131 @@
+import time
+import random
+import threading
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from ad.benchmark import benchmark_database, seed_dataset, percentile
+from ad.models import AdItem
+
+
+class Command(BaseCommand):
+    help = "Смешанная нагрузка на БД: потоки-читатели (каталог, страница предмета, списки обменов) одновременно " \
+           "с потоками, создающими, отклоняющими и отзывающими предложения обмена. Для SQLite замер повторяется " \
+           "в каждом режиме журнала (--journal-mode) на файловой БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=5000)
+        parser.add_argument("--proposals", type=int, default=5000)
+        parser.add_argument("--readers", type=int, default=8, help="Кол-во потоков чтения")
+        parser.add_argument("--writers", type=int, default=2, help="Кол-во потоков записи")
+        parser.add_argument("--duration", type=float, default=10, help="Длительность одного прогона (сек.)")
+        parser.add_argument("--journal-mode", nargs="+", default=["delete", "wal"],
+                            help="Режимы журнала SQLite для сравнения")
+
+    def handle(self, *args, **options):
+        with benchmark_database(verbosity=options["verbosity"], on_disk=True):
+            self.stdout.write("Заполнение БД...")
+            dataset = seed_dataset(items=options["items"], proposals=options["proposals"])
+            if len(dataset.users) < options["writers"] * 2:
+                raise CommandError("Каждому потоку записи нужна пара пользователей: уменьшите --writers")
+            modes = options["journal_mode"] if connection.vendor == "sqlite" else [connection.vendor]
+            self.stdout.write(f"\n{'mode':<10}{'kind':<7}{'ops':>8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+                              f"{'errors':>8}")
+            for mode in modes:
+                connections.close_all()  # Новые соединения откроются с PRAGMA текущего прогона
+                with override_settings(AD_SQLITE_PRAGMAS={"journal_mode": mode}):
+                    results = Workload(dataset, options["readers"], options["writers"]).run(options["duration"])
+                for kind, result in results.items():
+                    self.stdout.write(f"{mode:<10}{kind:<7}{result['ops']:>8}{result['ops_s']:>10}"
+                                      f"{result['p50_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}")
+            connections.close_all()
+
+
+class Workload:
+    """ Потоки читателей и писателей, работающие до истечения заданного времени. У каждого потока своё соединение. """
+    def __init__(self, dataset, readers, writers):
+        self.dataset = dataset
+        self.readers = readers
+        self.writers = writers
+        self.item_ids = dataset.item_ids[:1000]
+        self.owners = dict(AdItem.objects.values_list("id", "owner_id"))
+        self.timings = {"read": [], "write": []}
+        self.errors = {"read": 0, "write": 0}
+        self.lock = threading.Lock()
+
+    def run(self, duration: float) -> dict:
+        deadline = time.monotonic() + duration
+        threads = [threading.Thread(target=self.thread_main, args=(self.read_loop, index, deadline))
+                   for index in range(self.readers)]
+        threads += [threading.Thread(target=self.thread_main, args=(self.write_loop, index, deadline))
+                    for index in range(self.writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {kind: {
+            "ops": len(timings),
+            "ops_s": round(len(timings) / elapsed, 1),
+            "p50_ms": round(percentile(timings, 50) * 1000, 3),
+            "p99_ms": round(percentile(timings, 99) * 1000, 3),
+            "errors": self.errors[kind]
+        } for kind, timings in self.timings.items()}
+
+    def thread_main(self, loop, index, deadline):
+        try:
+            loop(index, deadline)
+        finally:
+            connection.close()
+
+    def measure(self, kind, func) -> bool:
+        started = time.perf_counter()
+        status = func().status_code
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.timings[kind].append(elapsed)
+            if status >= 500:
+                self.errors[kind] += 1
+        return status < 400
+
+    def read_loop(self, index, deadline):
+        rnd = random.Random(index)
+        client = Client(raise_request_exception=False)
+        client.force_login(self.dataset.users[index % len(self.dataset.users)])
+        while time.monotonic() < deadline:
+            id_ = rnd.choice(self.item_ids)
+            url = rnd.choice((reverse("all-ad"), reverse("all-ad-can_request"), reverse("show-ad", kwargs={"id_": id_}),
+                              reverse("offer-request-list", kwargs={"id_": id_, "type_": "all"})))
+            self.measure("read", lambda: client.get(url, {"format": "json"}))
+
+    def write_loop(self, index, deadline):
+        """ Пара пользователей: отправитель предлагает обмен, получатель отклоняет либо отправитель отзывает. """
+        rnd = random.Random(1000 + index)
+        sender, receiver = self.dataset.users[index * 2], self.dataset.users[index * 2 + 1]
+        sender_items = [id_ for id_, owner_id in self.owners.items() if owner_id == sender.id]
+        receiver_items = [id_ for id_, owner_id in self.owners.items() if owner_id == receiver.id]
+        if not sender_items or not receiver_items:
+            return
+        sender_client, receiver_client = Client(raise_request_exception=False), Client(raise_request_exception=False)
+        sender_client.force_login(sender)
+        receiver_client.force_login(receiver)
+        while time.monotonic() < deadline:
+            url = reverse("exchange-offer", kwargs={"my_ad": rnd.choice(sender_items),
+                                                    "other_ad": rnd.choice(receiver_items)})
+            response = None
+
+            def offer():
+                nonlocal response
+                response = sender_client.post(url + "?format=json", content_type="application/json")
+                return response
+            if not self.measure("write", offer):
+                continue
+            id_ = response.json()["id"]
+            if rnd.random() < 0.5:
+                self.measure("write", lambda: receiver_client.put(
+                    reverse("exchange-response", kwargs={"type_": "reject", "id_": id_}) + "?format=json"))
+            else:
+                self.measure("write", lambda: sender_client.delete(
+                    reverse("destroy_offer", kwargs={"id_": id_}) + "?format=json"))
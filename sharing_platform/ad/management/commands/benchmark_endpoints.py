@@ -0,0 +1,238 @@
+import json
+import random
+import itertools
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.test import Client
+from django.urls import reverse
+from ad.benchmark import Measurement, benchmark_database, seed_dataset, compare_with_baseline
+from ad.exchange import register_pending
+from ad.models import AdItem, ExchangeProposal
+from ad.urls import urlpatterns as ad_urlpatterns
+from ad_management.urls import urlpatterns as management_urlpatterns
+
+
+SKIPPED_ROUTES = ("load-profile-input_ex", "load-profile-output_ex")  # Заглушки без реализации
+BULK_SIZE = 5  # Элементов в одном пакетном запросе обмена
+
+
+class Command(BaseCommand):
+    help = "Замер кол-ва SQL-запросов, задержек (p50/p99) и пиковой памяти каждого маршрута ad/ и api/ " \
+           "на синтетическом наборе данных с регрессионным сравнением относительно базового замера"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--categories", type=int, default=30)
+        parser.add_argument("--items", type=int, default=10000)
+        parser.add_argument("--proposals", type=int, default=10000)
+        parser.add_argument("--iterations", type=int, default=30, help="Кол-во обращений к каждому маршруту")
+        parser.add_argument("--route", action="append", default=[], help="Замерить только указанные маршруты")
+        parser.add_argument("--baseline", help="JSON-файл базового замера для сравнения")
+        parser.add_argument("--save-baseline", action="store_true", help="Записать результаты в файл --baseline")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Допустимый рост задержек и памяти относительно базового замера (доля)")
+
+    def handle(self, *args, **options):
+        with benchmark_database(verbosity=options["verbosity"]):
+            self.stdout.write("Заполнение БД...")
+            dataset = seed_dataset(users=options["users"], categories=options["categories"],
+                                   items=options["items"], proposals=options["proposals"])
+            results = self.run_routes(dataset, options["iterations"], set(options["route"]))
+        self.print_results(results)
+        baseline_path = options["baseline"]
+        if baseline_path is None:
+            return
+        if options["save_baseline"]:
+            with open(baseline_path, "w", encoding="utf-8") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Базовый замер сохранён: {baseline_path}"))
+            return
+        with open(baseline_path, encoding="utf-8") as file:
+            regressions = compare_with_baseline(results, json.load(file), options["tolerance"])
+        if regressions:
+            raise CommandError("Регрессии производительности:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Регрессий относительно базового замера нет"))
+
+    def run_routes(self, dataset, iterations, only) -> dict:
+        scenarios = Scenarios.create(dataset, iterations)
+        results = {}
+        for name in route_names():
+            if only and name not in only:
+                continue
+            for mode in ("json", "html"):
+                measurement = Measurement(f"{name}[{mode}]")
+                measurement.run(scenarios.get(name, mode), iterations)
+                results[measurement.name] = measurement.as_dict()
+                self.stdout.write(f"{measurement.name}: {results[measurement.name]}")
+        return results
+
+    def print_results(self, results: dict):
+        self.stdout.write(f"\n{'route':<40}{'queries':>8}{'p50 ms':>10}{'p99 ms':>10}{'peak KB':>10}{'errors':>8}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<40}{result['queries']:>8}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+                              f"{result['peak_kb']:>10}{result['errors']:>8}")
+
+
+def route_names() -> list:
+    """ Имена замеряемых маршрутов ad/ и api/. """
+    return [pattern.name for pattern in itertools.chain(ad_urlpatterns, management_urlpatterns)
+            if pattern.name not in SKIPPED_ROUTES]
+
+
+class Scenarios:
+    """ Подготовка обращения к каждому маршруту. Функция сценария выполняет один запрос
+    и возвращает False, если сервер ответил ошибкой. """
+    def __init__(self, dataset, user, client: Client, admin_client: Client, iterations):
+        self.dataset = dataset
+        self.user = user
+        self.client = client
+        self.admin_client = admin_client
+        self.iterations = iterations + 1  # + прогон замера памяти
+        self.random = random.Random(2)
+        self.my_item_ids = list(AdItem.objects.filter(owner=user).values_list("id", flat=True)[:1000])
+        self.other_item_ids = list(AdItem.objects.exclude(owner=user).values_list("id", flat=True)[:1000])
+        if not self.my_item_ids or len(self.other_item_ids) < 2:
+            raise CommandError("Слишком мало предметов для замеров: увеличьте --items")
+
+    @classmethod
+    def create(cls, dataset, iterations) -> "Scenarios":
+        """ Сценарии от имени первого пользователя набора данных (загрузка пачкой - от имени администратора). """
+        user = dataset.users[0]
+        admin = User.objects.create_superuser(username="bench_admin", password="bench_admin")
+        client, admin_client = Client(raise_request_exception=False), Client(raise_request_exception=False)
+        client.force_login(user)
+        admin_client.force_login(admin)
+        return cls(dataset, user, client, admin_client, iterations)
+
+    def get(self, name, mode):
+        """ Функция сценария для маршрута: чтение (GET) или изменяющий запрос. """
+        readers = {
+            "show-ad": lambda: {"id_": self.random.choice(self.other_item_ids)},
+            "exchange-init-list": lambda: {"id_": self.random.choice(self.other_item_ids)},
+            "offer-request-list": lambda: {"id_": self.random.choice(self.my_item_ids),
+                                           "type_": self.random.choice(("in", "out", "all"))},
+            "all-ad-my": dict, "all-ad-tome": dict, "all-ad-can_request": dict, "all-ad-my-ad-items": dict,
+            "all-ad": dict, "user-dashboard": dict,
+        }
+        if name in readers:
+            return lambda: self.request("get", reverse(name, kwargs=readers[name]()), mode)
+        scenario = getattr(self, name.replace("-", "_"), None)
+        if scenario is None:
+            raise CommandError(f"Нет сценария для маршрута {name}: добавьте метод Scenarios.{name.replace('-', '_')} "
+                               f"или имя маршрута в SKIPPED_ROUTES")
+        return scenario(mode)
+
+    def request(self, method, url, mode, client=None, **kwargs):
+        client = client or self.client
+        if mode == "json":
+            url += ("&" if "?" in url else "?") + "format=json"
+        else:
+            kwargs.setdefault("HTTP_ACCEPT", "text/html")
+        response = getattr(client, method)(url, **kwargs)
+        if response.streaming:
+            b"".join(response.streaming_content)  # Потоковый ответ формируется при чтении
+        return response.status_code < 500
+
+    def post_ad(self, mode):
+        category_id = self.dataset.categories[0].id
+        counter = itertools.count()
+
+        def run():
+            if mode == "html":
+                return self.request("get", reverse("post-ad"), mode)
+            return self.request("post", reverse("post-ad"), mode,
+                                data={"name": f"bench new {next(counter)}", "category": category_id, "status": "a"})
+        return run
+
+    def exchange_offer(self, mode):
+        pairs = iter([(self.random.choice(self.my_item_ids), other_id)
+                      for other_id in self.random.sample(self.other_item_ids, min(self.iterations,
+                                                                                   len(self.other_item_ids)))])
+
+        def run():
+            my_ad, other_ad = next(pairs, (self.my_item_ids[0], self.other_item_ids[0]))
+            return self.request("post", reverse("exchange-offer", kwargs={"my_ad": my_ad, "other_ad": other_ad}),
+                                mode, content_type="application/json")
+        return run
+
+    def _pending_proposals(self, incoming: bool, count=None) -> list:
+        """ Заранее созданные ожидающие предложения: исходящие от пользователя или адресованные ему. """
+        proposals = []
+        while len(proposals) < (count or self.iterations):
+            mine, other = self.random.choice(self.my_item_ids), self.random.choice(self.other_item_ids)
+            sender_id, receiver_id = (other, mine) if incoming else (mine, other)
+            try:
+                with transaction.atomic():
+                    proposals.append(ExchangeProposal.objects.create(sender_id=sender_id, receiver_id=receiver_id))
+            except IntegrityError:
+                continue  # Для пары уже есть ожидающее предложение
+            register_pending(sender_id, receiver_id)
+        return proposals
+
+    def _bulk_batches(self, incoming: bool):
+        """ Пакеты по BULK_SIZE заранее созданных ожидающих предложений - по пакету на обращение. """
+        proposals = self._pending_proposals(incoming, self.iterations * BULK_SIZE)
+        return iter([proposals[i:i + BULK_SIZE] for i in range(0, len(proposals), BULK_SIZE)])
+
+    def destroy_offer(self, mode):
+        proposals = iter(self._pending_proposals(incoming=False))
+
+        def run():
+            return self.request("delete", reverse("destroy_offer", kwargs={"id_": next(proposals).id}), mode)
+        return run
+
+    def exchange_response(self, mode):
+        proposals = iter(self._pending_proposals(incoming=True))
+        types = itertools.cycle(("accept", "reject"))
+
+        def run():
+            url = reverse("exchange-response", kwargs={"type_": next(types), "id_": next(proposals).id})
+            return self.request("put", url, mode)
+        return run
+
+    def exchange_offer_bulk(self, mode):
+        batches = iter([[{"sender": self.random.choice(self.my_item_ids), "receiver": other_id}
+                         for other_id in self.random.sample(self.other_item_ids, min(BULK_SIZE,
+                                                                                      len(self.other_item_ids)))]
+                        for _ in range(self.iterations)])
+
+        def run():
+            return self.request("post", reverse("exchange-offer-bulk"), mode,
+                                data={"offers": next(batches)}, content_type="application/json")
+        return run
+
+    def destroy_offer_bulk(self, mode):
+        batches = self._bulk_batches(incoming=False)
+
+        def run():
+            return self.request("post", reverse("destroy_offer-bulk"), mode,
+                                data={"ids": [str(proposal.id) for proposal in next(batches)]},
+                                content_type="application/json")
+        return run
+
+    def exchange_response_bulk(self, mode):
+        batches = self._bulk_batches(incoming=True)
+        types = itertools.cycle(("accept", "reject"))
+
+        def run():
+            decisions = [{"id": str(proposal.id), "type": next(types)} for proposal in next(batches)]
+            return self.request("post", reverse("exchange-response-bulk"), mode,
+                                data={"decisions": decisions}, content_type="application/json")
+        return run
+
+    def change_feed(self, mode):
+        """ Лента изменений журнала с начала (записи добавляют изменяющие сценарии и загрузка пачкой). """
+        def run():
+            return self.request("get", reverse("change-feed") + "?since=0&limit=1000", mode, client=self.admin_client)
+        return run
+
+    def ad_json_loader(self, mode):
+        category_id = self.dataset.categories[0].id
+        payload = {"ads": [{"name": f"bench bulk {i}", "category": category_id, "owner": self.user.id}
+                           for i in range(20)]}
+
+        def run():
+            return self.request("post", reverse("ad-json-loader"), mode, client=self.admin_client,
+                                data=payload, content_type="application/json")
+        return run
@@ -0,0 +1,71 @@
+import json
+import time
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from ad.benchmark import benchmark_database, seed_dataset
+from ad.fast_serializers import FastJSONRenderer
+from ad.models import AdItem
+from ad.views import AdCatalog, ExchangeAdList, ExchangeInitList
+
+
+class Command(BaseCommand):
+    help = "Сравнить скорость (строк в секунду) сериализаторов DRF и быстрого пути values() для JSON-списков " \
+           "AdCatalog, ExchangeAdList, ExchangeInitList; результаты обоих путей должны совпадать"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=5000)
+        parser.add_argument("--proposals", type=int, default=5000)
+        parser.add_argument("--rows", type=int, default=1000, help="Кол-во строк в одном прогоне")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with benchmark_database(verbosity=options["verbosity"]):
+            dataset = seed_dataset(items=options["items"], proposals=options["proposals"])
+            request = Request(RequestFactory().get("/"))
+            request.user = dataset.users[0]
+            self.stdout.write(f"{'list':<20}{'rows':>8}{'DRF rows/s':>14}{'values rows/s':>16}{'speedup':>10}")
+            for name, view, queryset in self.lists(dataset, request):
+                rows = options["rows"]
+                ordered = queryset.order_by("-created_at", "-id")
+                context = {"request": request}
+
+                def drf():
+                    serializer_class = view.values_serializer.serializer_class  # Сериализатор JSON-ответа
+                    return JSONRenderer().render(serializer_class(ordered[:rows], many=True, context=context).data)
+
+                def fast():
+                    values = view.values_serializer.values(ordered)[:rows]
+                    return FastJSONRenderer().render(view.values_serializer.serialize(values, context))
+
+                result = json.loads(drf())
+                if not result == json.loads(fast()):
+                    raise CommandError(f"{name}: результаты сериализаторов не совпадают")
+                rows = len(result)
+                drf_speed, fast_speed = self.speed(drf, rows, options["repeat"]), self.speed(fast, rows, options["repeat"])
+                self.stdout.write(f"{name:<20}{rows:>8}{drf_speed:>14.0f}{fast_speed:>16.0f}"
+                                  f"{fast_speed / drf_speed:>9.1f}x")
+
+    @staticmethod
+    def lists(dataset, request):
+        """ Наборы строк так, как их строят представления (кроме постраничной выборки). """
+        catalog = AdCatalog()
+        offers = ExchangeAdList()
+        init_list = ExchangeInitList()
+        init_list.request, init_list.my_ad_id = SimpleNamespace(user=dataset.users[0]), dataset.item_ids[0]
+        return (
+            ("AdCatalog", catalog, AdItem.objects.all()),
+            ("ExchangeAdList", offers, offers.get_queryset()),  # Все предложения - строк больше, чем у одного предмета
+            ("ExchangeInitList", init_list, init_list.filter_queryset(None)),
+        )
+
+    @staticmethod
+    def speed(func, rows, repeat) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return rows / min(timings)
@@ -0,0 +1,24 @@
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ad.exchange import expire_proposals, expired_proposals
+
+
+class Command(BaseCommand):
+    help = "Отклонить ожидающие предложения обмена старше заданного возраста (пачками, отдельными транзакциями). " \
+           "Предназначена для запуска по расписанию (cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=None,
+                            help="Возраст предложения (дн.), по умолчанию AD_PROPOSAL_MAX_AGE_DAYS")
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Кол-во предложений в одной транзакции, по умолчанию AD_PROPOSAL_EXPIRE_BATCH_SIZE")
+        parser.add_argument("--dry-run", action="store_true", help="Только подсчитать устаревшие предложения")
+
+    def handle(self, *args, days=None, batch_size=None, dry_run=False, **options):
+        max_age = datetime.timedelta(days=getattr(settings, "AD_PROPOSAL_MAX_AGE_DAYS", 30) if days is None else days)
+        if dry_run:
+            self.stdout.write(f"Устаревших предложений: {expired_proposals(max_age).count()}")
+            return
+        counter = expire_proposals(max_age, batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Отклонено устаревших предложений: {counter}"))
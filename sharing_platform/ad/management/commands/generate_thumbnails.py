@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from ad.models import AdItem
+from ad.thumbnails import THUMBNAIL_SPECS, generate_file, is_thumbnail_ready
+
+
+class Command(BaseCommand):
+    help = "Создать недостающие миниатюры изображений предметов в несколько потоков"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--force", action="store_true", help="Пересоздать и существующие миниатюры")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, workers=4, force=False, batch_size=500, **options):
+        items = AdItem.objects.exclude(image="").exclude(image__isnull=True).only("id", "image")
+        generated, failed = 0, 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for item in items.iterator(chunk_size=batch_size):
+                for spec_name in THUMBNAIL_SPECS:
+                    file = getattr(item, spec_name)
+                    if force or not is_thumbnail_ready(file):
+                        futures.append(pool.submit(generate_file, file, force))
+                if len(futures) >= batch_size:
+                    generated, failed = self.collect(futures, generated, failed)
+                    futures = []
+            generated, failed = self.collect(futures, generated, failed)
+        self.stdout.write(self.style.SUCCESS(f"Создано миниатюр: {generated}, ошибок: {failed}"))
+
+    @staticmethod
+    def collect(futures, generated, failed):
+        for future in futures:
+            if future.result():
+                generated += 1
+            else:
+                failed += 1
+        return generated, failed
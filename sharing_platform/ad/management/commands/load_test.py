@@ -0,0 +1,116 @@
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, AsyncClient
+from django.urls import reverse
+from ad.async_urls import urlpatterns as async_urlpatterns
+from ad.benchmark import benchmark_database, seed_dataset, percentile
+from ad.models import AdItem
+
+
+class Command(BaseCommand):
+    help = "Нагрузочное сравнение синхронных (WSGI, пул потоков) и асинхронных (ASGI, ad/async/) JSON-представлений " \
+           "чтения при разном кол-ве одновременных соединений: запросов в секунду, задержки p50/p99"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=5000)
+        parser.add_argument("--proposals", type=int, default=5000)
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64, 256],
+                            help="Кол-во одновременных соединений")
+        parser.add_argument("--requests", type=int, default=500, help="Кол-во запросов в одном прогоне")
+        parser.add_argument("--route", action="append", default=[],
+                            help="Только указанные маршруты (имена из ad.urls, без префикса async-)")
+
+    def handle(self, *args, **options):
+        routes = [pattern.name[len("async-"):] for pattern in async_urlpatterns]
+        unknown = set(options["route"]) - set(routes)
+        if unknown:
+            raise CommandError(f"Нет асинхронного варианта маршрутов: {', '.join(sorted(unknown))}")
+        with benchmark_database(verbosity=options["verbosity"]):
+            self.stdout.write("Заполнение БД...")
+            dataset = seed_dataset(items=options["items"], proposals=options["proposals"])
+            urls = UrlFactory(dataset.users[0])
+            self.stdout.write(f"\n{'route':<28}{'conn':>6}{'mode':>7}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+                              f"{'errors':>8}")
+            for name in routes:
+                if options["route"] and name not in options["route"]:
+                    continue
+                for concurrency in options["concurrency"]:
+                    for mode, run in (("wsgi", self.run_sync), ("asgi", self.run_async)):
+                        result = run(urls, name, concurrency, options["requests"])
+                        self.stdout.write(f"{name:<28}{concurrency:>6}{mode:>7}{result['rps']:>10}"
+                                          f"{result['p50_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}")
+
+    @staticmethod
+    def run_sync(urls: "UrlFactory", name, concurrency, count) -> dict:
+        """ Обработчик WSGI (django.test.Client) в пуле из concurrency потоков. """
+        paths = [urls.get(name) for _ in range(count)]
+        clients = [urls.login(Client(raise_request_exception=False)) for _ in range(concurrency)]
+
+        def request(index):
+            started = time.perf_counter()
+            status = clients[index % concurrency].get(paths[index]).status_code
+            return time.perf_counter() - started, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(request, range(count)))
+        return summarize(results, time.perf_counter() - started)
+
+    @staticmethod
+    def run_async(urls: "UrlFactory", name, concurrency, count) -> dict:
+        """ Обработчик ASGI (django.test.AsyncClient) в одном цикле событий, не более concurrency запросов сразу. """
+        paths = [urls.get(name, prefix="async-") for _ in range(count)]
+        clients = [urls.login(AsyncClient(raise_request_exception=False)) for _ in range(concurrency)]
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request(index):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await clients[index % concurrency].get(paths[index])
+                    return time.perf_counter() - started, response.status_code
+
+            return await asyncio.gather(*(request(index) for index in range(count)))
+
+        started = time.perf_counter()
+        results = asyncio.run(main())
+        return summarize(results, time.perf_counter() - started)
+
+
+class UrlFactory:
+    """ Адреса запросов от имени пользователя user (JSON-ответ в синхронном варианте). """
+    def __init__(self, user):
+        self.user = user
+        self.random = random.Random(3)
+        self.my_item_ids = list(AdItem.objects.filter(owner=user).values_list("id", flat=True)[:1000])
+        self.other_item_ids = list(AdItem.objects.exclude(owner=user).values_list("id", flat=True)[:1000])
+        if not self.my_item_ids or not self.other_item_ids:
+            raise CommandError("Слишком мало предметов для замеров: увеличьте --items")
+
+    def login(self, client):
+        client.force_login(self.user)
+        return client
+
+    def get(self, name, prefix="") -> str:
+        kwargs = {
+            "show-ad": lambda: {"id_": self.random.choice(self.other_item_ids)},
+            "exchange-init-list": lambda: {"id_": self.random.choice(self.other_item_ids)},
+            "offer-request-list": lambda: {"id_": self.random.choice(self.my_item_ids),
+                                           "type_": self.random.choice(("in", "out", "all"))},
+        }.get(name, dict)()
+        url = reverse(prefix + name, kwargs=kwargs)
+        return url if prefix else url + "?format=json"
+
+
+def summarize(results, elapsed: float) -> dict:
+    timings = [timing for timing, _ in results]
+    return {
+        "rps": round(len(results) / elapsed, 1),
+        "p50_ms": round(percentile(timings, 50) * 1000, 3),
+        "p99_ms": round(percentile(timings, 99) * 1000, 3),
+        "errors": sum(1 for _, status in results if status >= 400)
+    }
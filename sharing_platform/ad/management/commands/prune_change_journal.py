@@ -0,0 +1,17 @@
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ad.journal import prune_journal
+
+
+class Command(BaseCommand):
+    help = "Удалить записи журнала изменений старше срока хранения. Предназначена для запуска по расписанию (cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=None,
+                            help="Срок хранения (дн.), по умолчанию AD_CHANGE_JOURNAL_RETENTION_DAYS")
+
+    def handle(self, *args, days=None, **options):
+        days = getattr(settings, "AD_CHANGE_JOURNAL_RETENTION_DAYS", 30) if days is None else days
+        counter = prune_journal(datetime.timedelta(days=days))
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей журнала: {counter}"))
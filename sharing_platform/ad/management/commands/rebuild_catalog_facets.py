@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from ad.facets import find_drifted_facets, rebuild_facet_counts
+from ad.response_cache import response_cache, CATALOG_TAG
+
+
+class Command(BaseCommand):
+    help = "Проверить и пересчитать фасеты каталога (кол-во предметов по категориям и состояниям)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Только проверить согласованность, ничего не изменяя")
+
+    def handle(self, *args, check=False, **options):
+        if check:
+            drifted = find_drifted_facets()
+            if drifted:
+                pairs = ", ".join(f"{category_id}:{status}" for category_id, status in drifted[:20])
+                raise CommandError(f"Фасеты не согласованы: {len(drifted)} ({pairs})")
+            self.stdout.write(self.style.SUCCESS("Фасеты согласованы"))
+            return
+        drifted = rebuild_facet_counts()
+        if drifted:
+            response_cache.invalidate([CATALOG_TAG])
+        self.stdout.write(self.style.SUCCESS(f"Исправлено расхождений: {len(drifted)}"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from ad.exchange import find_inconsistent_items, rebuild_pending_state
+
+
+class Command(BaseCommand):
+    help = "Проверить и пересчитать счётчики ожидающих предложений обмена у предметов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Только проверить согласованность, ничего не изменяя")
+
+    def handle(self, *args, check=False, **options):
+        inconsistent = find_inconsistent_items()
+        counter = inconsistent.count()
+        if check:
+            if counter:
+                ids = ", ".join(str(id_) for id_ in inconsistent.values_list("id", flat=True)[:20])
+                raise CommandError(f"Счётчики не согласованы у предметов: {counter} ({ids})")
+            self.stdout.write(self.style.SUCCESS("Счётчики согласованы"))
+            return
+        updated = rebuild_pending_state()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано предметов: {updated}, исправлено расхождений: {counter}"))
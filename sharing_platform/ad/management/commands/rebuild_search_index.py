@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from ad.search import get_search_backend, REBUILD_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Построить поисковый индекс предметов обмена с нуля"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, batch_size=REBUILD_BATCH_SIZE, **options):
+        backend = get_search_backend()
+        counter = backend.rebuild(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"{backend.__class__.__name__}: проиндексировано предметов - {counter}"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from ad.counters import find_drifted_users, rebuild_user_counters
+
+
+class Command(BaseCommand):
+    help = "Проверить и пересчитать сводные счётчики пользователей (панель /ad/dashboard/)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Только проверить согласованность, ничего не изменяя")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Кол-во пользователей в одной пачке")
+
+    def handle(self, *args, check=False, batch_size=1000, **options):
+        if check:
+            drifted = find_drifted_users(batch_size=batch_size)
+            if drifted:
+                ids = ", ".join(str(id_) for id_ in drifted[:20])
+                raise CommandError(f"Счётчики не согласованы у пользователей: {len(drifted)} ({ids})")
+            self.stdout.write(self.style.SUCCESS("Счётчики согласованы"))
+            return
+        drifted = rebuild_user_counters(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Исправлено расхождений: {len(drifted)}"))
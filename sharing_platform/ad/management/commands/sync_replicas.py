@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from ad.replicas import read_replicas, replicate_sqlite
+
+
+class Command(BaseCommand):
+    help = "Скопировать основную БД SQLite в файлы реплик (AD_READ_REPLICAS) - замена репликации " \
+           "для локальной проверки чтения с реплик. С --interval копирование повторяется с заданным периодом"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=None,
+                            help="Период копирования (сек.), имитирует задержку репликации")
+
+    def handle(self, *args, interval=None, **options):
+        if not read_replicas():
+            raise CommandError("Реплики не заданы: AD_READ_REPLICAS (переменная окружения DB_REPLICAS)")
+        while True:
+            updated = replicate_sqlite()
+            if not updated:
+                raise CommandError("Нет реплик SQLite для копирования")
+            self.stdout.write(self.style.SUCCESS(f"Реплики обновлены: {', '.join(updated)}"))
+            if interval is None:
+                return
+            time.sleep(interval)
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.23 on 2026-10-18 13:19
+
+import ad.images
+import ad.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdItem',
+            fields=[
+                ('id', models.CharField(default=uuid.uuid4, max_length=50, primary_key=True, serialize=False)),
+                ('name', models.CharField(default='', max_length=50, verbose_name='Название предмета')),
+                ('description', models.CharField(blank=True, default='', max_length=150, verbose_name='Описание предмета')),
+                ('image', ad.images.IngestedImageField(blank=True, default=None, null=True, upload_to=ad.images.content_addressed_path, verbose_name='Изображение')),
+                ('status', models.CharField(choices=[('n', 'Выберите состояние предмета'), ('a', 'Новый'), ('b', 'Б/У')], default='n', max_length=1, validators=[ad.models.status_item_validator], verbose_name='Состояние предмета')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('pending_out_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('pending_in_count', models.PositiveIntegerField(default=0, editable=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArticleCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('description', models.CharField(blank=True, max_length=150)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExchangeProposal',
+            fields=[
+                ('id', models.CharField(default=uuid.uuid4, max_length=50, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('s', 'Обмен состоялся'), ('p', 'Ожидание одобрения'), ('r', 'Ваше предложение отклонено')], default='p', max_length=1, validators=[ad.models.exchange_item_validator], verbose_name='Текущий статус обмена')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='AdItem.id+', to='ad.aditem', verbose_name='Принимающий')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='AdItem.id+', to='ad.aditem', verbose_name='Предлагающий')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='aditem',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='ad.articlecategory', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='aditem',
+            name='exchange',
+            field=models.ManyToManyField(blank=True, null=True, related_name='id+', to='ad.exchangeproposal'),
+        ),
+        migrations.AddField(
+            model_name='aditem',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Хозяин'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['created_at', 'id'], name='ad_proposal_created_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aditem',
+            index=models.Index(fields=['created_at', 'id'], name='ad_item_created_keyset_idx'),
+        ),
+    ]
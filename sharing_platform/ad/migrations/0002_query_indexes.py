@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ad', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aditem',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='ad_item_owner_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aditem',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='ad_item_category_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aditem',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='ad_item_status_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aditem',
+            index=models.Index(condition=models.Q(('pending_in_count', 0), ('pending_out_count', 0)), fields=['created_at', 'id'], name='ad_item_free_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(condition=models.Q(('status', 'p')), fields=['sender', 'receiver'], name='ad_proposal_pending_out_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(condition=models.Q(('status', 'p')), fields=['receiver', 'sender'], name='ad_proposal_pending_in_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.2.23 on 2026-10-18 13:21
+
+from django.db import migrations, models
+import uuid
+
+
+BATCH_SIZE = 1000
+FTS_TABLE_NAME = "ad_aditem_fts"  # ad.search.FTS_TABLE_NAME
+FTS_KEYS_TABLE_NAME = "ad_aditem_search_keys"  # ad.search.FTS_KEYS_TABLE_NAME
+
+
+def key_columns(apps, connection):
+    """ Столбцы, хранящие первичные ключи AdItem и ExchangeProposal: сами ключи, внешние ключи,
+    промежуточная таблица AdItem.exchange и поисковый индекс (если создан; item_id хранит таблица соответствия
+    rowid, в индексе прежнего формата - сама виртуальная таблица). """
+    ad_item = apps.get_model("ad", "AdItem")
+    proposal = apps.get_model("ad", "ExchangeProposal")
+    through = ad_item._meta.get_field("exchange").remote_field.through
+    columns = [(ad_item._meta.db_table, "id"), (proposal._meta.db_table, "id"),
+               (proposal._meta.db_table, proposal._meta.get_field("sender").column),
+               (proposal._meta.db_table, proposal._meta.get_field("receiver").column)]
+    columns.extend((through._meta.db_table, field.column) for field in through._meta.local_fields
+                   if field.is_relation)
+    tables = connection.introspection.table_names()
+    for table in (FTS_KEYS_TABLE_NAME, FTS_TABLE_NAME):
+        if table in tables:
+            with connection.cursor() as cursor:
+                cursor.execute(f"PRAGMA table_info({table})")
+                if "item_id" in [row[1] for row in cursor.fetchall()]:
+                    columns.append((table, "item_id"))
+    return columns
+
+
+def convert_keys(apps, schema_editor, to_hex: bool):
+    """ Без собственного типа uuid (SQLite) UUIDField хранит 32 шестнадцатеричных символа без дефисов.
+    Строки вида xxxxxxxx-xxxx-... переписываются пачками по BATCH_SIZE значений. """
+    connection = schema_editor.connection
+    if connection.features.has_native_uuid_field:
+        return  # PostgreSQL: ALTER COLUMN ... TYPE uuid преобразует строки сам
+    quote = schema_editor.quote_name
+    pattern = "%-%"
+    for table, column in key_columns(apps, connection):
+        condition = "LIKE" if to_hex else "NOT LIKE"
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(f"SELECT DISTINCT {quote(column)} FROM {quote(table)} "
+                               f"WHERE {quote(column)} {condition} %s LIMIT %s", [pattern, BATCH_SIZE])
+                values = [row[0] for row in cursor.fetchall()]
+                if not values:
+                    break
+                cursor.executemany(f"UPDATE {quote(table)} SET {quote(column)} = %s WHERE {quote(column)} = %s",
+                                   [(uuid.UUID(value).hex if to_hex else str(uuid.UUID(value)), value)
+                                    for value in values])
+
+
+def keys_to_hex(apps, schema_editor):
+    convert_keys(apps, schema_editor, to_hex=True)
+
+
+def keys_to_text(apps, schema_editor):
+    convert_keys(apps, schema_editor, to_hex=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ad', '0002_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(keys_to_hex, keys_to_text),
+        migrations.AlterField(
+            model_name='aditem',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
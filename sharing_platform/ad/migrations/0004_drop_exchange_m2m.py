@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-18 13:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ad', '0003_compact_uuid_keys'),
+    ]
+
+    operations = [
+        # Строки промежуточной таблицы повторяли пары (sender|receiver, предложение) - те же связи хранят внешние ключи
+        migrations.RemoveField(
+            model_name='aditem',
+            name='exchange',
+        ),
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='receiver',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incoming_proposals', to='ad.aditem', verbose_name='Принимающий'),
+        ),
+        migrations.AlterField(
+            model_name='exchangeproposal',
+            name='sender',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_proposals', to='ad.aditem', verbose_name='Предлагающий'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.23 on 2026-10-18 13:33
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def reject_duplicate_pending(apps, schema_editor):
+    """ Перед уникальным индексом: из повторных ожидающих предложений одной пары предметов остаётся самое раннее,
+    остальные отклоняются, счётчики ожидающих предложений предметов уменьшаются. """
+    proposal = apps.get_model("ad", "ExchangeProposal")
+    ad_item = apps.get_model("ad", "AdItem")
+    pending = proposal.objects.filter(status="p")
+    pairs = pending.values("sender_id", "receiver_id").annotate(counter=Count("id")).filter(counter__gt=1)
+    for pair in pairs:
+        ids = list(pending.filter(sender_id=pair["sender_id"], receiver_id=pair["receiver_id"]).order_by(
+            "created_at", "id").values_list("id", flat=True))[1:]
+        proposal.objects.filter(id__in=ids).update(status="r")
+        ad_item.objects.filter(id=pair["sender_id"], pending_out_count__gte=len(ids)).update(
+            pending_out_count=F("pending_out_count") - len(ids))
+        ad_item.objects.filter(id=pair["receiver_id"], pending_in_count__gte=len(ids)).update(
+            pending_in_count=F("pending_in_count") - len(ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ad', '0004_drop_exchange_m2m'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='exchangeproposal',
+            name='ad_proposal_pending_out_idx',
+        ),
+        migrations.AddField(
+            model_name='aditem',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(reject_duplicate_pending, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='exchangeproposal',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'p')), fields=('sender', 'receiver'), name='ad_proposal_pending_pair_uniq'),
+        ),
+    ]
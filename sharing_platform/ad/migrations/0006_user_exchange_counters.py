@@ -0,0 +1,51 @@
+# Generated by Django 4.2.23 on 2026-10-18 13:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def fill_deal_parties(apps, schema_editor):
+    """ Участники прошлых обменов восстанавливаются по текущим владельцам предметов: предмет-отправитель
+    принадлежит бывшему владельцу получателя и наоборот (точно, если предметы больше не обменивались).
+    Строки счётчиков пользователей создаются при первом обращении (ad.counters). """
+    proposal = apps.get_model("ad", "ExchangeProposal")
+    ad_item = apps.get_model("ad", "AdItem")
+    proposal.objects.filter(status="s").update(
+        sender_owner_id=Subquery(ad_item.objects.filter(id=OuterRef("receiver_id")).values("owner_id")[:1]),
+        receiver_owner_id=Subquery(ad_item.objects.filter(id=OuterRef("sender_id")).values("owner_id")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('ad', '0005_exchange_concurrency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserExchangeCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='exchange_counters', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('items_count', models.PositiveIntegerField(default=0)),
+                ('pending_in_count', models.PositiveIntegerField(default=0)),
+                ('pending_out_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='exchangeproposal',
+            name='receiver_owner',
+            field=models.ForeignKey(blank=True, default=None, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='exchangeproposal',
+            name='sender_owner',
+            field=models.ForeignKey(blank=True, default=None, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(fill_deal_parties, migrations.RunPython.noop),
+    ]
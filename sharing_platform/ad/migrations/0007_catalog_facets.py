@@ -0,0 +1,46 @@
+# Generated by Django 4.2.23 on 2026-10-18 13:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_catalog_facets(apps, schema_editor):
+    ad_item = apps.get_model("ad", "AdItem")
+    catalog_facet = apps.get_model("ad", "CatalogFacet")
+    catalog_facet.objects.bulk_create([
+        catalog_facet(category_id=row["category_id"], status=row["status"], items_count=row["items_count"])
+        for row in ad_item.objects.order_by().values("category_id", "status").annotate(items_count=Count("id"))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ad', '0006_user_exchange_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('n', 'Выберите состояние предмета'), ('a', 'Новый'), ('b', 'Б/У')], max_length=1)),
+                ('items_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='aditem',
+            index=models.Index(fields=['category', 'status', 'created_at', 'id'], name='ad_item_cat_status_keyset_idx'),
+        ),
+        migrations.AddField(
+            model_name='catalogfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ad.articlecategory'),
+        ),
+        migrations.AddConstraint(
+            model_name='catalogfacet',
+            constraint=models.UniqueConstraint(fields=('category', 'status'), name='ad_catalog_facet_uniq'),
+        ),
+        migrations.RunPython(fill_catalog_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+def journal_existing_records(apps, schema_editor):
+    """ Записи create для существующих предметов и предложений: новый потребитель может синхронизироваться
+    с начала журнала (since=0) без обхода каталога. """
+    change_journal = apps.get_model("ad", "ChangeJournal")
+    for model, model_name in (("i", "AdItem"), ("p", "ExchangeProposal")):
+        ids = apps.get_model("ad", model_name).objects.order_by("created_at", "id").values_list("id", flat=True)
+        batch = []
+        for id_ in ids.iterator(chunk_size=2000):
+            batch.append(change_journal(model=model, object_id=id_, action="c"))
+            if len(batch) >= 2000:
+                change_journal.objects.bulk_create(batch)
+                batch = []
+        change_journal.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ad', '0007_catalog_facets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeJournal',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('i', 'item'), ('p', 'proposal')], max_length=1)),
+                ('object_id', models.UUIDField()),
+                ('action', models.CharField(choices=[('c', 'create'), ('u', 'update'), ('d', 'delete')], max_length=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(journal_existing_records, migrations.RunPython.noop),
+    ]
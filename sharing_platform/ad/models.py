@@ -1,11 +1,11 @@
-import re
 import uuid
-from django.db import models
+from django.db import models, router, transaction
 from django.utils.translation import gettext
 from django.contrib.auth.models import User
 from django.core.validators import ValidationError
 from imagekit.models import ImageSpecField
 from imagekit.processors import ResizeToFill
+from .images import IngestedImageField
 
 
 ITEM_CONDITION = (
@@ -32,11 +32,6 @@ def exchange_item_validator(value):
         raise ValidationError
 
 
-def uuid_validator(val):
-    if not re.match(re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"), val):
-        raise ValidationError
-
-
 class ArticleCategory(models.Model):
     """ Категория предмета """
     name = models.CharField(max_length=50, blank=False, unique=True)
@@ -48,27 +43,68 @@ class ArticleCategory(models.Model):
 
 class AdItem(models.Model):
     """ Предмет, участвующий в обмене """
-    id = models.CharField(max_length=50, default=uuid.uuid4, primary_key=True, validators=(uuid_validator,))
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
     name = models.CharField(blank=False, max_length=50, default="", verbose_name=gettext("ad_item_name"))
     description = models.CharField(max_length=150, blank=True, default="", verbose_name=gettext("ad_item_description"))
-    image = models.ImageField(upload_to="images", blank=True, null=True, default=None, verbose_name=gettext("ad_item_image"))
+    image = IngestedImageField(blank=True, null=True, default=None, verbose_name=gettext("ad_item_image"))
     list_thumb = ImageSpecField(source='image',
                                 processors=[ResizeToFill(100, 50)],
                                 format='JPEG',
-                                options={'quality': 60})
+                                options={'quality': 60},
+                                cachefile_strategy="ad.thumbnails.DeferredCacheFileStrategy")
     preview_thumb = ImageSpecField(source='image',
                                    processors=[ResizeToFill(200, 100)],
                                    format='JPEG',
-                                   options={'quality': 80})
+                                   options={'quality': 80},
+                                   cachefile_strategy="ad.thumbnails.DeferredCacheFileStrategy")
     mini_thumb = ImageSpecField(source='image',
                                 processors=[ResizeToFill(20, 20)],
                                 format='JPEG',
-                                options={'quality': 30})
+                                options={'quality': 30},
+                                cachefile_strategy="ad.thumbnails.DeferredCacheFileStrategy")
     category = models.ForeignKey(ArticleCategory, on_delete=models.PROTECT, blank=False, verbose_name=gettext("ad_item_category"))
     owner = models.ForeignKey(User, on_delete=models.CASCADE, blank=False, verbose_name=gettext("ad_item_owner"))
     status = models.CharField(max_length=1, choices=ITEM_CONDITION, default="n", blank=False,
                               validators=(status_item_validator,), verbose_name=gettext("ad_item_quality_status"))
-    exchange = models.ManyToManyField("ExchangeProposal", blank=True, null=True, related_name="id+")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=gettext("created_at"))
+    # Денормализованное кол-во ожидающих (status="p") предложений с участием предмета. Поддерживается модулем ad.exchange
+    pending_out_count = models.PositiveIntegerField(default=0, editable=False)  # Предмет выступает отправителем (sender)
+    pending_in_count = models.PositiveIntegerField(default=0, editable=False)  # Предмет выступает получателем (receiver)
+    version = models.PositiveIntegerField(default=0, editable=False)  # Номер версии владельца: растёт при каждом обмене (ad.exchange)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("created_at", "id"), name="ad_item_created_keyset_idx"),  # Постраничный вывод (ad.pagination)
+            # Списки с фильтром (владелец, категория, состояние) в порядке постраничного вывода
+            models.Index(fields=("owner", "created_at", "id"), name="ad_item_owner_keyset_idx"),
+            models.Index(fields=("category", "created_at", "id"), name="ad_item_category_keyset_idx"),
+            models.Index(fields=("status", "created_at", "id"), name="ad_item_status_keyset_idx"),
+            models.Index(fields=("category", "status", "created_at", "id"), name="ad_item_cat_status_keyset_idx"),
+            # Каталог /request/: предметы без ожидающих предложений
+            models.Index(fields=("created_at", "id"), name="ad_item_free_keyset_idx",
+                         condition=models.Q(pending_out_count=0, pending_in_count=0)),
+        )
+
+    # Поля, которые ad.exchange изменяет только UPDATE с F(): в экземпляре, прочитанном до обмена или предложения,
+    # их значения устаревшие, поэтому полное сохранение существующей записи их не перезаписывает
+    EXCHANGE_FIELDS = ("pending_out_count", "pending_in_count", "version")
+
+    def save(self, *args, **kwargs):
+        if not args and not self._state.adding and kwargs.get("update_fields") is None and \
+                not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.EXCHANGE_FIELDS]
+        # Обработчики post_save (журнал изменений, счётчики) выполняются в одной транзакции с записью предмета
+        with transaction.atomic(using=kwargs.get("using") or router.db_for_write(type(self), instance=self),
+                                savepoint=False):
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Категория и состояние на момент чтения: при их изменении пересчитываются фасеты каталога (ad.facets)
+        instance._loaded_facet_key = (instance.__dict__.get("category_id"), instance.__dict__.get("status"))
+        return instance
 
     def __str__(self):
         return self.name
@@ -77,11 +113,34 @@ class AdItem(models.Model):
 class ExchangeProposal(models.Model):
     """ Предложение бартерного обмена.
      Текущий хозяин вещи - 'sender_ad'  """
-    id = models.CharField(max_length=50, default=uuid.uuid4, primary_key=True, validators=(uuid_validator,))
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
     status = models.CharField(max_length=1, choices=EXCHANGE_PROPOSAL_STATUS, default="p", blank=False, validators=(exchange_item_validator,), verbose_name=gettext("exchange_status"))
-    sender = models.ForeignKey(AdItem, blank=False, on_delete=models.CASCADE, related_name="AdItem.id+", verbose_name=gettext("sender"))  # Текущий держатель вещи (инициатор заявки)
-    receiver = models.ForeignKey(AdItem, blank=False, on_delete=models.CASCADE, related_name="AdItem.id+", verbose_name=gettext("receiver"))  # Потенциальный получатель(новый хозяин), который должен одобрить обмен
+    sender = models.ForeignKey(AdItem, blank=False, on_delete=models.CASCADE, related_name="outgoing_proposals", verbose_name=gettext("sender"))  # Текущий держатель вещи (инициатор заявки)
+    receiver = models.ForeignKey(AdItem, blank=False, on_delete=models.CASCADE, related_name="incoming_proposals", verbose_name=gettext("receiver"))  # Потенциальный получатель(новый хозяин), который должен одобрить обмен
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=gettext("created_at"))
+    # Участники состоявшегося обмена (владельцы предметов на момент принятия) - для счётчиков сделок пользователей
+    sender_owner = models.ForeignKey(User, null=True, blank=True, default=None, editable=False,
+                                     on_delete=models.SET_NULL, related_name="+")
+    receiver_owner = models.ForeignKey(User, null=True, blank=True, default=None, editable=False,
+                                       on_delete=models.SET_NULL, related_name="+")
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("created_at", "id"), name="ad_proposal_created_keyset_idx"),  # Постраничный вывод (ad.pagination)
+            # Ожидающие предложения (status="p") предмета-получателя. Для предмета-отправителя - уникальный индекс ниже
+            models.Index(fields=("receiver", "sender"), name="ad_proposal_pending_in_idx",
+                         condition=models.Q(status="p")),
+        )
+        constraints = (
+            # Не более одного ожидающего предложения от предмета предмету (проверка повтора без гонки)
+            models.UniqueConstraint(fields=("sender", "receiver"), name="ad_proposal_pending_pair_uniq",
+                                    condition=models.Q(status="p")),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using") or router.db_for_write(type(self), instance=self),
+                                savepoint=False):
+            super().save(*args, **kwargs)
 
     def clean(self):
         if self.sender.id == self.receiver.id:
@@ -95,3 +154,59 @@ class ExchangeProposal(models.Model):
 
     def __str__(self):
         return f"{self.sender.name } --> {self.receiver.name}"
+
+
+class UserExchangeCounters(models.Model):
+    """ Сводка пользователя для панели /ad/dashboard/. Поддерживается приращениями (ad.counters),
+    расхождения исправляет команда reconcile_user_counters. """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="exchange_counters")
+    items_count = models.PositiveIntegerField(default=0)  # Предметы во владении
+    pending_in_count = models.PositiveIntegerField(default=0)  # Ожидающие предложения моим предметам
+    pending_out_count = models.PositiveIntegerField(default=0)  # Ожидающие предложения от моих предметов
+    completed_count = models.PositiveIntegerField(default=0)  # Состоявшиеся обмены
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class CatalogFacet(models.Model):
+    """ Кол-во предметов каталога с данной категорией и состоянием - фасеты фильтра каталога.
+    Поддерживается приращениями (ad.facets), расхождения исправляет команда rebuild_catalog_facets. """
+    category = models.ForeignKey(ArticleCategory, on_delete=models.CASCADE, related_name="+")
+    status = models.CharField(max_length=1, choices=ITEM_CONDITION)
+    items_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=("category", "status"), name="ad_catalog_facet_uniq"),
+        )
+
+    def __str__(self):
+        return f"{self.category_id}:{self.status}"
+
+
+JOURNAL_MODELS = (
+    ("i", "item"),  # AdItem
+    ("p", "proposal"),  # ExchangeProposal
+)
+
+
+JOURNAL_ACTIONS = (
+    ("c", "create"),
+    ("u", "update"),
+    ("d", "delete"),
+)
+
+
+class ChangeJournal(models.Model):
+    """ Журнал изменений предметов и предложений обмена для синхронизации внешних потребителей (ad.journal).
+    Запись добавляется в той же транзакции, что и изменение; seq - возрастающий номер записи. """
+    seq = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=1, choices=JOURNAL_MODELS)
+    object_id = models.UUIDField()
+    action = models.CharField(max_length=1, choices=JOURNAL_ACTIONS)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)  # Очистка по сроку хранения
+
+    def __str__(self):
+        return f"{self.seq} {self.model}:{self.object_id} {self.action}"
+
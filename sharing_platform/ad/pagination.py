@@ -0,0 +1,164 @@
+""" Постраничный вывод по ключу (keyset). Вместо OFFSET и COUNT(*) очередная страница выбирается условием
+'строго после последней показанной записи' по устойчивому порядку сортировки,
+поэтому стоимость запроса не зависит от глубины страницы. """
+import json
+import base64
+import binascii
+from collections import OrderedDict
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """ Непрозрачный курсор хранит значения полей сортировки крайней записи страницы и направление обхода.
+    Сортировка должна однозначно упорядочивать записи (последним полем идёт первичный ключ).
+    Представление может переопределить сортировку методом get_pagination_ordering(queryset). """
+    page_size = 3
+    page_size_query_param = "page_size"
+    max_page_size = 50
+    cursor_query_param = "cursor"
+    ordering = ("-created_at", "-id")
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self):
+        self.base_url = None
+        self.ordering_fields = ()
+        self.page = []
+        self.has_next = False
+        self.has_previous = False
+        self.page_size_value = self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, cursor = self.page_queryset(queryset, request, view)
+        return self.set_page(list(queryset), cursor)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """ То же для асинхронных представлений (ad.async_views). """
+        queryset, cursor = self.page_queryset(queryset, request, view)
+        return self.set_page([row async for row in queryset], cursor)
+
+    def page_queryset(self, queryset, request, view=None) -> tuple:
+        """ Запрос очередной страницы (на одну запись больше размера страницы) и разобранный курсор. """
+        self.base_url = request.build_absolute_uri()
+        self.page_size_value = self.get_page_size(request)
+        self.ordering_fields = self.get_ordering(queryset, view)
+        cursor = self.decode_cursor(request)
+        is_reverse = cursor is not None and cursor["r"]
+        ordering = [self._invert(field) for field in self.ordering_fields] if is_reverse else self.ordering_fields
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self._keyset_condition(queryset.model, ordering, cursor["p"]))
+        return queryset[:self.page_size_value + 1], cursor
+
+    def set_page(self, rows: list, cursor) -> list:
+        has_more = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        if cursor is not None and cursor["r"]:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = cursor is not None, has_more
+        return self.page
+
+    def get_paginated_data(self, data) -> OrderedDict:
+        return OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data)
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema
+            }
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, queryset, view) -> tuple:
+        get_ordering = getattr(view, "get_pagination_ordering", None)
+        if get_ordering is not None:
+            return tuple(get_ordering(queryset))
+        return tuple(self.ordering)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], is_reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], is_reverse=True)
+
+    def encode_cursor(self, instance, is_reverse: bool):
+        position = [self._position_value(instance, field.lstrip("-")) for field in self.ordering_fields]
+        raw = json.dumps({"p": position, "r": is_reverse}, separators=(",", ":"))
+        token = base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+        url = remove_query_param(self.base_url, "page")
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param, None)
+        if not token:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(cursor, dict) or not isinstance(cursor.get("p", None), list) or \
+                not len(cursor["p"]) == len(self.ordering_fields):
+            raise NotFound(self.invalid_cursor_message)
+        cursor["r"] = bool(cursor.get("r", False))
+        return cursor
+
+    def _keyset_condition(self, model, ordering, position) -> Q:
+        """ (f1 > v1) OR (f1 = v1 AND f2 > v2) OR ... - с учётом направления сортировки каждого поля. """
+        condition, equal_prefix = Q(), Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            value = self._parse_value(model, name, value)
+            lookup = f"{name}__lt" if field.startswith("-") else f"{name}__gt"
+            condition |= equal_prefix & Q(**{lookup: value})
+            equal_prefix &= Q(**{name: value})
+        return condition
+
+    def _parse_value(self, model, name, value):
+        try:
+            return model._meta.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            return value  # Аннотация (например, ранг полнотекстового поиска)
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _position_value(instance, name):
+        value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        if isinstance(value, (int, float, str, bool)) or value is None:
+            return value
+        return str(value)
+
+    @staticmethod
+    def _invert(field: str) -> str:
+        return field[1:] if field.startswith("-") else f"-{field}"
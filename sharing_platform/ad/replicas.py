@@ -0,0 +1,144 @@
+""" Чтение с реплик БД (AD_READ_REPLICAS).
+Маршрутизатор направляет на реплику только чтения внутри представлений, помеченных ReplicaReadMixin
+(каталог, страница предмета, списки обменов); запись и остальные чтения идут в основную БД.
+Клиент, выполнивший запись (предложение, ответ на предложение, отзыв), получает cookie, и в течение
+AD_REPLICA_STICKY_SECONDS его чтения тоже идут в основную БД - изменения видны сразу, до репликации.
+Для SQLite реплики - копии файла основной БД (replicate_sqlite, команда sync_replicas). """
+import random
+import sqlite3
+import typing
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+
+STICKY_COOKIE = "ad_primary"
+PRIMARY_ONLY_APPS = ("auth", "authtoken", "sessions")  # Проверка входа не должна зависеть от задержки репликации
+
+
+class ReplicaState:
+    """ Состояние маршрутизации в рамках одного запроса. """
+    def __init__(self, pinned=False):
+        self.pinned = pinned  # Все чтения - из основной БД
+        self.replica_reads = False  # Выполняется представление только для чтения
+        self.wrote = False  # В запросе была запись
+
+
+_state: ContextVar[typing.Optional[ReplicaState]] = ContextVar("ad_replica_state", default=None)
+
+
+def read_replicas() -> typing.List[str]:
+    return list(getattr(settings, "AD_READ_REPLICAS", ()))
+
+
+@contextmanager
+def replica_reads():
+    """ Чтения внутри блока можно направить на реплику (если клиент не закреплён за основной БД). """
+    state = _state.get()
+    token = None
+    if state is None:  # Вне replica_stickiness_middleware (команды, тесты)
+        state = ReplicaState()
+        token = _state.set(state)
+    previous, state.replica_reads = state.replica_reads, True
+    try:
+        yield state
+    finally:
+        state.replica_reads = previous
+        if token is not None:
+            _state.reset(token)
+
+
+class ReplicaReadMixin:
+    """ Представление только для чтения: его запросы выполняются на реплике. """
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        replicas = read_replicas()
+        if state is None or state.pinned or not state.replica_reads or not replicas or \
+                model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in read_replicas():
+            return False  # Схема и данные приходят на реплику репликацией
+        return None
+
+
+def _begin(request):
+    return _state.set(ReplicaState(pinned=STICKY_COOKIE in request.COOKIES))
+
+
+def _finish(request, response, token):
+    state = _state.get()
+    _state.reset(token)
+    if state.wrote and read_replicas():
+        response.set_cookie(STICKY_COOKIE, "1", max_age=getattr(settings, "AD_REPLICA_STICKY_SECONDS", 10),
+                            httponly=True, samesite="Lax")
+    return response
+
+
+@sync_and_async_middleware
+def replica_stickiness_middleware(get_response):
+    """ Закрепление клиента за основной БД после записи (read-your-writes). """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = _begin(request)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                _state.reset(token)
+                raise
+            return _finish(request, response, token)
+    else:
+        def middleware(request):
+            token = _begin(request)
+            try:
+                response = get_response(request)
+            except BaseException:
+                _state.reset(token)
+                raise
+            return _finish(request, response, token)
+    return middleware
+
+
+def replicate_sqlite(source=DEFAULT_DB_ALIAS, pages=-1) -> typing.List[str]:
+    """ Замена репликации для SQLite: снимок основной БД копируется в файл каждой реплики (backup API).
+    Возвращает псевдонимы обновлённых реплик. """
+    source_connection = connections[source]
+    if source_connection.vendor != "sqlite":
+        return []
+    source_connection.ensure_connection()
+    updated = []
+    for alias in read_replicas():
+        replica = connections[alias]
+        if replica.vendor != "sqlite" or replica.is_in_memory_db():
+            continue  # Реплика-зеркало тестовой БД или внешняя реплика СУБД
+        timeout = replica.settings_dict["OPTIONS"].get("timeout", 5)
+        target = sqlite3.connect(replica.settings_dict["NAME"], timeout=timeout)
+        try:
+            source_connection.connection.backup(target, pages=pages)
+        finally:
+            target.close()
+        updated.append(alias)
+    return updated
@@ -0,0 +1,152 @@
+""" Кеш ответов для анонимных пользователей (каталог, страница предмета).
+Ключ записи - путь, параметры строки запроса, формат ответа (format, Accept) и язык.
+Запись помечается тегами (item:<id>, catalog, ...); у каждого тега в кеше хранится метка версии.
+Изменение данных удаляет метки затронутых тегов, и записи с ними перестают считаться действительными.
+Кеш отвечает на условные запросы (If-None-Match / If-Modified-Since) статусом 304. """
+import time
+import typing
+import hashlib
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.translation import get_language
+from rest_framework.renderers import TemplateHTMLRenderer
+
+
+KEY_PREFIX = "ad:response:"
+TAG_PREFIX = "ad:response-tag:"
+CACHED_HEADERS = ("Content-Type", "Content-Language", "Vary")
+
+
+def item_tag(id_) -> str:
+    return f"item:{id_}"
+
+
+CATALOG_TAG = "catalog"  # Состав и порядок списков предметов (добавление, удаление, поля фильтров и поиска)
+
+
+class ResponseCache:
+    @staticmethod
+    def cache():
+        return caches[getattr(settings, "AD_RESPONSE_CACHE_ALIAS", "default")]
+
+    @property
+    def ttl(self) -> int:
+        return getattr(settings, "AD_RESPONSE_CACHE_TTL", 60)
+
+    @staticmethod
+    def is_cacheable(request) -> bool:
+        """ Проверка выполняется до аутентификации DRF: клиент с заголовком Authorization (токен, Basic)
+        не считается анонимным, даже если сессии у него нет. """
+        if request.method not in ("GET", "HEAD") or request.user.is_authenticated or \
+                "HTTP_AUTHORIZATION" in request.META:
+            return False
+        return not len(messages.get_messages(request))  # Непоказанные сообщения выводятся в шаблоне
+
+    @staticmethod
+    def make_key(request) -> str:
+        query = "&".join(sorted(f"{key}={value}" for key, value in request.GET.lists()))
+        parts = (request.path, query, request.META.get("HTTP_ACCEPT", ""), get_language() or "")
+        return KEY_PREFIX + hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def tag_versions(self, tags: typing.Iterable[str]) -> typing.Dict[str, int]:
+        """ Текущие метки тегов; отсутствующие создаются. """
+        tags = set(tags)
+        cache = self.cache()
+        versions = {key[len(TAG_PREFIX):]: value for key, value in
+                    cache.get_many([TAG_PREFIX + tag for tag in tags]).items()}
+        missing = {TAG_PREFIX + tag: time.time_ns() for tag in tags - set(versions)}
+        if missing:
+            cache.set_many(missing, timeout=None)
+            versions.update({key[len(TAG_PREFIX):]: value for key, value in missing.items()})
+        return versions
+
+    def invalidate(self, tags: typing.Iterable[str]):
+        """ Сбросить записи с указанными тегами после фиксации транзакции (раньше новые данные не видны). """
+        keys = [TAG_PREFIX + tag for tag in set(tags)]
+        transaction.on_commit(lambda: self.cache().delete_many(keys))
+
+    def get(self, request) -> typing.Optional[dict]:
+        entry = self.cache().get(self.make_key(request))
+        if entry is None:
+            return None
+        current = self.cache().get_many([TAG_PREFIX + tag for tag in entry["tags"]])
+        if any(current.get(TAG_PREFIX + tag) != version for tag, version in entry["tags"].items()):
+            return None
+        return entry
+
+    def set(self, request, response, tags: typing.Dict[str, int], csrf_token=None) -> dict:
+        entry = {
+            "content": response.content,
+            "status": response.status_code,
+            "headers": {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+            "etag": f'"{hashlib.md5(response.content).hexdigest()}"',
+            "last_modified": time.time(),
+            "csrf_token": csrf_token,
+            "tags": tags
+        }
+        self.cache().set(self.make_key(request), entry, timeout=self.ttl)
+        return entry
+
+    @staticmethod
+    def build_response(request, entry: dict) -> HttpResponse:
+        content = entry["content"]
+        if entry["csrf_token"] and entry["csrf_token"].encode() in content:
+            # Токен CSRF в разметке принадлежит посетителю, для которого страница была отрисована
+            content = content.replace(entry["csrf_token"].encode(), get_token(request).encode())
+        response = HttpResponse(content, status=entry["status"])
+        for name, value in entry["headers"].items():
+            response[name] = value
+        return response
+
+
+response_cache = ResponseCache()
+
+
+def finalize_headers(request, response, entry: dict):
+    """ Валидаторы кеша и ответ 304 на условный запрос. """
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(entry["last_modified"])
+    patch_vary_headers(response, ("Accept", "Cookie", "Authorization"))
+    return get_conditional_response(request, etag=entry["etag"], last_modified=int(entry["last_modified"]),
+                                    response=response)
+
+
+class CachedResponseMixin:
+    """ Кеширование ответов 200 для анонимных пользователей.
+    Представление задаёт теги записи: get_cache_tags - до формирования ответа, get_response_cache_tags - по данным
+    готового ответа (например, предметы на странице списка). Ответы, зависящие от пользователя, исключает
+    is_response_cacheable. """
+    def is_response_cacheable(self, request) -> bool:
+        return True
+
+    def get_cache_tags(self, request, *args, **kwargs) -> typing.Iterable[str]:
+        return ()
+
+    def get_response_cache_tags(self, response) -> typing.Iterable[str]:
+        return ()
+
+    def dispatch(self, request, *args, **kwargs):
+        if not (self.is_response_cacheable(request) and response_cache.is_cacheable(request)):
+            return super().dispatch(request, *args, **kwargs)
+        entry = response_cache.get(request)
+        if entry is not None:
+            return finalize_headers(request, response_cache.build_response(request, entry), entry)
+        tags = response_cache.tag_versions(self.get_cache_tags(request, *args, **kwargs))  # До чтения данных из БД
+        response = super().dispatch(request, *args, **kwargs)
+        if not response.status_code == 200 or response.streaming:
+            return response
+        csrf_token = None
+        if isinstance(getattr(response, "accepted_renderer", None), TemplateHTMLRenderer) and \
+                isinstance(response.data, dict):
+            # Значение из данных ответа перекрывает контекстный процессор csrf - токен в разметке известен заранее
+            csrf_token = response.data["csrf_token"] = get_token(request)
+        if hasattr(response, "render"):
+            response.render()
+        tags.update(response_cache.tag_versions(set(self.get_response_cache_tags(response)) - set(tags)))
+        return finalize_headers(request, response, response_cache.set(request, response, tags, csrf_token))
@@ -0,0 +1,169 @@
+""" Полнотекстовый поиск предметов обмена по названию и описанию.
+Бэкенд выбирается настройкой AD_SEARCH_BACKEND (путь до класса). """
+import re
+import typing
+from functools import lru_cache
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q, QuerySet
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from .models import AdItem
+
+
+FTS_TABLE_NAME = "ad_aditem_fts"
+FTS_KEYS_TABLE_NAME = "ad_aditem_search_keys"  # rowid строки индекса <-> id предмета
+MAX_KEYWORDS_COUNT = 10  # Максимально допустимое кол-во ключевых слов в рамках 1 запроса
+REBUILD_BATCH_SIZE = 2000
+
+
+def split_keywords(keywords: typing.Iterable[str]) -> list:
+    """ Привести ключевые слова к списку отдельных слов в нижнем регистре. """
+    words = []
+    for keyword in keywords:
+        words.extend(re.findall(r"\w+", str(keyword).lower()))
+    return list(dict.fromkeys(words))[:MAX_KEYWORDS_COUNT]
+
+
+class BaseSearchBackend:
+    """ Интерфейс поискового индекса. Синхронизация с таблицей AdItem - через сигналы (ad.signals). """
+    def filter(self, queryset: QuerySet, keywords: typing.Iterable[str]) -> QuerySet:
+        raise NotImplementedError
+
+    def setup(self, using: str):
+        """ Создать структуры индекса в БД (вызывается после migrate). """
+
+    def index_items(self, items: typing.Iterable[AdItem], created=False):
+        """ Добавить или обновить предметы в индексе. created - предметы только что созданы (в индексе их нет). """
+
+    def remove_items(self, ids: typing.Iterable):
+        """ Удалить предметы из индекса. """
+
+    def rebuild(self, batch_size=REBUILD_BATCH_SIZE, using=None) -> int:
+        """ Построить индекс с нуля. Возвращает кол-во проиндексированных предметов. """
+        return 0
+
+
+class ContainsSearchBackend(BaseSearchBackend):
+    """ Поиск без индекса (LIKE). Годится для СУБД без FTS. Каждое слово должно встретиться в названии или описании. """
+    def filter(self, queryset, keywords):
+        for word in split_keywords(keywords):
+            queryset = queryset.filter(Q(name__icontains=word) | Q(description__icontains=word))
+        return queryset
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """ Индекс на виртуальной таблице SQLite FTS5.
+    Слова ищутся по префиксу, совпадения по любому из слов ранжируются функцией bm25.
+    Строки индекса адресуются целочисленным rowid (у FTS5 это единственный ключ с поиском без полного просмотра),
+    соответствие rowid и id предмета хранит обычная таблица FTS_KEYS_TABLE_NAME с уникальным индексом по item_id. """
+    def filter(self, queryset, keywords):
+        if not connections[queryset.db].vendor == "sqlite":
+            return ContainsSearchBackend().filter(queryset, keywords)
+        query = self.build_query(keywords)
+        if not query:
+            return queryset.none()
+        table, keys_table, item_table = FTS_TABLE_NAME, FTS_KEYS_TABLE_NAME, AdItem._meta.db_table
+        matched = RawSQL(f"SELECT k.item_id FROM {table} JOIN {keys_table} k ON k.id = {table}.rowid "
+                         f"WHERE {table} MATCH %s", (query,))
+        rank = RawSQL(f"SELECT rank FROM {table} WHERE {table} MATCH %s AND rowid = "
+                      f"(SELECT k.id FROM {keys_table} k WHERE k.item_id = {item_table}.id)", (query,))
+        return queryset.filter(id__in=matched).annotate(search_rank=rank).order_by("search_rank")
+
+    @staticmethod
+    def build_query(keywords) -> str:
+        """ Составить выражение MATCH: "слово"* OR "слово"* ... """
+        return " OR ".join(f'"{word}"*' for word in split_keywords(keywords))
+
+    def setup(self, using):
+        connection = connections[using]
+        if not connection.vendor == "sqlite":
+            return
+        tables = connection.introspection.table_names()
+        if FTS_TABLE_NAME in tables and FTS_KEYS_TABLE_NAME not in tables:
+            self.rebuild(using=using)  # Индекс прежнего формата (строки по item_id без rowid) строится заново
+        else:
+            self._create_tables(connection)
+
+    def index_items(self, items, created=False):
+        items = list(items)
+        if not items:
+            return
+        using = router.db_for_write(AdItem)
+        if not connections[using].vendor == "sqlite":
+            return
+        ids = [(self._db_id(item.pk, using),) for item in items]
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            if not created:
+                self._delete(cursor, ids)
+            self._insert(cursor, ids, [(item.name, item.description) for item in items])
+
+    def remove_items(self, ids):
+        using = router.db_for_write(AdItem)
+        if not connections[using].vendor == "sqlite":
+            return
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            self._delete(cursor, [(self._db_id(id_, using),) for id_ in ids])
+
+    def rebuild(self, batch_size=REBUILD_BATCH_SIZE, using=None):
+        using = using or router.db_for_write(AdItem)
+        connection = connections[using]
+        if not connection.vendor == "sqlite":
+            return 0
+        counter = 0
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE_NAME}")
+                cursor.execute(f"DROP TABLE IF EXISTS {FTS_KEYS_TABLE_NAME}")
+            self._create_tables(connection)
+            rows = AdItem.objects.using(using).values_list("id", "name", "description").iterator(chunk_size=batch_size)
+            batch = []
+            for id_, name, description in rows:
+                batch.append((self._db_id(id_, using), name, description))
+                if len(batch) >= batch_size:
+                    counter += self._insert_rows(connection, batch)
+                    batch = []
+            counter += self._insert_rows(connection, batch)
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE_NAME} ({FTS_TABLE_NAME}) VALUES ('optimize')")
+        return counter
+
+    @staticmethod
+    def _create_tables(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {FTS_KEYS_TABLE_NAME} ("
+                           f"id integer NOT NULL PRIMARY KEY, item_id char(32) NOT NULL UNIQUE)")
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE_NAME} USING fts5("
+                           f"name, description, tokenize = 'unicode61 remove_diacritics 2')")
+
+    @staticmethod
+    def _delete(cursor, ids: list):
+        """ Удалить строки индекса по rowid (поиск по ключу, а не просмотр всей виртуальной таблицы). """
+        cursor.executemany(f"DELETE FROM {FTS_TABLE_NAME} WHERE rowid = "
+                           f"(SELECT id FROM {FTS_KEYS_TABLE_NAME} WHERE item_id = %s)", ids)
+        cursor.executemany(f"DELETE FROM {FTS_KEYS_TABLE_NAME} WHERE item_id = %s", ids)
+
+    @staticmethod
+    def _insert(cursor, ids: list, texts: list):
+        """ Выдать предметам rowid и добавить строки индекса с этими rowid. """
+        cursor.executemany(f"INSERT INTO {FTS_KEYS_TABLE_NAME} (item_id) VALUES (%s)", ids)
+        cursor.executemany(f"INSERT INTO {FTS_TABLE_NAME} (rowid, name, description) "
+                           f"SELECT id, %s, %s FROM {FTS_KEYS_TABLE_NAME} WHERE item_id = %s",
+                           [(*text, *id_) for id_, text in zip(ids, texts)])
+
+    @classmethod
+    def _insert_rows(cls, connection, rows) -> int:
+        if rows:
+            with connection.cursor() as cursor:
+                cls._insert(cursor, [row[:1] for row in rows], [row[1:] for row in rows])
+        return len(rows)
+
+    @staticmethod
+    def _db_id(value, using):
+        """ Значение первичного ключа в том виде, в каком оно хранится в таблице AdItem. """
+        return AdItem._meta.pk.get_db_prep_value(value, connections[using])
+
+
+@lru_cache(maxsize=None)
+def get_search_backend() -> BaseSearchBackend:
+    return import_string(getattr(settings, "AD_SEARCH_BACKEND", "ad.search.SQLiteFTSSearchBackend"))()
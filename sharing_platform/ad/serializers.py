@@ -1,13 +1,17 @@
 import uuid
 import typing
 from django import forms
-from django.db.transaction import atomic
 from django.utils.translation import gettext
 from rest_framework import serializers
-from .models import AdItem, ExchangeProposal, ITEM_CONDITION, ArticleCategory
+from .models import AdItem, ExchangeProposal, UserExchangeCounters, ITEM_CONDITION
+from .exchange import create_proposal
+from .thumbnails import thumbnail_url
+from .images import ingest_image
+from .categories import get_categories
 
 
 MAX_COUNT_CATEGORY = 30  # Максимально допустимое кол-во категорий в рамках 1 запроса
+MAX_BULK_EXCHANGE_SIZE = 500  # Максимально допустимое кол-во элементов пакетного запроса обмена
 
 
 def check_exchange_item_status(value):
@@ -18,7 +22,7 @@ def check_exchange_item_status(value):
 class AdItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = AdItem
-        exclude = ("exchange",)
+        exclude = ("pending_out_count", "pending_in_count",)
 
     def __init__(self, *a, request_user=None, **k):
         self.request_user = request_user
@@ -26,6 +30,15 @@ class AdItemSerializer(serializers.ModelSerializer):
     id = serializers.CharField(read_only=True)
     name = serializers.CharField(max_length=30, required=True, label=gettext("ad_item_name"))
     owner = serializers.HiddenField(default=None)
+    list_thumb = serializers.SerializerMethodField()  # Миниатюра для списков (или заглушка, пока не создана)
+
+    @staticmethod
+    def get_list_thumb(obj: AdItem):
+        return thumbnail_url(obj, "list_thumb")
+
+    @staticmethod
+    def validate_image(value):
+        return None if value is None else ingest_image(value)
 
     def create(self, validated_data):
         user = getattr(self, "request_user", None)
@@ -38,7 +51,7 @@ class AdItemSerializer(serializers.ModelSerializer):
 class ExchangeInitListSerializer(serializers.ModelSerializer):
     class Meta:
         model = AdItem
-        fields = "__all__"
+        exclude = ("pending_out_count", "pending_in_count",)
     is_has_my_request = serializers.BooleanField(read_only=True)
 
 
@@ -46,7 +59,7 @@ class InitialExchangeProposalSerializer(serializers.ModelSerializer):
     """ Сериализатор инициализирущий предложение обмена. """
     class Meta:
         model = ExchangeProposal
-        exclude = ("created_at",)
+        exclude = ("created_at", "sender_owner", "receiver_owner")
 
     def __init__(self, *a, request_user=None, sender=None, receiver=None, **k):
         self.request_user = request_user
@@ -54,6 +67,9 @@ class InitialExchangeProposalSerializer(serializers.ModelSerializer):
         self._receiver: typing.Optional[AdItem] = receiver
         super().__init__(*a, **k)
 
+    sender = serializers.PrimaryKeyRelatedField(read_only=True)  # Предметы передаются в конструктор уже загруженными
+    receiver = serializers.PrimaryKeyRelatedField(read_only=True)
+
     def validate(self, data):
         user = getattr(self, "request_user", None)
         if user is None:
@@ -68,12 +84,7 @@ class InitialExchangeProposalSerializer(serializers.ModelSerializer):
         raise serializers.ValidationError("Данный сериализатор не должен изменять данные.")
 
     def create(self, validated_data):
-        ad_items = [self._sender, self._receiver]
-        with atomic():
-            new_exchange = ExchangeProposal(**validated_data)
-            [ad_item.exchange.add(new_exchange) for ad_item in ad_items]
-            new_exchange.save()
-        return new_exchange
+        return create_proposal(self._sender, self._receiver, self.request_user.id, **validated_data)
 
 
 class ChangeStatusExchangeProposalSerializer(serializers.ModelSerializer):
@@ -91,7 +102,7 @@ class OfferListSerializer(serializers.ModelSerializer):
     """ Сериализатор для вывода сдвоенных предметов в рамках их взаимоотношений обмена """
     class Meta:
         model = ExchangeProposal
-        fields = "__all__"
+        exclude = ("sender_owner", "receiver_owner")
     sender = AdItemSerializer(read_only=True)
     receiver = AdItemSerializer(read_only=True)
     receiver_is_request_user = serializers.BooleanField(read_only=True, default=False)
@@ -101,18 +112,66 @@ class OfferListSerializer(serializers.ModelSerializer):
     username_receiver = serializers.CharField(read_only=True, default="")
 
 
+class OfferListFlatSerializer(serializers.Serializer):
+    """ Облегчённый вариант OfferListSerializer для JSON: плоские поля обоих предметов,
+    данные берутся из одного запроса (select_related sender/receiver и аннотации имён владельцев). """
+    id = serializers.UUIDField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    sender_id = serializers.UUIDField(read_only=True)
+    sender_name = serializers.CharField(source="sender.name", read_only=True)
+    sender_status = serializers.CharField(source="sender.status", read_only=True)
+    receiver_id = serializers.UUIDField(read_only=True)
+    receiver_name = serializers.CharField(source="receiver.name", read_only=True)
+    receiver_status = serializers.CharField(source="receiver.status", read_only=True)
+    username_sender = serializers.CharField(read_only=True, default="")
+    username_receiver = serializers.CharField(read_only=True, default="")
+    receiver_is_request_user = serializers.BooleanField(read_only=True, default=False)
+    sender_is_request_user = serializers.BooleanField(read_only=True, default=False)
+
+
+class UserExchangeCountersSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserExchangeCounters
+        fields = ("items_count", "pending_in_count", "pending_out_count", "completed_count")
+
+
+class OfferPairSerializer(serializers.Serializer):
+    sender = serializers.UUIDField()  # Предмет текущего пользователя
+    receiver = serializers.UUIDField()
+
+
+class BulkOfferSerializer(serializers.Serializer):
+    offers = serializers.ListField(child=OfferPairSerializer(), min_length=1, max_length=MAX_BULK_EXCHANGE_SIZE)
+
+
+class BulkCancelSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), min_length=1, max_length=MAX_BULK_EXCHANGE_SIZE)
+
+
+class DecisionSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    type = serializers.ChoiceField(choices=("accept", "reject"))
+
+
+class BulkDecisionSerializer(serializers.Serializer):
+    decisions = serializers.ListField(child=DecisionSerializer(), min_length=1, max_length=MAX_BULK_EXCHANGE_SIZE)
+
+
 def get_category_list(max_count=30):
-    i = list(ArticleCategory.objects.all()[:max_count].values_list("id", "name"))
+    i = list(get_categories(max_count))
     i.extend([(0, gettext("show_items_only_from_category"))])
     return i
 
 
 class AdListFilter(forms.Form):
     """ Простой сериализатор только для чтения. Форма для фильтрации списков элементов,
-    подставляющая необязательные параметры в строку запроса. """
-    tags = forms.BooleanField(label=gettext("enable_tags_search"))
-    tags_list = forms.CharField(max_length=500, label="",
-                                widget=forms.Textarea({"placeholder": gettext("set_your_tags_from_name_or_desc"),
-                                                       "style": "display: none", "class": "tags"}))
-    status = forms.ChoiceField(choices=ITEM_CONDITION, label="", initial="n")
-    category = forms.ChoiceField(choices=lambda: get_category_list(MAX_COUNT_CATEGORY), label="", initial=0)
+    подставляющая необязательные параметры в строку запроса.
+    Имена полей - параметры AdCatalog (keys, cat, status); пустые значения представление пропускает. """
+    keys = forms.CharField(max_length=500, label="", required=False,
+                           widget=forms.TextInput({"placeholder": gettext("set_your_tags_from_name_or_desc"),
+                                                   "class": "tags"}))
+    status = forms.ChoiceField(choices=(("", gettext("select_state")),) + ITEM_CONDITION[1:], label="",
+                               required=False, initial="")
+    cat = forms.ChoiceField(choices=lambda: get_category_list(MAX_COUNT_CATEGORY), label="", required=False,
+                            initial=0)
@@ -0,0 +1,120 @@
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.contrib.auth.models import User
+from .models import AdItem, ExchangeProposal, ArticleCategory, UserExchangeCounters
+from .categories import category_cache
+from .thumbnails import thumbnail_generated
+from .response_cache import response_cache, item_tag, CATALOG_TAG
+from .search import get_search_backend
+from .exchange import release_pending
+from .counters import new_deltas, add_pending_deltas, update_user_counters
+from .events import publish_proposal_events
+from .facets import update_facet_counts
+from .journal import record_changes, ITEM, PROPOSAL, CREATE, UPDATE, DELETE
+
+
+CATALOG_FIELDS = {"name", "description", "status", "category", "created_at"}  # Поля фильтров, поиска и сортировки
+
+
+@receiver(post_save, sender=AdItem)
+def index_ad_item(sender, instance: AdItem, created=False, raw=False, update_fields=None, **kwargs):
+    """ Поддерживать поисковый индекс в актуальном состоянии после сохранения предмета. """
+    if raw:
+        return  # loaddata
+    if update_fields is not None and not {"name", "description"} & set(update_fields):
+        return  # Индексируемые поля не менялись
+    get_search_backend().index_items([instance], created=created)
+
+
+@receiver(post_delete, sender=AdItem)
+def unindex_ad_item(sender, instance: AdItem, **kwargs):
+    get_search_backend().remove_items([instance.pk])
+
+
+@receiver(pre_delete, sender=AdItem)
+def release_ad_item_exchanges(sender, instance: AdItem, **kwargs):
+    """ Ожидающие предложения с участием предмета удалятся каскадно - счётчики второй стороны нужно уменьшить. """
+    rows = list(ExchangeProposal.objects.filter(Q(sender_id=instance.pk) | Q(receiver_id=instance.pk),
+                                                status="p").values_list("id", "sender_id", "receiver_id",
+                                                                        "sender__owner_id", "receiver__owner_id"))
+    release_pending([row[1:3] for row in rows])
+    deltas = add_pending_deltas(new_deltas(), [row[3:] for row in rows])
+    deltas[instance.owner_id]["items_count"] -= 1
+    update_user_counters(deltas)
+    publish_proposal_events("offer_cancelled", rows)
+    update_facet_counts({getattr(instance, "_loaded_facet_key", None) or (instance.category_id, instance.status): -1})
+
+
+@receiver(post_save, sender=AdItem)
+def count_created_ad_item(sender, instance: AdItem, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    key = (instance.category_id, instance.status)
+    if created:
+        deltas = new_deltas()
+        deltas[instance.owner_id]["items_count"] += 1
+        update_user_counters(deltas)
+        update_facet_counts({key: 1})
+    else:
+        loaded = getattr(instance, "_loaded_facet_key", None)
+        if loaded is not None and None not in loaded and loaded != key:  # Изменились категория или состояние
+            update_facet_counts({loaded: -1, key: 1})
+    instance._loaded_facet_key = key
+
+
+@receiver(post_save, sender=User)
+def create_user_counters(sender, instance: User, created=False, raw=False, **kwargs):
+    if created and not raw:
+        UserExchangeCounters.objects.bulk_create([UserExchangeCounters(user=instance)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=ArticleCategory)
+@receiver(post_delete, sender=ArticleCategory)
+def invalidate_category_cache(sender, **kwargs):
+    category_cache.invalidate()
+    response_cache.invalidate([CATALOG_TAG])  # Форма фильтра и фильтр по названию категории
+
+
+@receiver(post_save, sender=AdItem)
+def invalidate_ad_item_responses(sender, instance: AdItem, created=False, update_fields=None, **kwargs):
+    tags = [item_tag(instance.pk)]
+    if created or update_fields is None or CATALOG_FIELDS & set(update_fields):
+        tags.append(CATALOG_TAG)
+    response_cache.invalidate(tags)
+
+
+@receiver(post_delete, sender=AdItem)
+def invalidate_deleted_ad_item_responses(sender, instance: AdItem, **kwargs):
+    response_cache.invalidate([item_tag(instance.pk), CATALOG_TAG])
+
+
+@receiver(post_save, sender=AdItem)
+@receiver(post_save, sender=ExchangeProposal)
+def journal_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        record_changes([(ITEM if sender is AdItem else PROPOSAL, CREATE if created else UPDATE, instance.pk)])
+
+
+@receiver(post_delete, sender=AdItem)
+@receiver(post_delete, sender=ExchangeProposal)
+def journal_deleted(sender, instance, **kwargs):
+    record_changes([(ITEM if sender is AdItem else PROPOSAL, DELETE, instance.pk)])
+
+
+@receiver(post_save, sender=ExchangeProposal)
+@receiver(post_delete, sender=ExchangeProposal)
+def invalidate_exchange_responses(sender, instance: ExchangeProposal, **kwargs):
+    response_cache.invalidate([item_tag(instance.sender_id), item_tag(instance.receiver_id)])
+
+
+@receiver(thumbnail_generated)
+def invalidate_thumbnail_responses(sender, instance=None, **kwargs):
+    """ Страницы с заглушкой вместо миниатюры. """
+    if instance is not None:
+        response_cache.invalidate([item_tag(instance.pk)])
+
+
+def setup_search_index(sender, using, **kwargs):
+    """ Обработчик post_migrate: создать структуры поискового индекса. """
+    get_search_backend().setup(using)
@@ -1,46 +1,6 @@
-const PAGE_NUMBER_VAR = "page" // Имя параметра в url
 const ITEM_SHOW_PATHNAME = "ad/show/"  // Неполный путь до страницы просмотра предмета
 
 
-get_url_param_value = (name) => {
-    /* Получить значение параметра в url */
-    let params = document.location.search.split(RegExp(/\?|\&[A-Za-z]+\=[0-9]+/));
-    for (var r = 0; r < params.length; r++) {
-        var joined_value = params[r].split("=");
-        if (joined_value[0].slice(1, joined_value[0].length) == name) {
-            return joined_value[1];
-        }
-    }
-};
-get_new_location = (old_value, new_value, is_api, param_name) => {
-    /* Получить url, заменив (old_value) и/или добавив значение (new_value),
-     is_api == true - Добавит format=json,
-     is_api == false - Удалит format=json,
-
-     */
-    let params = document.location.search.split(RegExp(/\?|\&[A-Za-z]+\=[0-9]+/));
-    var cleaned_params = [];
-    for (var i = 0; i < params.length; i++) {
-        if (params[i].split("=")[0] == param_name) {
-            cleaned_params.push(params[i].replace(params[i].slice(params[i].indexOf("=") + 1, params[i].length - 1), new_value));
-        }
-        if (params[i] == "") {
-            continue
-        }
-        if (params[i] == document.location || params[i] == document.location.pathname ||
-         params[i] == document.location.origin) {
-            continue
-        }
-        cleaned_params.push(params[i]);
-    }
-    if (!cleaned_params.includes(param_name)) {
-        cleaned_params.push(param_name + "=" + new_value);
-    }
-    if (is_api) {
-        cleaned_params.push("format=json")
-        }
-    return document.location.pathname + "?" + cleaned_params.join("&")
-};
 remove_param = (param_name, url) => {
     /* Полностью удалить параметр и его значение из адресной строки */
     let params = (url || document.location.search).split(RegExp(/\?|\&[A-Za-z]+\=[0-9]+/));
@@ -85,7 +45,7 @@ list_element_factory = (data_raw, is_next_page) => {
         let li_elem = document.createElement("li");
         var img = document.createElement("img");
         if (data.image) {
-            img.src = data.image;
+            img.src = data.list_thumb;
         } else {
             img.src = "/static/ad/images/no_preview.png";
             img.class = "no-image";
@@ -113,91 +73,68 @@ list_element_factory = (data_raw, is_next_page) => {
         }
     }
 };
-load_prev = () => {
-        if (is_wait_response) {
-            return
-        }
-        var page_counter = Math.min(...loaded_pages_numbers);
-        if (page_counter <= 0) {
-            page_counter = 1;
-            return
-        }
-        var prev_page = page_counter - 1;
-        if (prev_page == 0) {
-            return
-        }
-        var is_wait_response = true;
-        fetch(get_new_location(page_counter, prev_page, true, "page"), {
-            headers: {
-                "X-Requested_With": "XMLHTTPRequest",
-                "X-CSRFToken": get_token(),
-                'Content-Type': 'application/json',
-            },
-            method: "GET"}).then(response => {
-                if (!response.ok) {
-                    var is_wait_response = false;
-                    throw new Error(response.status);
+to_api_url = (url) => {
+    /* Ссылка курсора с параметром format=json */
+    let api_url = new URL(url, document.location.origin);
+    api_url.searchParams.set("format", "json");
+    return api_url.toString();
+};
+to_page_url = (url) => {
+    /* Ссылка курсора для адресной строки, без format=json */
+    let page_url = new URL(url, document.location.origin);
+    page_url.searchParams.delete("format");
+    return page_url.pathname + page_url.search;
+};
+load_page = (url, is_next_page) => {
+    /* Загрузить соседнюю страницу по ссылке курсора из предыдущего ответа */
+    if (is_wait_response || !url) {
+        return
+    }
+    is_wait_response = true;
+    fetch(to_api_url(url), {
+        headers: {
+            "X-Requested_With": "XMLHTTPRequest",
+            "X-CSRFToken": get_token(),
+            'Content-Type': 'application/json',
+        },
+        method: "GET"}).then(response => {
+            if (!response.ok) {
+                is_wait_response = false;
+                throw new Error(response.status);
+            }
+            response.json().then((data) => {
+                if (typeof data === "string") {
+                    data = JSON.parse(data);
                 }
-                response.json().then((data) => {
-                    if (data) {
-                        list_element_factory(data, false);
-                        let new_path = get_new_location(page_counter, prev_page, false, "page")
-                        history.pushState(null, null, new_path);
-                        loaded_pages_numbers.push(prev_page);
-                        var is_wait_response = false;
+                if (data) {
+                    list_element_factory(data.results, is_next_page);
+                    if (is_next_page) {
+                        next_url = data.next;
+                        history.pushState(null, null, to_page_url(url));
+                    } else {
+                        prev_url = data.previous;
                     }
-                })
-      });
-    };
-load_next = (url) => {
-    if (is_wait_response) {
-            return
-        }
-    var is_wait_response = true;
-    var page_counter = Math.max(...loaded_pages_numbers);
-    var next_page = page_counter + 1;
-    var url = url || get_new_location(page_counter, next_page, true, "page");
-    fetch(url, { headers: {
-        "X-Requested_With": "XMLHTTPRequest",
-        "X-CSRFToken": get_token(),
-        'Content-Type': 'application/json',
-        }, method: "GET",
-    }).then((response) => {
-        if (!response.ok) {
-            var is_wait_response = false;
-            throw new Error(response.status);
-            }
-        response.json().then((data) => {
-            if (data) {
-                list_element_factory(data, true);
-                if (!url) {
-                let new_path = get_new_location(page_counter, next_page, false, "page");
-                history.pushState(null, null, new_path);
-                loaded_pages_numbers.push(next_page);
                 }
-                var is_wait_response = false;
-            }
-        })
+                is_wait_response = false;
+            })
     });
 };
+load_prev = () => {
+    load_page(prev_url, false);
+};
+load_next = () => {
+    load_page(next_url, true);
+};
 remove_all_elements_from_list = () => {
     document.querySelector(".items_row").innerHTML = "";
 };
 var is_wait_response = false;
-var current_page = get_current_page() || 1;
-var loaded_pages_numbers = [Number(current_page)];
+var next_url = get_next_url() || null;
+var prev_url = get_prev_url() || null;
 (function() {
-    if (get_url_param_value("page") == 1) {
-        var is_page_load_from_1_page = true;
-    } else {
-        var is_page_load_from_1_page = false;
-    }
     is_scroll_min_or_max = (event) => {
         const max_scroll_pos = document.body.scrollHeight - window.innerHeight;
         if (window.scrollY == 0) {
-        if (is_page_load_from_1_page) {
-            return
-        }
             load_prev();
         }
         if (window.scrollY == max_scroll_pos) {
@@ -0,0 +1,29 @@
+/* Обновление списка по событиям предложений обмена (Server-Sent Events) вместо периодической перезагрузки */
+const OFFER_EVENTS = ["offer_created", "offer_cancelled", "offer_accepted", "offer_rejected", "reset"];
+const REFRESH_DELAY_MS = 500;  // Несколько событий подряд - одна перезагрузка списка
+
+
+(function() {
+    if (!window.EventSource || !get_events_url()) {
+        return
+    }
+    var refresh_timer = null;
+    refresh_list = () => {
+        /* Перезагрузить текущую страницу списка */
+        refresh_timer = null;
+        if (is_wait_response) {
+            refresh_timer = setTimeout(refresh_list, REFRESH_DELAY_MS);
+            return
+        }
+        remove_all_elements_from_list();
+        load_page(document.location.href, true);
+    };
+    let source = new EventSource(get_events_url());  // Переподключение и Last-Event-ID - средствами браузера
+    for (var i = 0; i < OFFER_EVENTS.length; i++) {
+        source.addEventListener(OFFER_EVENTS[i], (event) => {
+            if (refresh_timer === null) {
+                refresh_timer = setTimeout(refresh_list, REFRESH_DELAY_MS);
+            }
+        });
+    }
+})();
@@ -0,0 +1,16 @@
+from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+from ad.categories import category_cache
+from ad.serializers import AdListFilter
+
+register = template.Library()
+
+
+@register.simple_tag
+def list_filter():
+    """ {% list_filter %} - форма фильтрации каталога. Разметка зависит только от категорий и языка,
+    поэтому отрисовывается один раз и хранится в кеше категорий. """
+    return mark_safe(category_cache.get(f"list_filter:{get_language()}",
+                                        lambda: render_to_string("ad/list-filter.html", {"form": AdListFilter()})))
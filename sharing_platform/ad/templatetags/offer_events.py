@@ -0,0 +1,10 @@
+from django import template
+from ad.events import is_event_stream_enabled
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def event_stream_enabled(context):
+    """ {% event_stream_enabled as enabled %} - подключать ли страницу к потоку событий предложений (ad.events). """
+    return is_event_stream_enabled(context.get("request"))
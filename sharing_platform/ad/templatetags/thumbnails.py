@@ -0,0 +1,10 @@
+from django import template
+from ad.thumbnails import thumbnail_url as get_thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(item, spec_name):
+    """ {% thumbnail_url ad 'preview_thumb' %} - URL миниатюры или заглушки, пока миниатюра не создана. """
+    return get_thumbnail_url(item, spec_name)
@@ -1,3 +1,1085 @@
-from django.test import TestCase
+import io
+import re
+import os
+import json
+import time
+import datetime
+import uuid
+import base64
+import tempfile
+import threading
+from unittest import mock
+from asgiref.sync import sync_to_async
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction, OperationalError
+from django.utils.connection import ConnectionDoesNotExist
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.template import Context, Template
+from django.templatetags.static import static
+from django.db.models import Q, Exists, OuterRef
+from rest_framework.renderers import JSONRenderer
+from rest_framework.authtoken.models import Token
+from ad_management.importer import iter_json_array, iter_ndjson, ImportFormatError
+from .benchmark import seed_dataset
+from .database import sqlite_pragmas
+from .categories import CategoryCache, category_cache, get_categories
+from .events import get_event_backend
+from .replicas import ReplicaRouter, replica_reads, STICKY_COOKIE
+from .facets import find_drifted_facets
+from .fast_serializers import FastJSONRenderer
+from .images import ingest_image
+from .journal import last_seq
+from .counters import find_drifted_users
+from .exchange import accept_proposal, create_proposal, expire_proposals, find_inconsistent_items, DuplicateProposal, \
+    ExchangeConflict
+from .loaders import ObjectLoader
+from .management.commands.benchmark_endpoints import Scenarios, route_names
+from .models import AdItem, ArticleCategory, ExchangeProposal, ChangeJournal
+from .search import get_search_backend, split_keywords
+from .thumbnails import PLACEHOLDER_IMAGE, THUMBNAIL_SPECS, generate_file, is_thumbnail_ready, thumbnail_url
+from .serializers import AdItemSerializer, ExchangeInitListSerializer, OfferListFlatSerializer
+from .views import AdCatalog, ExchangeAdList, ExchangeInitList
+from .urls import urlpatterns
 
-# Create your tests here.
+
+# Допустимое кол-во SQL-запросов на одно обращение к представлению (включая чтение сессии, пользователя
+# и точки сохранения транзакций). Списки - для страницы по умолчанию (3 элемента)
+QUERY_BUDGET = {
+    "show-ad": 3,
+    "exchange-init-list": 4,
+    # Каталог: страница и фасеты (ad.facets; для /request/ не считаются)
+    "all-ad-my": 4,
+    "all-ad-tome": 4,
+    "all-ad-can_request": 3,
+    "all-ad-my-ad-items": 4,
+    "all-ad": 4,
+    "post-ad": 3,
+    # Запись предложения включает UPDATE сводных счётчиков пользователей (ad.counters) и INSERT в журнал изменений
+    "exchange-offer": 10,
+    "destroy_offer": 10,  # Условный DELETE: обработчики post_delete требуют предварительной выборки удаляемых строк
+    "exchange-response": 11,
+    "offer-request-list": 4,
+    "user-dashboard": 3,
+    # Пакетные запросы: кол-во запросов не зависит от размера пакета, кроме принятия (точка сохранения и до 8 запросов
+    # на каждое принимаемое предложение; тест - 2 отклонения и 2 принятия)
+    "exchange-offer-bulk": 11,
+    "destroy_offer-bulk": 10,
+    "exchange-response-bulk": 25,
+}
+NOT_IMPLEMENTED_VIEWS = ("load-profile-input_ex", "load-profile-output_ex")  # Заглушки без реализации
+
+
+class QueryCountTestCase(TestCase):
+    """ Ограничения кол-ва запросов к БД для каждого представления из ad/urls.py. """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.other_user = User.objects.create_user(username="other", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.my_items = [AdItem.objects.create(name=f"my {i}", owner=cls.user, category=category) for i in range(5)]
+        cls.other_items = [AdItem.objects.create(name=f"other {i}", owner=cls.other_user, category=category)
+                           for i in range(5)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertMaxQueries(self, url_name, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLessEqual(len(context), QUERY_BUDGET[url_name],
+                             "\n".join(query["sql"] for query in context.captured_queries))
+        return response
+
+    def create_proposal(self, sender, receiver):
+        return self.client.post(reverse("exchange-offer", kwargs={"my_ad": sender.id, "other_ad": receiver.id}) +
+                                "?format=json", content_type="application/json")
+
+    def test_budget_covers_all_views(self):
+        names = {pattern.name for pattern in urlpatterns} - set(NOT_IMPLEMENTED_VIEWS)
+        self.assertSetEqual(names, set(QUERY_BUDGET))
+
+    def test_show_ad(self):
+        url = reverse("show-ad", kwargs={"id_": self.other_items[0].id})
+        self.assertEqual(self.assertMaxQueries("show-ad", "get", url, HTTP_ACCEPT="text/html").status_code, 200)
+        self.assertEqual(self.assertMaxQueries("show-ad", "get", url + "?format=json").status_code, 200)
+
+    def test_show_missing_ad_redirects(self):
+        url = reverse("show-ad", kwargs={"id_": uuid.uuid4()})
+        self.assertRedirects(self.client.get(url, HTTP_ACCEPT="text/html"), reverse("all-ad-my"), status_code=302)
+        self.client.logout()
+        self.assertRedirects(self.client.get(url, HTTP_ACCEPT="text/html"), reverse("all-ad"), status_code=302)
+
+    def test_catalog(self):
+        for url_name in ("all-ad-my", "all-ad-tome", "all-ad-can_request", "all-ad-my-ad-items", "all-ad"):
+            response = self.assertMaxQueries(url_name, "get", reverse(url_name) + "?format=json")
+            self.assertEqual(response.status_code, 200)
+
+    def test_catalog_facets(self):
+        category = ArticleCategory.objects.create(name="another")
+        item = AdItem.objects.create(name="new", owner=self.other_user, category=category, status="a")
+        AdItem.objects.create(name="used", owner=self.other_user, category=category, status="b")
+        response = self.assertMaxQueries("all-ad", "get", reverse("all-ad") + f"?format=json&cat={category.id}&status=a")
+        self.assertEqual([row["id"] for row in response.json()["results"]], [str(item.id)])
+        facets = response.json()["facets"]
+        self.assertEqual(facets["category"], [{"id": category.id, "name": "another", "count": 1}])  # С фильтром состояния
+        self.assertEqual(facets["status"], [{"value": "n", "count": 0}, {"value": "a", "count": 1},
+                                            {"value": "b", "count": 1}])  # С фильтром категории
+        item.status = "b"
+        item.save()
+        AdItem.objects.get(id=self.my_items[0].id).delete()
+        self.assertEqual(find_drifted_facets(), [])
+        facets = self.client.get(reverse("all-ad-my-ad-items") + "?format=json").json()["facets"]
+        self.assertEqual(facets["status"][0], {"value": "n", "count": 4})
+
+    def test_catalog_filter_form_submitted(self):
+        page = self.client.get(reverse("all-ad"), HTTP_ACCEPT="text/html").content.decode()
+        form = re.search(r'<form method="get" class="list-filter">.*?</form>', page, re.S).group()
+        self.assertSetEqual(set(re.findall(r'name="(\w+)"', form)), {"keys", "status", "cat"})
+        # Незаполненная форма: пустые ключевые слова и состояние, все категории
+        response = self.client.get(reverse("all-ad"), {"keys": "", "status": "", "cat": "0"},
+                                   HTTP_ACCEPT="text/html")
+        self.assertEqual(response.status_code, 200)
+        category = ArticleCategory.objects.create(name="another")
+        item = AdItem.objects.create(name="other lamp", owner=self.other_user, category=category, status="a")
+        AdItem.objects.create(name="other lamp used", owner=self.other_user, category=category, status="b")
+        response = self.client.get(reverse("all-ad"), {"keys": "lamp", "status": "a", "cat": str(category.id),
+                                                       "format": "json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["id"] for row in response.json()["results"]], [str(item.id)])
+
+    def test_post_ad_form(self):
+        self.assertEqual(self.assertMaxQueries("post-ad", "get", reverse("post-ad")).status_code, 200)
+
+    def test_exchange_offer(self):
+        url = reverse("exchange-offer", kwargs={"my_ad": self.my_items[0].id, "other_ad": self.other_items[0].id})
+        response = self.assertMaxQueries("exchange-offer", "post", url + "?format=json",
+                                         content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        response = self.assertMaxQueries("exchange-offer", "post", url + "?format=json",
+                                         content_type="application/json")
+        self.assertEqual(response.status_code, 422)
+
+    def test_destroy_offer(self):
+        self.create_proposal(self.my_items[0], self.other_items[0])
+        proposal = ExchangeProposal.objects.get()
+        url = reverse("destroy_offer", kwargs={"id_": proposal.id})
+        self.assertEqual(self.assertMaxQueries("destroy_offer", "delete", url + "?format=json").status_code, 204)
+        self.assertFalse(ExchangeProposal.objects.exists())
+
+    def test_destroy_offer_only_by_sender(self):
+        self.create_proposal(self.my_items[0], self.other_items[0])
+        proposal = ExchangeProposal.objects.get()
+        self.client.force_login(self.other_user)
+        url = reverse("destroy_offer", kwargs={"id_": proposal.id})
+        self.assertEqual(self.client.delete(url + "?format=json").status_code, 403)
+        self.assertTrue(ExchangeProposal.objects.exists())
+
+    def test_stale_item_save_keeps_counters(self):
+        sender, receiver = AdItem.objects.get(id=self.my_items[0].id), AdItem.objects.get(id=self.other_items[0].id)
+        create_proposal(sender, receiver, self.user.id)  # Счётчики изменены UPDATE с F(), экземпляры устарели
+        sender.name, receiver.name = "renamed", "renamed"
+        sender.save()
+        receiver.save()
+        self.assertEqual(AdItem.objects.filter(name="renamed").count(), 2)
+        self.assertFalse(find_inconsistent_items().exists())
+
+    def test_exchange_response(self):
+        self.create_proposal(self.my_items[0], self.other_items[0])
+        proposal = ExchangeProposal.objects.get()
+        self.client.force_login(self.other_user)
+        url = reverse("exchange-response", kwargs={"type_": "accept", "id_": proposal.id})
+        self.assertEqual(self.assertMaxQueries("exchange-response", "put", url + "?format=json").status_code, 202)
+        self.assertEqual(AdItem.objects.get(id=self.my_items[0].id).owner_id, self.other_user.id)
+
+    def test_offer_request_list(self):
+        for item in self.other_items[:3]:
+            self.create_proposal(self.my_items[0], item)
+        for type_ in ("in", "out", "all"):
+            url = reverse("offer-request-list", kwargs={"id_": self.my_items[0].id, "type_": type_})
+            self.assertEqual(self.assertMaxQueries("offer-request-list", "get", url + "?format=json").status_code, 200)
+
+    def test_exchange_init_list(self):
+        url = reverse("exchange-init-list", kwargs={"id_": self.other_items[0].id})
+        self.assertEqual(self.assertMaxQueries("exchange-init-list", "get", url + "?format=json").status_code, 200)
+
+    def post_bulk(self, url_name, data):
+        return self.assertMaxQueries(url_name, "post", reverse(url_name), data=data, content_type="application/json")
+
+    def test_bulk_offer(self):
+        offers = [{"sender": str(sender.id), "receiver": str(receiver.id)}
+                  for sender, receiver in zip(self.my_items, self.other_items)]
+        self.create_proposal(self.my_items[0], self.other_items[0])
+        offers += [{"sender": str(self.other_items[1].id), "receiver": str(self.my_items[1].id)},  # Чужой предмет
+                   {"sender": str(self.my_items[1].id), "receiver": str(self.my_items[2].id)},  # Обмен с собой
+                   offers[1]]  # Повтор в пакете
+        response = self.post_bulk("exchange-offer-bulk", {"offers": offers})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["result"] for result in response.json()["results"]],
+                         ["duplicate", *["created"] * 4, "forbidden", "invalid", "duplicate"])
+        self.assertEqual(ExchangeProposal.objects.filter(status="p").count(), 5)
+        self.assertFalse(find_inconsistent_items().exists())
+        self.assertEqual(self.post_bulk("exchange-offer-bulk", {"offers": []}).status_code, 400)
+
+    def test_bulk_cancel(self):
+        ids = [self.create_proposal(sender, receiver).json()["id"]
+               for sender, receiver in zip(self.my_items, self.other_items)]
+        self.client.force_login(self.other_user)
+        other_id = self.create_proposal(self.other_items[0], self.my_items[1]).json()["id"]
+        self.client.force_login(self.user)
+        response = self.post_bulk("destroy_offer-bulk", {"ids": [*ids, other_id, ids[0]]})
+        self.assertEqual(response.json()["summary"], {"cancelled": 5, "forbidden": 1, "duplicate": 1})
+        self.assertEqual(list(ExchangeProposal.objects.values_list("id", flat=True)), [uuid.UUID(other_id)])
+        self.assertFalse(find_inconsistent_items().exists())
+
+    def test_bulk_response(self):
+        self.client.force_login(self.other_user)
+        ids = [self.create_proposal(sender, self.my_items[0]).json()["id"] for sender in self.other_items[:4]]
+        self.client.force_login(self.user)
+        decisions = [{"id": ids[0], "type": "reject"}, {"id": ids[1], "type": "accept"},
+                     {"id": ids[2], "type": "accept"}, {"id": ids[3], "type": "reject"}]
+        response = self.post_bulk("exchange-response-bulk", {"decisions": decisions})
+        # Второе принятие: предложение уже отклонено первым принятием (тот же предмет)
+        self.assertEqual([result["result"] for result in response.json()["results"]],
+                         ["rejected", "accepted", "conflict", "rejected"])
+        self.assertEqual(AdItem.objects.get(id=self.my_items[0].id).owner_id, self.other_user.id)
+        self.assertEqual(AdItem.objects.get(id=self.other_items[1].id).owner_id, self.user.id)
+        self.assertFalse(find_inconsistent_items().exists())
+
+    def test_user_dashboard(self):
+        self.create_proposal(self.my_items[0], self.other_items[0])
+        self.create_proposal(self.my_items[1], self.other_items[0])
+        response = self.assertMaxQueries("user-dashboard", "get", reverse("user-dashboard"))
+        self.assertEqual(response.json(), {"items_count": 5, "pending_in_count": 0, "pending_out_count": 2,
+                                           "completed_count": 0})
+
+
+class ExchangeConcurrencyTestCase(TransactionTestCase):
+    """ Одновременные операции с предложениями обмена из нескольких потоков (у каждого потока своё соединение). """
+    threads = 8
+
+    def setUp(self):
+        self.category = ArticleCategory.objects.create(name="category")
+        self.users = [User.objects.create_user(username=f"user {i}") for i in range(self.threads + 1)]
+
+    def run_threads(self, func, args_list) -> list:
+        """ Запустить func(*args) во всех потоках одновременно; результат - значение или исключение. """
+        barrier = threading.Barrier(len(args_list))
+        results = [None] * len(args_list)
+
+        def target(index, args):
+            barrier.wait()
+            try:
+                results[index] = self.retry_locked(lambda: func(*args))
+            except Exception as error:  # Результат проверяется тестом
+                results[index] = error
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=target, args=(index, args)) for index, args in enumerate(args_list)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    @staticmethod
+    def retry_locked(func, attempts=200):
+        """ БД SQLite в памяти (тестовая) разделяет кеш между соединениями: блокировка таблицы возвращается
+        сразу, без ожидания busy_timeout. Операция повторяется, как повторил бы её клиент. """
+        for attempt in range(attempts):
+            try:
+                return func()
+            except OperationalError as error:
+                if "locked" not in str(error) or attempt == attempts - 1:
+                    raise
+                time.sleep(0.005)
+
+    def create_item(self, owner):
+        return AdItem.objects.create(name="item", owner=owner, category=self.category)
+
+    @staticmethod
+    def load_proposals(proposals) -> list:
+        """ Предложения с предметами, прочитанные до начала гонки (как их прочитал бы каждый запрос). """
+        loader = ObjectLoader()
+        return [(loader.proposal(proposal.id),) for proposal in proposals]
+
+    def test_item_transferred_once(self):
+        owner, *senders = self.users
+        target = self.create_item(owner)
+        sender_items = [self.create_item(user) for user in senders]
+        proposals = [create_proposal(item, target, item.owner_id) for item in sender_items]
+        results = self.run_threads(accept_proposal, self.load_proposals(proposals))
+        winners = [item for item, result in zip(sender_items, results) if not isinstance(result, Exception)]
+        self.assertEqual(len(winners), 1, results)
+        self.assertTrue(all(isinstance(result, ExchangeConflict) or result == len(proposals) - 1
+                            for result in results), results)
+        self.assertEqual(ExchangeProposal.objects.filter(status="s").count(), 1)
+        self.assertEqual(ExchangeProposal.objects.filter(status="r").count(), len(proposals) - 1)
+        self.assertEqual(AdItem.objects.get(id=target.id).owner_id, winners[0].owner_id)
+        self.assertEqual(AdItem.objects.get(id=winners[0].id).owner_id, owner.id)
+        self.assertEqual(AdItem.objects.filter(owner=owner).count(), 1)  # Владелец отдал один предмет и получил один
+        self.assertEqual(AdItem.objects.get(id=target.id).version, 1)
+        self.assertFalse(find_inconsistent_items().exists())
+
+    def test_disjoint_accepts_all_succeed(self):
+        """ Обмены разных пар предметов не конфликтуют между собой. """
+        pairs = [(self.create_item(self.users[i]), self.create_item(self.users[i + 1])) for i in range(self.threads)]
+        proposals = [create_proposal(sender, receiver, sender.owner_id) for sender, receiver in pairs]
+        started = time.perf_counter()
+        results = self.run_threads(accept_proposal, self.load_proposals(proposals))
+        elapsed = time.perf_counter() - started
+        self.assertEqual(results, [0] * len(proposals), results)
+        self.assertEqual(ExchangeProposal.objects.filter(status="s").count(), len(proposals))
+        self.assertLess(elapsed, 10)
+        self.assertFalse(find_inconsistent_items().exists())
+
+    def test_accept_races_new_offers(self):
+        """ Новые предложения предмету во время принятия: либо отклонены этим принятием, либо не созданы. """
+        owner, first, *senders = self.users
+        target = self.create_item(owner)
+        proposal = create_proposal(self.create_item(first), target, first.id)
+        sender_items = [self.create_item(user) for user in senders]
+        results = self.run_threads(lambda func, *args: func(*args), [
+            (accept_proposal, *self.load_proposals([proposal])[0]),
+            *((create_proposal, item, target, item.owner_id) for item in sender_items)])
+        self.assertEqual(results[0], sum(isinstance(result, ExchangeProposal) for result in results[1:]), results)
+        self.assertTrue(all(isinstance(result, (ExchangeProposal, ExchangeConflict)) for result in results[1:]))
+        self.assertFalse(ExchangeProposal.objects.filter(status="p").exists())
+        self.assertFalse(find_inconsistent_items().exists())
+        self.assertEqual(find_drifted_users(), [])
+
+    def test_duplicate_offer_created_once(self):
+        sender, receiver = self.create_item(self.users[0]), self.create_item(self.users[1])
+        results = self.run_threads(create_proposal, [(sender, receiver, sender.owner_id)] * self.threads)
+        self.assertEqual(sum(isinstance(result, ExchangeProposal) for result in results), 1, results)
+        self.assertTrue(all(isinstance(result, (ExchangeProposal, DuplicateProposal)) for result in results), results)
+        self.assertEqual(AdItem.objects.get(id=sender.id).pending_out_count, 1)
+        self.assertEqual(AdItem.objects.get(id=receiver.id).pending_in_count, 1)
+
+
+@override_settings(AD_EVENT_STREAM_MAX_DURATION=0.2, AD_EVENT_KEEPALIVE=0.1)
+class OfferEventsTestCase(TestCase):
+    """ Поток Server-Sent Events предложений обмена (/ad/async/events/). """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.other_user = User.objects.create_user(username="other", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.my_item = AdItem.objects.create(name="my", owner=cls.user, category=category)
+        cls.other_item = AdItem.objects.create(name="other", owner=cls.other_user, category=category)
+
+    def offer(self) -> ExchangeProposal:
+        with self.captureOnCommitCallbacks(execute=True):  # События публикуются после фиксации транзакции
+            return create_proposal(self.my_item, self.other_item, self.user.id)
+
+    async def read_stream(self, **kwargs) -> bytes:
+        await sync_to_async(self.async_client.force_login)(self.other_user)
+        response = await self.async_client.get(reverse("async-offer-events"), **kwargs)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    async def test_missed_events_replayed(self):
+        last_event_id = get_event_backend().current_id()
+        proposal = await sync_to_async(self.offer)()
+        stream = await self.read_stream(headers={"Last-Event-ID": str(last_event_id)})
+        self.assertIn(b'event: offer_created\ndata: {"id":"%s"' % str(proposal.id).encode(), stream)
+        self.assertNotIn(b"event: reset", stream)
+        # Номер старше хранимой истории - пропущенные события недоступны
+        self.assertIn(b"event: reset", await self.read_stream(data={"last_event_id": 1}))
+
+    async def test_live_events_for_subscribed_user(self):
+        await sync_to_async(self.async_client.force_login)(self.other_user)
+        response = await self.async_client.get(reverse("async-offer-events"))
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+        self.assertIn(b"event: ready", await anext(stream))
+        backend = get_event_backend()
+        backend.publish("offer_created", [self.user.id], {"id": "not-for-other-user"})
+        event = backend.publish("offer_cancelled", [self.user.id, self.other_user.id], {"id": "proposal"})
+        self.assertEqual(await anext(stream), b'id: %d\nevent: offer_cancelled\ndata: {"id":"proposal"}\n\n' % event.id)
+        self.assertEqual({chunk async for chunk in stream}, {b": keepalive\n\n"})  # До закрытия потока
+
+    async def test_pages_subscribe_only_under_asgi(self):
+        url = reverse("all-ad-my")
+        await sync_to_async(self.client.force_login)(self.user)
+        await sync_to_async(self.async_client.force_login)(self.user)
+        wsgi_page = await sync_to_async(self.client.get)(url, HTTP_ACCEPT="text/html")
+        self.assertNotContains(wsgi_page, "offer-events.js")  # Под WSGI поток держал бы рабочий поток
+        self.assertContains(await self.async_client.get(url, headers={"Accept": "text/html"}), reverse("async-offer-events"))
+        with override_settings(AD_EVENT_STREAM_ENABLED=True):
+            self.assertContains(await sync_to_async(self.client.get)(url, HTTP_ACCEPT="text/html"), "offer-events.js")
+
+
+class ChangeFeedTestCase(TestCase):
+    """ Лента изменений /api/changes/ по журналу ad.journal. """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username="admin", password="password", is_staff=True)
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.category = ArticleCategory.objects.create(name="category")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def read_feed(self, **params) -> list:
+        response = self.client.get(reverse("change-feed"), params)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_changes_since(self):
+        since = last_seq()
+        item = AdItem.objects.create(name="item", owner=self.admin, category=self.category)
+        other = AdItem.objects.create(name="other", owner=self.user, category=self.category)
+        proposal = create_proposal(item, other, self.admin.id)
+        accept_proposal(ExchangeProposal.objects.select_related("sender", "receiver").get(id=proposal.id))
+        other.delete()
+        *changes, trailer = self.read_feed(since=since)
+        self.assertEqual([(change["model"], change["action"]) for change in changes], [
+            ("item", "create"), ("item", "create"), ("proposal", "create"),
+            ("proposal", "update"), ("item", "update"), ("item", "update"),
+            ("proposal", "delete"), ("item", "delete")])
+        self.assertEqual(changes[0]["data"]["owner_id"], self.user.id)  # Текущее состояние предмета
+        self.assertIsNone(changes[1]["data"])  # Предмет удалён
+        self.assertEqual(trailer, {"next_since": changes[-1]["seq"], "has_more": False})
+        *changes, trailer = self.read_feed(since=since, limit=2)
+        self.assertEqual(trailer, {"next_since": changes[-1]["seq"], "has_more": True})
+        self.assertEqual(self.read_feed(since=trailer["next_since"])[0]["action"], "create")  # Продолжение с proposal
+
+    def test_pruned_journal(self):
+        AdItem.objects.create(name="item", owner=self.admin, category=self.category)
+        AdItem.objects.create(name="item", owner=self.admin, category=self.category)
+        ChangeJournal.objects.filter(seq__lt=last_seq()).delete()
+        response = self.client.get(reverse("change-feed"), {"since": 0})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()["last_seq"], last_seq())
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("change-feed")).status_code, 403)
+
+
+class ChangeJournalOrderTestCase(TransactionTestCase):
+    """ Номера журнала фиксируются по возрастанию: транзакция, получившая номер позже, не зафиксируется раньше
+    открытой транзакции с меньшим номером (иначе лента сдвинула бы since за ещё невидимую запись). """
+    def test_later_writer_waits_for_open_transaction(self):
+        category = ArticleCategory.objects.create(name="category")
+        owner = User.objects.create_user(username="user")
+        since = last_seq()
+        first_recorded, order = threading.Event(), []
+
+        def first():
+            try:
+                with transaction.atomic():
+                    AdItem.objects.create(name="first", owner=owner, category=category)
+                    first_recorded.set()
+                    time.sleep(0.2)  # Вторая транзакция пытается записать и зафиксироваться в это время
+                order.append("first")
+            finally:
+                first_recorded.set()
+                connection.close()
+
+        def second():
+            first_recorded.wait()
+            try:
+                ExchangeConcurrencyTestCase.retry_locked(
+                    lambda: AdItem.objects.create(name="second", owner=owner, category=category))
+                order.append("second")
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=target) for target in (first, second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["first", "second"])
+        entries = ChangeJournal.objects.filter(seq__gt=since, model="i").order_by("seq")
+        self.assertEqual([AdItem.objects.get(id=entry.object_id).name for entry in entries], ["first", "second"])
+
+
+class SearchTestCase(TestCase):
+    """ Поиск предметов каталога по ключевым словам (ad.search). """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.red_mug = AdItem.objects.create(name="Красная кружка", description="Керамическая кружка",
+                                            owner=cls.user, category=category)
+        cls.blue_mug = AdItem.objects.create(name="Синяя кружка", owner=cls.user, category=category)
+        cls.iron = AdItem.objects.create(name="Утюг", description="Красный корпус", owner=cls.user, category=category)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, keys) -> list:
+        response = self.client.get(reverse("all-ad"), {"format": "json", "keys": json.dumps(keys)})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_split_keywords(self):
+        self.assertEqual(split_keywords(["Красная, КРУЖКА", "кружка"]), ["красная", "кружка"])
+
+    def test_prefix_match(self):
+        ids = set(get_search_backend().filter(AdItem.objects.all(), ["кружк"]).values_list("id", flat=True))
+        self.assertSetEqual(ids, {self.red_mug.id, self.blue_mug.id})
+
+    def test_ranking(self):
+        # Совпадения по обоим словам выше совпадений по одному
+        self.assertEqual(self.search(["красн", "кружка"])[0], str(self.red_mug.id))
+        self.assertEqual(set(self.search(["красн", "кружка"])), {str(self.red_mug.id), str(self.blue_mug.id),
+                                                                str(self.iron.id)})
+
+    def test_index_follows_changes(self):
+        self.blue_mug.name = "Синий чайник"
+        self.blue_mug.save()
+        self.iron.delete()
+        self.assertEqual(self.search(["чайник"]), [str(self.blue_mug.id)])
+        self.assertEqual(self.search(["кружка"]), [str(self.red_mug.id)])
+        self.assertEqual(self.search(["утюг"]), [])
+
+    def test_index_rows_keyed_by_rowid(self):
+        with CaptureQueriesContext(connection) as queries:
+            AdItem.objects.create(name="Чайник", owner=self.user, category=self.red_mug.category)
+        self.assertFalse([query for query in queries if "DELETE" in query["sql"]])  # Новый предмет: без удаления
+        self.red_mug.description = ""
+        with CaptureQueriesContext(connection) as queries:
+            self.red_mug.save()
+        deletes = [query["sql"].partition(": ")[2] for query in queries  # executemany: "N times: <sql>"
+                   if "DELETE FROM ad_aditem_fts " in query["sql"]]
+        self.assertEqual(len(deletes), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {deletes[0]}", [self.red_mug.id.hex])
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertIn("SCAN ad_aditem_fts VIRTUAL TABLE INDEX 0:=", plan)  # Поиск строки по rowid
+        self.assertEqual(self.search(["керамическая"]), [])
+
+    def test_legacy_index_rebuilt(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE ad_aditem_search_keys")
+            cursor.execute("DROP TABLE ad_aditem_fts")
+            cursor.execute("CREATE VIRTUAL TABLE ad_aditem_fts USING fts5(item_id UNINDEXED, name, description)")
+        get_search_backend().setup(connection.alias)
+        self.assertEqual(self.search(["утюг"]), [str(self.iron.id)])
+
+
+class KeysetPaginationTestCase(TestCase):
+    """ Постраничный вывод по курсору (ad.pagination). """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.items = [AdItem.objects.create(name=f"лампа {i}", owner=cls.user, category=category) for i in range(7)]
+        AdItem.objects.filter(id__in=[item.id for item in cls.items[2:6]]).update(
+            created_at=cls.items[2].created_at)  # Одинаковое время: порядок определяет -id
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_page(self, url, **params) -> dict:
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, **params) -> list:
+        """ Обход по ссылкам next: id предметов каждой страницы и последний ответ. """
+        data = self.get_page(reverse("all-ad"), format="json", page_size=2, **params)
+        pages = [[row["id"] for row in data["results"]]]
+        while data["next"]:
+            data = self.get_page(data["next"])
+            pages.append([row["id"] for row in data["results"]])
+        return pages, data
+
+    def test_pages_cover_all_items_once(self):
+        pages, last = self.walk()
+        expected = [str(id_) for id_ in AdItem.objects.order_by("-created_at", "-id").values_list("id", flat=True)]
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        previous = self.get_page(last["previous"])  # Обратный обход возвращает предыдущую страницу
+        self.assertEqual([row["id"] for row in previous["results"]], pages[-2])
+        self.assertIsNotNone(previous["next"])
+
+    def test_search_rank_cursor(self):
+        pages, _ = self.walk(keys=json.dumps(["лампа"]))
+        self.assertEqual(sorted(sum(pages, [])), sorted(str(item.id) for item in self.items))
+
+    def test_search_rank_pages_in_relevance_order(self):
+        category = self.items[0].category
+        best = AdItem.objects.create(name="торшер торшер", description="торшер", owner=self.user, category=category)
+        good = AdItem.objects.create(name="торшер", description="торшер", owner=self.user, category=category)
+        worse = AdItem.objects.create(name="торшер", description="напольный светильник", owner=self.user,
+                                      category=category)
+        pages, _ = self.walk(keys=json.dumps(["торшер"]))  # Разный ранг: курсор учитывает search_rank
+        self.assertEqual(pages, [[str(best.id), str(good.id)], [str(worse.id)]])
+
+    def test_invalid_cursor(self):
+        for cursor in ("not-base64!", "eyJwIjogMX0=", "eyJwIjpbIngiLCJ5Il19"):  # Мусор, p не список, неверная дата
+            response = self.client.get(reverse("all-ad"), {"format": "json", "cursor": cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class BulkImportTestCase(TestCase):
+    """ Потоковая загрузка предметов /api/bulk-json-load/ (ad_management.importer). """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username="admin", password="password", is_staff=True)
+        cls.category = ArticleCategory.objects.create(name="category")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def row(self, name, **fields) -> dict:
+        return {"name": name, "status": "a", "category": self.category.id, "owner": self.admin.id, **fields}
+
+    def test_json_array_read_in_chunks(self):
+        body = json.dumps({"ads": [self.row("Чайник «Ёж»"), [1, 2], {"nested": {"a": "]"}}]}, ensure_ascii=False)
+        rows = list(iter_json_array(io.BytesIO(body.encode("utf-8")), chunk_size=3))  # Символы делятся между частями
+        self.assertEqual(rows, json.loads(body)["ads"])
+        self.assertEqual(list(iter_json_array(io.BytesIO(b'{"ads": []}'))), [])
+        with self.assertRaises(ImportFormatError):
+            list(iter_json_array(io.BytesIO(b'{"items": []}')))
+
+    def test_ndjson_bad_line(self):
+        rows = list(iter_ndjson(io.BytesIO(b'{"a": 1}\n\nnot json\n{"b": 2}\n')))
+        self.assertEqual(rows[0], {"a": 1})
+        self.assertIsInstance(rows[1], ImportFormatError)
+        self.assertEqual(rows[2], {"b": 2})
+
+    def test_import_in_batches(self):
+        rows = [self.row(f"item {i}") for i in range(5)]
+        rows[2] = self.row("item 2", category=0)  # Нет такой категории
+        rows.append("not an object")
+        response = self.client.post(reverse("ad-json-loader") + "?batch_size=2", json.dumps({"ads": rows}),
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report["created"], report["failed"]), (4, 2))
+        self.assertEqual([error["row"] for error in report["errors"]], [3, 6])
+        self.assertEqual(AdItem.objects.filter(owner=self.admin).count(), 4)
+        self.assertEqual(find_drifted_facets(), [])
+        self.assertEqual(get_search_backend().filter(AdItem.objects.all(), ["item"]).count(), 4)
+
+    def test_failed_batch_leaves_no_images(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), "red").save(buffer, format="PNG")
+        body = json.dumps({"ads": [self.row("with image", image=base64.b64encode(buffer.getvalue()).decode())]})
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                mock.patch("ad_management.importer.update_facet_counts", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse("ad-json-loader"), body, content_type="application/json")
+            self.assertEqual([files for _, _, files in os.walk(media_root) if files], [])
+        self.assertFalse(AdItem.objects.filter(name="with image").exists())
+
+    def test_import_ndjson(self):
+        body = "\n".join(json.dumps(row) for row in (self.row("first"), self.row("second")))
+        response = self.client.post(reverse("ad-json-loader"), body, content_type="application/x-ndjson")
+        self.assertEqual(response.json()["created"], 2)
+        response = self.client.post(reverse("ad-json-loader"), '{"ads": [{"name": ""}]}',
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)  # Ни одна запись не загружена
+
+
+class ThumbnailTestCase(TestCase):
+    """ Заблаговременное создание миниатюр (ad.thumbnails). Пул потоков заменён очередью, разбираемой в тесте. """
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username="user")
+        cls.category = ArticleCategory.objects.create(name="category")
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        caches["default"].clear()  # Состояние файлов миниатюр django-imagekit
+        self.submitted = []
+        executor = mock.Mock(submit=lambda function, file: self.submitted.append(file))
+        patcher = mock.patch("ad.thumbnails.get_executor", return_value=executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def image_content(color) -> ContentFile:
+        buffer = io.BytesIO()
+        Image.new("RGB", (80, 60), color).save(buffer, format="PNG")
+        return ContentFile(buffer.getvalue())
+
+    def save_image(self, item, color):
+        with self.captureOnCommitCallbacks(execute=True):
+            item.image.save("photo.png", self.image_content(color), save=False)
+            item.save()
+
+    def run_queue(self):
+        files, self.submitted = self.submitted, []
+        for file in files:
+            self.assertTrue(generate_file(file))
+
+    def render(self, item) -> str:
+        return Template("{% load thumbnails %}{% thumbnail_url ad 'list_thumb' %}").render(Context({"ad": item}))
+
+    def test_placeholder_until_generated(self):
+        item = AdItem(name="item", owner=self.owner, category=self.category)
+        self.save_image(item, "red")
+        self.assertEqual({file.name for file in self.submitted}, {getattr(item, spec).name for spec in THUMBNAIL_SPECS})
+        self.assertEqual(self.render(item), static(PLACEHOLDER_IMAGE))
+        self.run_queue()
+        self.assertEqual(self.render(item), item.list_thumb.url)
+        self.assertTrue(item.list_thumb.storage.exists(item.list_thumb.name))
+
+    def test_image_change_reschedules(self):
+        item = AdItem(name="item", owner=self.owner, category=self.category)
+        self.save_image(item, "red")
+        self.run_queue()
+        item = AdItem.objects.get(id=item.id)
+        old_name = item.list_thumb.name
+        self.save_image(item, "blue")
+        self.assertIn(item.list_thumb.name, {file.name for file in self.submitted})
+        self.assertNotEqual(item.list_thumb.name, old_name)
+        self.assertEqual(thumbnail_url(item, "list_thumb"), static(PLACEHOLDER_IMAGE))
+        self.run_queue()
+        self.assertEqual(thumbnail_url(item, "list_thumb"), item.list_thumb.url)
+
+    def test_command_backfills_missing(self):
+        item = AdItem(name="item", owner=self.owner, category=self.category)
+        self.save_image(item, "red")
+        self.assertFalse(is_thumbnail_ready(item.preview_thumb))
+        call_command("generate_thumbnails", workers=1, stdout=io.StringIO())
+        item = AdItem.objects.get(id=item.id)
+        for spec_name in THUMBNAIL_SPECS:
+            file = getattr(item, spec_name)
+            self.assertTrue(file.storage.exists(file.name), spec_name)
+        self.assertEqual(thumbnail_url(item, "preview_thumb"), item.preview_thumb.url)
+
+
+class ImageIngestTestCase(TestCase):
+    """ Приём изображений предметов (ad.images). """
+    @staticmethod
+    def image_file(size=(40, 20), color="red", image_format="JPEG", **params) -> io.BytesIO:
+        buffer = io.BytesIO()
+        Image.new("RGB", size, color).save(buffer, format=image_format, **params)
+        buffer.seek(0)
+        return buffer
+
+    def test_exif_orientation_applied_and_stripped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: поворот на 90°
+        exif[0x010F] = "camera"  # Make
+        content = ingest_image(self.image_file(exif=exif))
+        with Image.open(io.BytesIO(content.read())) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(len(image.getexif()), 0)
+
+    @override_settings(AD_IMAGE_MAX_SIZE=(100, 100), AD_IMAGE_FORMAT="PNG")
+    def test_size_capped(self):
+        content = ingest_image(self.image_file(size=(400, 100), image_format="PNG"))
+        self.assertTrue(content.name.endswith(".png"))
+        with Image.open(io.BytesIO(content.read())) as image:
+            self.assertEqual(image.size, (100, 25))
+
+    @override_settings(AD_IMAGE_FORMAT="JPEG")
+    def test_alpha_flattened_for_jpeg(self):
+        for mode, color in (("RGBA", (255, 0, 0, 0)), ("P", 0)):
+            buffer = io.BytesIO()
+            source = Image.new(mode, (10, 10), color)
+            source.save(buffer, format="PNG", **({"transparency": 0} if mode == "P" else {}))
+            with Image.open(io.BytesIO(ingest_image(buffer).read())) as image:
+                self.assertEqual((image.format, image.mode), ("JPEG", "RGB"), mode)
+                self.assertEqual(image.getpixel((5, 5)), (255, 255, 255), mode)  # Прозрачный фон - белый
+
+    @override_settings(AD_IMAGE_FORMAT="PNG")
+    def test_alpha_kept_for_png(self):
+        with Image.open(io.BytesIO(ingest_image(self.image_file(image_format="PNG")).read())) as image:
+            self.assertEqual(image.mode, "RGB")
+        buffer = io.BytesIO()
+        Image.new("RGBA", (10, 10), (255, 0, 0, 0)).save(buffer, format="PNG")
+        with Image.open(io.BytesIO(ingest_image(buffer).read())) as image:
+            self.assertEqual(image.mode, "RGBA")
+
+    def test_invalid_image(self):
+        with self.assertRaises(ValidationError):
+            ingest_image(io.BytesIO(b"not an image"))
+        file = self.image_file()
+        with mock.patch("PIL.Image.Image.save", side_effect=OSError("cannot write")), \
+                self.assertRaises(ValidationError):
+            ingest_image(file)  # Ошибка кодировщика - тоже ошибка загруженного файла, а не 500
+
+    def test_same_image_stored_once(self):
+        owner = User.objects.create_user(username="user")
+        category = ArticleCategory.objects.create(name="category")
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            items = [AdItem(name=f"item {i}", owner=owner, category=category) for i in range(2)]
+            for item in items:
+                item.image.save("photo.jpg", ContentFile(self.image_file().getvalue()), save=False)
+                item.save()
+            self.assertEqual(items[0].image.name, items[1].image.name)
+            self.assertRegex(items[0].image.name, r"^images/([0-9a-f]{2})/\1[0-9a-f]{62}\.webp$")
+            self.assertEqual(sum(len(files) for _, _, files in os.walk(media_root)), 1)
+
+
+class CategoryCacheTestCase(TestCase):
+    """ Кеш категорий (ad.categories). """
+    def setUp(self):
+        category_cache.invalidate()
+        self.category = ArticleCategory.objects.create(name="first")
+
+    def test_cached_until_category_changes(self):
+        self.assertEqual(get_categories(10), [(self.category.id, "first")])
+        with self.assertNumQueries(0):
+            get_categories(10)
+        self.category.name = "renamed"
+        self.category.save()
+        self.assertEqual(get_categories(10), [(self.category.id, "renamed")])
+        self.category.delete()
+        self.assertEqual(get_categories(10), [])
+
+    @override_settings(AD_CATEGORY_CACHE_ALIAS="default")
+    def test_invalidation_shared_between_processes(self):
+        other_process = CategoryCache()
+        self.assertEqual(other_process.get("names", lambda: ["first"]), ["first"])
+        self.assertEqual(other_process.get("names", lambda: ["stale"]), ["first"])
+        category_cache.invalidate()  # Сброс в другом процессе меняет номер версии в общем кеше
+        self.assertEqual(other_process.get("names", lambda: ["second"]), ["second"])
+
+    def test_filter_form_fields(self):
+        html = Template("{% load list_filter %}{% list_filter %}").render(Context())
+        self.assertSetEqual(set(re.findall(r'name="(\w+)"', html)), {"keys", "status", "cat"})  # Параметры AdCatalog
+        self.assertIn(f'<option value="{self.category.id}">first</option>', html)
+
+    @override_settings(AD_CATEGORY_CACHE_TTL=0)
+    def test_expired(self):
+        cache = CategoryCache()
+        cache.get("names", lambda: ["first"])
+        self.assertEqual(cache.get("names", lambda: ["second"]), ["second"])
+
+
+class ResponseCacheTestCase(TestCase):
+    """ Кеш ответов для анонимных пользователей (ad.response_cache). """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.other_user = User.objects.create_user(username="other", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.item = AdItem.objects.create(name="my", owner=cls.user, category=category)
+        cls.other_item = AdItem.objects.create(name="other", owner=cls.other_user, category=category)
+        create_proposal(cls.item, cls.other_item, cls.user.id)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        caches["default"].clear()
+
+    def test_token_user_response_not_shared(self):
+        auth = {"HTTP_AUTHORIZATION": f"Token {self.token.key}"}
+        for url_name in ("all-ad-my", "all-ad"):
+            url = reverse(url_name) + "?format=json"
+            response = self.client.get(url, **auth)
+            self.assertEqual(len(response.json()["results"]), 1 if url_name == "all-ad-my" else 2)
+            self.assertFalse(response.has_header("ETag"))  # Ответ не записан в кеш
+        response = self.client.get(reverse("all-ad-my") + "?format=json")
+        self.assertEqual(response.json()["results"], [])
+        self.assertFalse(response.has_header("ETag"))  # Списки пользователя не кешируются и для анонимных
+        response = self.client.get(reverse("all-ad") + "?format=json")
+        self.assertIn("Authorization", response["Vary"])
+
+    def test_hit_and_not_modified(self):
+        url = reverse("all-ad") + "?format=json"
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+    def test_invalidated_by_changes(self):
+        url = reverse("show-ad", kwargs={"id_": self.item.id}) + "?format=json"
+        catalog_url = reverse("all-ad") + "?format=json"
+        etag, catalog_etag = self.client.get(url)["ETag"], self.client.get(catalog_url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):  # Метки тегов удаляются после фиксации транзакции
+            item = AdItem.objects.get(id=self.item.id)
+            item.name = "renamed"
+            item.save()
+        response = self.client.get(url)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["name"], "renamed")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertNotEqual(self.client.get(catalog_url)["ETag"], catalog_etag)
+
+
+class ValuesSerializerTestCase(TestCase):
+    """ Быстрый путь JSON-списков (ad.fast_serializers) выдаёт то же, что и сериализаторы DRF. """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.other_user = User.objects.create_user(username="other", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.item = AdItem.objects.create(name="my", description="описание", owner=cls.user, category=category,
+                                         status="a", image="images/ab/ab01.webp")
+        cls.other_items = [AdItem.objects.create(name=f"other {i}", owner=cls.other_user, category=category)
+                           for i in range(2)]
+        for other_item in cls.other_items:
+            create_proposal(other_item, cls.item, cls.other_user.id)
+
+    def setUp(self):
+        self.context = {"request": RequestFactory().get("/ad/catalog/")}
+
+    def assertSameOutput(self, view_class, serializer_class, queryset):
+        queryset = queryset.order_by("id")
+        fast = view_class.values_serializer.serialize(view_class.values_serializer.values(queryset), self.context)
+        drf = serializer_class(queryset, many=True, context=self.context).data
+        self.assertEqual(json.loads(FastJSONRenderer().render(fast)), json.loads(JSONRenderer().render(drf)))
+        self.assertEqual(len(fast), queryset.count())
+
+    def test_catalog(self):
+        self.assertSameOutput(AdCatalog, AdItemSerializer, AdItem.objects.all())
+
+    def test_fast_encoder_active(self):
+        self.assertEqual(FastJSONRenderer.encoder, "orjson")  # orjson - зависимость из requirements.txt
+        data = {"id": uuid.uuid4(), "created_at": datetime.datetime(2026, 1, 1), "name": "предмет"}
+        with mock.patch("ad.fast_serializers.orjson", None):  # Без orjson - стандартный кодировщик DRF
+            fallback = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(fallback))
+
+    def test_exchange_init_list(self):
+        queryset = AdItem.objects.filter(owner=self.other_user).annotate(is_has_my_request=Exists(
+            ExchangeProposal.objects.filter(sender_id=OuterRef("id"), receiver_id=self.item.id, status="p")))
+        self.assertSameOutput(ExchangeInitList, ExchangeInitListSerializer, queryset)
+
+    def test_offer_list(self):
+        view = ExchangeAdList()
+        queryset = view.get_queryset().annotate(receiver_is_request_user=Q(receiver__owner_id=self.user.id))
+        self.assertSameOutput(ExchangeAdList, OfferListFlatSerializer, queryset)
+
+
+class AsyncViewsTestCase(TestCase):
+    """ Асинхронные JSON-представления (ad.async_views): ответы и аутентификация как у синхронных. """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.other_user = User.objects.create_user(username="other", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.item = AdItem.objects.create(name="my", owner=cls.user, category=category)
+        cls.other_item = AdItem.objects.create(name="other", owner=cls.other_user, category=category)
+        create_proposal(cls.item, cls.other_item, cls.user.id)
+        cls.token = Token.objects.create(user=cls.user)
+
+    async def get(self, url_name, headers=None, **kwargs):
+        return await self.async_client.get(reverse(url_name, kwargs=kwargs), headers=headers)
+
+    async def test_same_output_as_sync_views(self):
+        headers = {"Authorization": f"Token {self.token.key}"}
+        for url_name, kwargs in (("all-ad-my", {}), ("all-ad", {}), ("show-ad", {"id_": self.item.id}),
+                                 ("offer-request-list", {"id_": self.item.id, "type_": "out"})):
+            response = await self.get(f"async-{url_name}", headers, **kwargs)
+            self.assertEqual(response.status_code, 200, url_name)
+            sync_response = await sync_to_async(self.client.get)(
+                reverse(url_name, kwargs=kwargs) + "?format=json", HTTP_AUTHORIZATION=headers["Authorization"])
+            self.assertEqual(response.json(), sync_response.json(), url_name)
+
+    async def test_authentication(self):
+        url_kwargs = {"id_": self.item.id, "type_": "out"}
+        basic = base64.b64encode(b"user:password").decode()
+        response = await self.get("async-offer-request-list", {"Authorization": f"Basic {basic}"}, **url_kwargs)
+        self.assertEqual(len(response.json()["results"]), 1)
+        response = await self.get("async-offer-request-list", {"Authorization": "Token wrong"}, **url_kwargs)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual((await self.get("async-offer-request-list", **url_kwargs)).status_code, 403)
+
+
+class SQLitePragmasTestCase(SimpleTestCase):
+    """ PRAGMA соединений SQLite (ad.database). """
+    @override_settings(AD_SQLITE_PRAGMAS={})
+    def test_file_journal_unchanged_by_default(self):
+        self.assertNotIn("journal_mode", sqlite_pragmas())
+        self.assertNotIn("synchronous", sqlite_pragmas())
+
+    @override_settings(AD_SQLITE_PRAGMAS={"journal_mode": "wal", "mmap_size": None})
+    def test_wal_opt_in(self):
+        pragmas = sqlite_pragmas()
+        self.assertEqual((pragmas["journal_mode"], pragmas["synchronous"]), ("wal", "normal"))
+        self.assertNotIn("mmap_size", pragmas)
+        self.assertNotIn("journal_mode", sqlite_pragmas(in_memory=True))
+
+
+@override_settings(AD_READ_REPLICAS=["replica"])
+class ReplicaRoutingTestCase(TestCase):
+    """ Чтение с реплик и закрепление клиента за основной БД после записи (ad.replicas). """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.other_user = User.objects.create_user(username="other", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.item = AdItem.objects.create(name="my", owner=cls.user, category=category)
+        cls.other_item = AdItem.objects.create(name="other", owner=cls.other_user, category=category)
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(AdItem))  # Вне представлений только для чтения
+        with replica_reads() as state:
+            self.assertEqual(router.db_for_read(AdItem), "replica")
+            self.assertIsNone(router.db_for_read(User))  # Проверка входа - только основная БД
+            self.assertEqual(router.db_for_write(AdItem), "default")
+            self.assertTrue(state.wrote)
+            state.pinned = True
+            self.assertIsNone(router.db_for_read(AdItem))
+
+    def test_sticky_after_write(self):
+        self.client.force_login(self.user)
+        url = reverse("exchange-offer", kwargs={"my_ad": self.item.id, "other_ad": self.other_item.id})
+        response = self.client.post(url + "?format=json", content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.cookies[STICKY_COOKIE]["max-age"], 10)
+        # Реплики "replica" в DATABASES нет: ответ возможен, только если чтения идут в основную БД
+        response = self.client.get(reverse("all-ad-my") + "?format=json")
+        self.assertEqual([row["id"] for row in response.json()["results"]], [str(self.item.id)])
+        self.assertNotIn(STICKY_COOKIE, self.client.get(reverse("all-ad") + "?format=json").cookies)
+        del self.client.cookies[STICKY_COOKIE]  # Срок закрепления истёк - чтения снова идут на реплику
+        with self.assertRaises(ConnectionDoesNotExist):
+            self.client.get(reverse("all-ad-my") + "?format=json")
+
+
+class ExpireProposalsTestCase(TestCase):
+    """ Истечение ожидающих предложений (ad.exchange.expire_proposals). """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user", password="password")
+        cls.other_user = User.objects.create_user(username="other", password="password")
+        category = ArticleCategory.objects.create(name="category")
+        cls.items = [AdItem.objects.create(name=f"my {i}", owner=cls.user, category=category) for i in range(3)]
+        cls.target = AdItem.objects.create(name="other", owner=cls.other_user, category=category)
+
+    def test_expired_proposals_release_counters(self):
+        proposals = [create_proposal(item, self.target, self.user.id) for item in self.items]
+        ExchangeProposal.objects.filter(id__in=[proposal.id for proposal in proposals[:2]]).update(
+            created_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertEqual(expire_proposals(datetime.timedelta(days=7), batch_size=1), 2)  # Две пачки
+        self.assertEqual(list(ExchangeProposal.objects.filter(status="p").values_list("id", flat=True)),
+                         [proposals[2].id])
+        self.assertEqual(AdItem.objects.get(id=self.target.id).pending_in_count, 1)
+        self.assertEqual(AdItem.objects.get(id=self.items[0].id).pending_out_count, 0)
+        self.assertFalse(find_inconsistent_items().exists())
+        self.assertEqual(find_drifted_users(), [])
+        self.assertEqual(expire_proposals(datetime.timedelta(days=7)), 0)
+
+
+class BenchmarkScenariosTestCase(TestCase):
+    """ Сценарии benchmark_endpoints и audit_query_plans есть для каждого маршрута ad/ и api/. """
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = seed_dataset(users=3, categories=2, items=40, proposals=20)
+
+    def test_every_route_runs(self):
+        scenarios = Scenarios.create(self.dataset, iterations=1)
+        for name in route_names():
+            for mode in ("json", "html"):
+                with self.subTest(route=name, mode=mode):
+                    scenarios.get(name, mode)()  # Ответ 5xx учитывается замером как ошибка, сценарий не падает
+
+    def test_missing_scenario(self):
+        with self.assertRaisesMessage(CommandError, "Нет сценария для маршрута no-such-route"):
+            Scenarios.create(self.dataset, iterations=1).get("no-such-route", "json")
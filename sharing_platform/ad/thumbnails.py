@@ -0,0 +1,94 @@
+""" Заблаговременное создание миниатюр предметов (ImageSpecField) пулом потоков.
+Миниатюры создаются сразу после сохранения изображения (после фиксации транзакции), а не при первом
+обращении к странице; пока миниатюра не готова, вместо неё отдаётся изображение-заглушка. """
+import typing
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from django.templatetags.static import static
+
+
+THUMBNAIL_SPECS = ("list_thumb", "preview_thumb", "mini_thumb")
+PLACEHOLDER_IMAGE = "ad/images/no_preview.png"
+
+logger = logging.getLogger(__name__)
+_executor: typing.Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+_in_progress: typing.Set[str] = set()  # Имена файлов миниатюр, поставленных в очередь
+thumbnail_generated = Signal()  # Миниатюра создана; instance - предмет, для которого она ставилась в очередь
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, "AD_THUMBNAIL_WORKERS", 2),
+                                           thread_name_prefix="ad-thumbnails")
+        return _executor
+
+
+def generate_file(file, force=False) -> bool:
+    """ Создать файл миниатюры. Ошибка (например, повреждённый исходник) не должна ронять пул. """
+    try:
+        file.generate(force=force)
+    except Exception:
+        logger.exception("Не удалось создать миниатюру %s", file.name)
+        return False
+    finally:
+        with _executor_lock:
+            _in_progress.discard(file.name)
+    thumbnail_generated.send(sender=generate_file, instance=getattr(file.generator.source, "instance", None))
+    return True
+
+
+def schedule_file(file):
+    """ Поставить миниатюру в очередь пула после фиксации текущей транзакции. """
+    transaction.on_commit(lambda: _submit(file))
+
+
+def _submit(file):
+    with _executor_lock:
+        if file.name in _in_progress:
+            return
+        _in_progress.add(file.name)
+    get_executor().submit(generate_file, file)
+
+
+def schedule_thumbnails(items: typing.Iterable):
+    """ Поставить в очередь все миниатюры предметов с изображением (например, после загрузки пачкой). """
+    for item in items:
+        if not item.image:
+            continue
+        for spec_name in THUMBNAIL_SPECS:
+            schedule_file(getattr(item, spec_name))
+
+
+def is_thumbnail_ready(file) -> bool:
+    return bool(file.name) and file.cachefile_backend.exists(file)
+
+
+def thumbnail_url(item, spec_name: str) -> str:
+    """ URL миниатюры или заглушки, если у предмета нет изображения или миниатюра ещё не создана. """
+    if not item.image:
+        return static(PLACEHOLDER_IMAGE)
+    file = getattr(item, spec_name)
+    if is_thumbnail_ready(file):
+        return file.url
+    schedule_file(file)
+    return static(PLACEHOLDER_IMAGE)
+
+
+class DeferredCacheFileStrategy:
+    """ Стратегия django-imagekit: сохранение исходника ставит миниатюру в очередь пула,
+    обращение к URL не создаёт файл в потоке запроса (см. thumbnail_url). """
+    def on_source_saved(self, file):
+        schedule_file(file)
+
+    def on_existence_required(self, file):
+        pass
+
+    def on_content_required(self, file):
+        file.generate()
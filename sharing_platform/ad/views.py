@@ -1,28 +1,37 @@
-import re
+import abc
 import json
+from collections import Counter
 from typing import Optional
 from django.contrib import messages
-from django.contrib.auth.models import User
 from django.http import HttpResponseRedirect
 from django.utils.translation import gettext
 from django.urls import reverse
-from django.db import transaction
-from django.db.models import Q, Subquery, OuterRef
+from django.db.models import Q, F, Exists, OuterRef
 from django.views.generic.base import TemplateView
-from rest_framework.renderers import TemplateHTMLRenderer, JSONRenderer, HTMLFormRenderer, BrowsableAPIRenderer
-from rest_framework.generics import ListAPIView, CreateAPIView, RetrieveDestroyAPIView, RetrieveUpdateDestroyAPIView
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import TemplateHTMLRenderer, JSONRenderer, HTMLFormRenderer
+from rest_framework.generics import ListAPIView, CreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.status import HTTP_404_NOT_FOUND, HTTP_200_OK, HTTP_422_UNPROCESSABLE_ENTITY, HTTP_202_ACCEPTED, \
-    HTTP_400_BAD_REQUEST, HTTP_201_CREATED, HTTP_403_FORBIDDEN, HTTP_204_NO_CONTENT
-from rest_framework.exceptions import PermissionDenied
+    HTTP_400_BAD_REQUEST, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_409_CONFLICT
+from rest_framework.exceptions import PermissionDenied, NotFound
 from .models import AdItem, ExchangeProposal
 from .serializers import AdItemSerializer, ChangeStatusExchangeProposalSerializer, InitialExchangeProposalSerializer, \
-    OfferListSerializer, ExchangeInitListSerializer
+    OfferListSerializer, OfferListFlatSerializer, ExchangeInitListSerializer, UserExchangeCountersSerializer, \
+    BulkOfferSerializer, BulkCancelSerializer, BulkDecisionSerializer
+from .search import get_search_backend, split_keywords
+from .pagination import KeysetPagination
+from .exchange import accept_proposal, reject_proposal, cancel_proposal, ExchangeConflict, DuplicateProposal, \
+    create_proposals, cancel_proposals, decide_proposals
+from .loaders import ObjectLoader, get_loader
+from .fast_serializers import ValuesSerializer, ValuesListMixin, FastJSONRenderer, IMAGE_FIELDS
+from .response_cache import CachedResponseMixin, item_tag, CATALOG_TAG
+from .replicas import ReplicaReadMixin
+from .counters import get_user_counters
+from .facets import catalog_facets, queryset_facets
 
 
 class RequestTools:
@@ -34,70 +43,106 @@ class RequestTools:
             return True
         return False
 
+    @staticmethod
+    def _get_loader(request: Request) -> ObjectLoader:
+        return get_loader(request)
+
 
-class ShowAdItem(APIView, RequestTools):
+class ShowAdItem(CachedResponseMixin, ReplicaReadMixin, APIView, RequestTools):
     """ Страница показа предмета. """
     renderer_classes = (JSONRenderer, TemplateHTMLRenderer)
 
+    def get_cache_tags(self, request, *args, **kwargs):
+        return item_tag(kwargs["id_"]),
+
     def get(self, request, id_):
-        ad_item = AdItem.objects.filter(id=id_)
-        if not ad_item.count():
+        ad_item = self._get_loader(request).ad_item(id_)
+        if ad_item is None:
             if self._is_ajax_request(request):
                 return Response(status=HTTP_404_NOT_FOUND)
             if request.user.is_authenticated:
                 return HttpResponseRedirect(redirect_to=reverse('all-ad-my'))
-            return HttpResponseRedirect(redirect_to="all-ad")
-        return Response(data={"ad": ad_item.first()},
+            return HttpResponseRedirect(redirect_to=reverse("all-ad"))
+        if self._is_ajax_request(request):
+            return Response(data=AdItemSerializer(ad_item, context={"request": request}).data, status=HTTP_200_OK)
+        return Response(data={"ad": ad_item},
                         template_name="ad/show_item.html",
                         status=HTTP_200_OK)
 
 
-class CatalogPagination(PageNumberPagination):
+class CatalogPagination(KeysetPagination):
     page_size = 3
     page_size_query_param = 'page_size'
-    max_page_size = 1
+    max_page_size = 30
+    ordering = ("-created_at", "-id")
 
 
-class AdCatalog(ListAPIView, APIView, RequestTools):
-    """ Перечень всех предметов с разнообразными фильтрами. """
+class AdCatalog(CachedResponseMixin, ReplicaReadMixin, ValuesListMixin, ListAPIView, APIView, RequestTools):
+    """ Перечень всех предметов с разнообразными фильтрами. Фильтры ключевых слов, категории (id) и состояния
+    сочетаются; вместе со страницей возвращаются фасеты - кол-во предметов по категориям и состояниям (ad.facets). """
     serializer_class = AdItemSerializer
+    values_serializer = ValuesSerializer(AdItemSerializer, methods=IMAGE_FIELDS)
     pagination_class = CatalogPagination
-    renderer_classes = (JSONRenderer, TemplateHTMLRenderer,)
+    renderer_classes = (FastJSONRenderer, TemplateHTMLRenderer,)
+
+    def is_response_cacheable(self, request) -> bool:
+        return request.path.endswith("/catalog/")  # Списки /my/, /tome/, /request/, /all-my-items/ - свои у каждого
+
+    def get_cache_tags(self, request, *args, **kwargs):
+        return CATALOG_TAG,
+
+    def get_response_cache_tags(self, response):
+        page = response.data.get("items", response.data)
+        return [item_tag(item["id"]) for item in page.get("results", ())]
 
     def get_queryset(self):
-        if self.request.get_full_path().endswith("/all-my-items/"):
-            return AdItem.objects.filter(owner=self.request.user)
-        if self.request.get_full_path().endswith("/my/"):  # Получение списка предметов (мои предложения, адресованные другим предметам)
-            return AdItem.objects.filter(id__in=ExchangeProposal.objects.filter(status="p").prefetch_related("sender").filter(
-                                             sender__owner_id=self.request.user.id).values("sender_id")
-                                         )
-        if self.request.get_full_path().endswith("/tome/"):  # Получение списка предметов (предложения для меня)
-            return AdItem.objects.filter(id__in=ExchangeProposal.objects.filter(status="p").select_related("receiver").filter(
-                receiver__owner_id=self.request.user.id).values("receiver_id")
-                                         )
-        if self.request.get_full_path().endswith("/request/"):  # Список предметов, которым можно предложить обмен (я не жду одобрения) и не отправлял заявок
-            big_query = ExchangeProposal.objects.filter(status="p").prefetch_related("sender").prefetch_related("receiver").exclude(
-                sender__owner_id=self.request.user.id,
-                receiver__owner_id=self.request.user.id)
-            return AdItem.objects.exclude(
-                owner=self.request.user).exclude(
-                id__in=big_query.values("sender__id")).exclude(
-                id__in=big_query.values("receiver__id")
-            )
+        path = self.request.path
+        if path.endswith("/all-my-items/"):
+            return AdItem.objects.filter(owner_id=self.request.user.id)
+        if path.endswith("/my/"):  # Получение списка предметов (мои предложения, адресованные другим предметам)
+            return AdItem.objects.filter(owner_id=self.request.user.id, pending_out_count__gt=0)
+        if path.endswith("/tome/"):  # Получение списка предметов (предложения для меня)
+            return AdItem.objects.filter(owner_id=self.request.user.id, pending_in_count__gt=0)
+        if path.endswith("/request/"):  # Список предметов, которым можно предложить обмен (я не жду одобрения) и не отправлял заявок
+            return AdItem.objects.exclude(owner_id=self.request.user.id).filter(pending_out_count=0, pending_in_count=0)
         return AdItem.objects.all()
 
     def filter_queryset(self, queryset):
-        keywords = json.loads(self.request.GET.get("keys", "[]"))  # Ключевые слова в заголовке или описании
-        category = self.request.GET.get("cat", None)  # Категория
-        status = self.request.GET.get("status", None)  # Состояние
+        keywords = self.__parse_keywords(self.request.GET.get("keys", "[]"))  # Ключевые слова в заголовке или описании
+        category = self.__parse_category(self.request.GET.get("cat", None))  # id категории
+        status = self.request.GET.get("status") or None  # Состояние
         if keywords:
-            return queryset.filter(Q(name__contains=keywords) | Q(description__contains=keywords))
+            queryset = get_search_backend().filter(queryset, keywords)
+        self.facet_queryset = queryset  # Фасеты считаются без фильтров категории и состояния
         if category:
-            return queryset.filter(category__name=category)
+            queryset = queryset.filter(category_id=category)
         if status:
-            return queryset.filter(status=status)
+            queryset = queryset.filter(status=status)
         return queryset
 
+    def get_facets(self) -> Optional[dict]:
+        """ Фасеты текущего списка. Общий каталог - из таблицы CatalogFacet; поиск и списки пользователя -
+        группировкой суженного набора; для /request/ (почти весь каталог, без сводной таблицы) не считаются. """
+        path = self.request.path
+        if path.endswith("/request/"):
+            return None
+        category = self.__parse_category(self.request.GET.get("cat", None))
+        status = self.request.GET.get("status") or None
+        if path.endswith("/catalog/") and not self.__parse_keywords(self.request.GET.get("keys", "[]")):
+            return catalog_facets(category, status)
+        return queryset_facets(self.facet_queryset, category, status)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["facets"] = self.get_facets()
+        return response
+
+    @staticmethod
+    def get_pagination_ordering(queryset):
+        if "search_rank" in queryset.query.annotations:
+            return "search_rank", "-id"  # Сначала наиболее релевантные результаты поиска
+        return CatalogPagination.ordering
+
     def get(self, request, *args, **kwargs):
         if not self.__is_valid_params(request.GET):
             if self._is_ajax_request(request):
@@ -105,38 +150,56 @@ class AdCatalog(ListAPIView, APIView, RequestTools):
             return HttpResponseRedirect(status=HTTP_422_UNPROCESSABLE_ENTITY, redirect_to=request.get_full_path())
         resp_instance: Response = self.list(request, *args, **kwargs)
         if self._is_ajax_request(request):
-            return Response(data=resp_instance.data["results"], headers=resp_instance.headers, status=HTTP_200_OK)
+            return Response(data=resp_instance.data, headers=resp_instance.headers, status=HTTP_200_OK)
         return Response(template_name="ad/ad-items-list.html", status=HTTP_200_OK, headers=resp_instance.headers,
-                        data={"items": resp_instance.data, "current_page_num": request.GET.get("page", 1)})
+                        data={"items": resp_instance.data})
+
+    @classmethod
+    def validate_params(cls, request_data: dict) -> bool:
+        """ Проверка строки запроса для асинхронного варианта списка (ad.async_views). """
+        return cls.__is_valid_params(request_data)
 
     @staticmethod
     def __is_valid_params(request_data: dict):
         """ Валидация необязательных параметров,
         входящих в строку запроса, начинающихся после символа '?',
-        группируемые по символу '&'. """
+        группируемые по символу '&'.
+        Пустое значение (незаполненное поле формы AdListFilter) равносильно отсутствию параметра. """
         keyword = request_data.get("keys", None)
-        if keyword is not None:
-            keyword = re.sub(r"\W", keyword, "")
-            keyword = keyword.replace(", ", ",")
-            keyword = keyword.split(",")
-            try:
-                parsed = json.loads(f'{keyword}')
-            except json.JSONDecodeError:
-                return False
-            if not parsed:
+        if keyword:
+            if not AdCatalog.__parse_keywords(keyword):
                 return False  # Пустой список ключевых слов
         status = request_data.get("status", None)
-        if status is not None:
+        if status:
             if status not in ["a", "b", "n"]:
                 return False
         category = request_data.get("cat", None)
-        if category is not None:
-            if not category:
-                return False
-        if set(request_data) - {"keys", "cat", "status", "format", "page"}:
+        if category:
+            if not category.isdigit():
+                return False  # id категории; 0 - все категории
+        if set(request_data) - {"keys", "cat", "status", "format", "page", "cursor", "page_size"}:
             return False  # Посторонние параметры
         return True
 
+    @staticmethod
+    def __parse_category(value: Optional[str]) -> Optional[int]:
+        if value is None or not value.isdigit() or not int(value):
+            return None
+        return int(value)
+
+    @staticmethod
+    def __parse_keywords(value: str) -> list:
+        """ Ключевые слова принимаются JSON-массивом строк (["мышь", "утюг"]) или через запятую (мышь, утюг). """
+        try:
+            parsed = json.loads(value)
+        except json.JSONDecodeError:
+            parsed = value.split(",")
+        if isinstance(parsed, str):
+            parsed = [parsed]
+        if not isinstance(parsed, list):
+            return []
+        return split_keywords(filter(lambda word: isinstance(word, str), parsed))
+
 
 class CreateAd(CreateAPIView, TemplateView, RequestTools):
     """ Добавить в каталог товар предмет для обмена. """
@@ -178,25 +241,28 @@ class OfferExchange(CreateAPIView, RequestTools):
     def get_serializer(self, *args, **kwargs):
         serializer = self.get_serializer_class()
         return serializer(*args, request_user=self.request.user,
-                          sender=self.sender.first(), receiver=self.receiver.first(), **kwargs)
+                          sender=self.sender, receiver=self.receiver, **kwargs)
 
     def create(self, request, *args, **kwargs):
-        if not self.sender.count() or not self.receiver.count():
+        if self.sender is None or self.receiver is None:
             if self._is_ajax_request(request):
                 return Response(status=HTTP_404_NOT_FOUND)
             messages.add_message(request, messages.ERROR, gettext("ad_not_fount"))
             return HttpResponseRedirect(redirect_to=reverse("all-ad"))
-        if ExchangeProposal.objects.filter(sender_id=self.sender.first().id, receiver_id=self.receiver.first().id,
-                                           sender__owner_id=request.user.id, status="p").count():
+        serializer = self.get_serializer(data={"status": "p"})
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_create(serializer)
+        except DuplicateProposal:  # Повтор отсекает уникальный индекс, отдельная проверка до вставки не нужна
             if self._is_ajax_request(request):
                 return Response(status=HTTP_422_UNPROCESSABLE_ENTITY)
             messages.add_message(request, messages.ERROR, gettext("ex_already_exist"))
             return HttpResponseRedirect(redirect_to=reverse("show-ad", kwargs={"id_": kwargs["my_ad"]}))
-        serializer = self.get_serializer(data={"sender": self.sender.first().id,
-                                               "receiver": self.receiver.first().id,
-                                               "status": "p"})
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        except ExchangeConflict:  # Один из предметов успел сменить владельца
+            if self._is_ajax_request(request):
+                return Response(status=HTTP_409_CONFLICT)
+            messages.add_message(request, messages.ERROR, gettext("exchange_conflict"))
+            return HttpResponseRedirect(redirect_to=reverse("show-ad", kwargs={"id_": kwargs["my_ad"]}))
         headers = self.get_success_headers(serializer.data)
         if self._is_ajax_request(request):
             return Response(status=HTTP_201_CREATED, headers=headers, data=serializer.data)
@@ -204,8 +270,7 @@ class OfferExchange(CreateAPIView, RequestTools):
         return HttpResponseRedirect(redirect_to=reverse("show-ad", kwargs={"id_": kwargs["my_ad"]}), headers=headers)
 
     def post(self, request, *args, **kwargs):
-        self.sender, self.receiver = AdItem.objects.filter(id=kwargs["my_ad"]),\
-                                     AdItem.objects.filter(id=kwargs["other_ad"])
+        self.sender, self.receiver = self._get_loader(request).ad_items(kwargs["my_ad"], kwargs["other_ad"])
         return super().post(request, *args, **kwargs)
 
 
@@ -219,18 +284,28 @@ class OfferCancel(RetrieveUpdateDestroyAPIView, RequestTools):
         super().__init__(*a, **k)
 
     def get_object(self):
-        return self.get_queryset().filter(id=self.id)
+        proposal = self._get_loader(self.request).proposal(self.id, status="p")
+        if proposal is None:
+            raise NotFound
+        self.check_object_permissions(self.request, proposal)
+        return proposal
 
     def check_object_permissions(self, request, obj: ExchangeProposal):
-        if not obj.sender.id == request.user.id:
+        if not obj.sender.owner_id == request.user.id:
             raise PermissionDenied
 
+    def perform_destroy(self, instance: ExchangeProposal):
+        try:
+            cancel_proposal(instance)
+        except ExchangeConflict:  # Предложение успели принять или отклонить
+            raise NotFound
+
     def delete(self, request, *args, **kwargs):
         self.id = kwargs["id_"]
         resp = super().delete(request, *args, **kwargs)
         if self._is_ajax_request(request):
             return Response(status=resp.status_code, headers=resp.headers)
-        if resp.status_code == HTTP_403_FORBIDDEN:
+        if resp.status_code == HTTP_204_NO_CONTENT:
             messages.add_message(request, messages.SUCCESS, gettext("offer_deleted"))
         return HttpResponseRedirect(redirect_to=reverse("all-ad"))
 
@@ -245,61 +320,51 @@ class ExchangeAdItem(RetrieveUpdateDestroyAPIView, RequestTools):
         self.current_exchange_item: Optional[ExchangeProposal] = None  # Экземпляр текущей "сделки"
         super().__init__(*a, **k)
 
-    def filter_queryset(self, queryset, exchangeProposal_pk):
-        cur = current_exchange_item = queryset.filter(id=exchangeProposal_pk)
-        self.current_exchange_item = cur.first()
-        return cur
-
     def update(self, request: Request, *args, **kwargs):
         if not self.__check_permissions(request, kwargs["id_"]):
             if self._is_ajax_request(request):
                 return Response(status=HTTP_422_UNPROCESSABLE_ENTITY)
             return HttpResponseRedirect(redirect_to=reverse("all-ad-my"))
-        instance = self.filter_queryset(self.get_queryset(), kwargs["id_"])
-        if not instance.count():
-            if self._is_ajax_request(request):
-                return Response(status=HTTP_400_BAD_REQUEST)
-            return HttpResponseRedirect(redirect_to=reverse("all-ad-my"))
-        serializer = self.get_serializer(instance.first(),
+        self.current_exchange_item = self._get_loader(request).proposal(kwargs["id_"], status="p")
+        serializer = self.get_serializer(self.current_exchange_item,
                                          data={"status": {"accept": "s", "reject": "r"}[kwargs["type_"]]},
                                          partial=True)
         serializer.is_valid(raise_exception=True)
-        with transaction.atomic():
-            serializer.save()
-            if serializer.data["status"] == "s":
-                self.__change_ad_item_owner(self.current_exchange_item.sender, self.current_exchange_item.receiver)
-                self.current_exchange_item.sender.save()
-                self.current_exchange_item.receiver.save()
+        try:
+            if serializer.validated_data["status"] == "s":
+                accept_proposal(self.current_exchange_item)  # Остальные ожидающие предложения обоих предметов отклоняются
+            else:
+                reject_proposal(self.current_exchange_item)
+        except ExchangeConflict:  # Предложение или предметы изменены параллельным запросом
+            if self._is_ajax_request(request):
+                return Response(status=HTTP_409_CONFLICT)
+            messages.add_message(request, messages.ERROR, gettext("exchange_conflict"))
+            return HttpResponseRedirect(redirect_to=reverse("all-ad-tome"))
         if self._is_ajax_request(request):
             return Response(status=HTTP_202_ACCEPTED)
         return HttpResponseRedirect(redirect_to=reverse("show-ad", kwargs={"id_": kwargs["id_"]}),
                                     status=HTTP_202_ACCEPTED)
 
-    @staticmethod
-    def __change_ad_item_owner(item_send: AdItem, item_received: AdItem):
-        """ В случае, если обмен состоялся, у 2 экземпляров сущности предмета хозяева меняются местами. """
-        item_send.owner, item_received.owner = item_received.owner, item_send.owner
-
     @staticmethod
     def __check_permissions(request, pk):
         if not request.user.is_authenticated:
             raise PermissionDenied
-        owner = ExchangeProposal.objects.filter(
-            id=pk, status="p").select_related("receiver").values("receiver__owner_id")
-        if not owner.count():
+        proposal = get_loader(request).proposal(pk, status="p")
+        if proposal is None:
             return False
-        if not request.user.id == owner.first()["receiver__owner_id"]:
+        if not request.user.id == proposal.receiver.owner_id:
             raise PermissionDenied("only_receiver_can_accept_or_reject")
         return True
 
 
-class ExchangeAdList(ListAPIView, APIView, RequestTools):
+class ExchangeAdList(ReplicaReadMixin, ValuesListMixin, ListAPIView, APIView, RequestTools):
     """  Представление списка рассмотрения предложений,
     или отправки предложений обменять текущий предмет на один из списка...
     Предметы, которые я могу предложить взамен на интересующий. Или ответить на входящую заявку. """
     serializer_class = OfferListSerializer
+    values_serializer = ValuesSerializer(OfferListFlatSerializer)
     pagination_class = CatalogPagination
-    renderer_classes = (JSONRenderer, TemplateHTMLRenderer,)
+    renderer_classes = (FastJSONRenderer, TemplateHTMLRenderer,)
     permission_classes = (IsAuthenticated,)
 
     def __init__(self, *args, **kwargs):
@@ -308,7 +373,15 @@ class ExchangeAdList(ListAPIView, APIView, RequestTools):
         super().__init__(*args, **kwargs)
 
     def get_queryset(self):
-        return ExchangeProposal.objects.prefetch_related("sender", "receiver")
+        return ExchangeProposal.objects.select_related("sender", "receiver").annotate(
+            username_sender=F("sender__owner__username"),  # Тем же запросом (JOIN), без подзапроса на каждую строку
+            username_receiver=F("receiver__owner__username")
+        )
+
+    def get_serializer_class(self):
+        if self._is_ajax_request(self.request):
+            return OfferListFlatSerializer  # Плоские поля без вложенных сериализаторов предметов
+        return OfferListSerializer
 
     def filter_queryset(self, queryset):
         """ Взяли все АКТИВНЫЕ обмены с участием нашего предмета. Мы знаем, что инициатор обмена sender,
@@ -322,47 +395,42 @@ class ExchangeAdList(ListAPIView, APIView, RequestTools):
         query = queryset.filter(status="p")
         if self.type == "in":  # Входящие заявки (согласиться/отказаться) менять этот предмет
             return query.filter(receiver_id=self.current_ad_id).annotate(
-                receiver_is_request_user=Q(receiver__owner_id=self.request.user.id),
-                username_sender=Subquery(User.objects.filter(id=OuterRef("sender_id__owner_id")).values_list("username")),
-                username_receiver=Subquery(User.objects.filter(id=OuterRef("receiver_id__owner_id")).values_list("username"))
+                receiver_is_request_user=Q(receiver__owner_id=self.request.user.id)
             )
         if self.type == "out":  # Исходящие заявки (Предложить обмен/отказаться от своего предложения)
             return query.filter(sender_id=self.current_ad_id).annotate(
-                sender_is_request_user=Q(sender__owner_id=self.request.user.id),
-                username_sender=Subquery(User.objects.filter(id=OuterRef("sender_id__owner_id")).values_list("username")),
-                username_receiver=Subquery(User.objects.filter(id=OuterRef("receiver_id__owner_id")).values_list("username"))
+                sender_is_request_user=Q(sender__owner_id=self.request.user.id)
             )
         if self.type == "all":  # Посторонний наблюдатель
             return query.filter(
                 Q(receiver_id=self.current_ad_id) | Q(sender_id=self.current_ad_id)
             ).annotate(
                 receiver_is_request_user=Q(receiver__owner_id=self.request.user.id),
-                sender_is_request_user=Q(sender__owner_id=self.request.user.id),
-                username_sender=Subquery(User.objects.filter(id=OuterRef("sender_id__owner_id")).values_list("username")),
-                username_receiver=Subquery(User.objects.filter(id=OuterRef("receiver_id__owner_id")).values_list("username"))
+                sender_is_request_user=Q(sender__owner_id=self.request.user.id)
             )
         return query
 
     def get(self, request, id_, type_, *args, **kwargs):
         self.current_ad_id = id_
         self.type = type_
-        if not AdItem.objects.filter(id=id_).count():
+        if self._get_loader(request).ad_item(id_) is None:
             if self._is_ajax_request(request):
                 return Response(status=HTTP_404_NOT_FOUND)
             messages.add_message(request, messages.ERROR, gettext("does_not_exist"))
             return HttpResponseRedirect(redirect_to=reverse("all-ad"))
         resp_instance: Response = self.list(request, *args, **kwargs)
         if self._is_ajax_request(request):
-            return Response(data=json.dumps(resp_instance.data), headers=resp_instance.headers, status=HTTP_200_OK)
+            return Response(data=resp_instance.data, headers=resp_instance.headers, status=HTTP_200_OK)
         return Response(template_name="ad/make-offer-list.html", status=HTTP_200_OK, headers=resp_instance.headers,
                         data={"items": resp_instance.data, "target_ad_id": self.current_ad_id, "type": self.type})
 
 
-class ExchangeInitList(ListAPIView, APIView, RequestTools):
+class ExchangeInitList(ReplicaReadMixin, ValuesListMixin, ListAPIView, APIView, RequestTools):
     """ Представление списка вещей, которым можно предложить обмен или отказаться от своего предложения """
     serializer_class = ExchangeInitListSerializer
+    values_serializer = ValuesSerializer(ExchangeInitListSerializer, methods=IMAGE_FIELDS)
     pagination_class = CatalogPagination
-    renderer_classes = (JSONRenderer, TemplateHTMLRenderer,)
+    renderer_classes = (FastJSONRenderer, TemplateHTMLRenderer,)
     permission_classes = (IsAuthenticated,)
     queryset = AdItem
 
@@ -373,19 +441,20 @@ class ExchangeInitList(ListAPIView, APIView, RequestTools):
 
     def filter_queryset(self, queryset):
         return AdItem.objects.filter(owner_id=self.request.user.id).annotate(
-            is_has_my_request=Q(exchange__sender_id=self.request.user.id) & Q(exchange__status="p"),  # Предлагал ни я этот предмет
+            is_has_my_request=Exists(ExchangeProposal.objects.filter(  # Предлагал ли я этот предмет
+                sender_id=OuterRef("id"), receiver_id=self.my_ad_id, status="p")),
         )
 
     def get(self, request, id_, *args, **kwargs):
         self.my_ad_id = id_
-        if not AdItem.objects.filter(id=id_).count():
+        if self._get_loader(request).ad_item(id_) is None:
             if self._is_ajax_request(request):
                 return Response(status=HTTP_404_NOT_FOUND)
             messages.add_message(request, messages.ERROR, gettext("does_not_exist"))
             return HttpResponseRedirect(redirect_to=reverse("all-ad"))
         resp_instance: Response = self.list(request, *args, **kwargs)
         if self._is_ajax_request(request):
-            return Response(data=json.dumps(resp_instance.data), headers=resp_instance.headers, status=HTTP_200_OK)
+            return Response(data=resp_instance.data, headers=resp_instance.headers, status=HTTP_200_OK)
         return Response(template_name="ad/ad-items-list.html", status=HTTP_200_OK, headers=resp_instance.headers,
                         data={"items": resp_instance.data, "target_ad_id": self.my_ad_id, "show_form": True})
 
@@ -432,3 +501,62 @@ class ItemProfileOutputExchange(ListAPIView, RequestTools):
         if self._is_ajax_request(request):
             pass
         return
+
+
+class UserDashboard(ReplicaReadMixin, APIView):
+    """ Сводка пользователя: предметы, ожидающие входящие и исходящие предложения, состоявшиеся обмены.
+    Значения берутся из строки счётчиков (ad.counters), без подсчёта по таблицам предметов и предложений. """
+    renderer_classes = (JSONRenderer,)
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        return Response(data=UserExchangeCountersSerializer(get_user_counters(request.user.id)).data)
+
+
+class BulkExchangeView(APIView, metaclass=abc.ABCMeta):
+    """ Пакетный запрос обмена: одна транзакция на весь пакет, результат - по каждому элементу в порядке запроса
+    (ad.exchange). Ответ: {"results": [...], "summary": {результат: кол-во}}. """
+    renderer_classes = (JSONRenderer,)
+    parser_classes = (JSONParser,)
+    permission_classes = (IsAuthenticated,)
+    serializer_class = None
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = self.apply(serializer.validated_data, request.user.id)
+        return Response(data={"results": results, "summary": Counter(result["result"] for result in results)},
+                        status=HTTP_200_OK)
+
+    @abc.abstractmethod
+    def apply(self, data, user_id) -> list:
+        """ Выполнить пакет (данные прошли serializer_class); результат - по элементу на каждый элемент запроса. """
+
+
+class BulkOfferExchange(BulkExchangeView):
+    """ Предложить обмен нескольких пар предметов: {"offers": [{"sender": id, "receiver": id}, ...]}. """
+    serializer_class = BulkOfferSerializer
+
+    def apply(self, data, user_id):
+        offers = data["offers"]
+        results = create_proposals([(offer["sender"], offer["receiver"]) for offer in offers], user_id)
+        return [{**offer, "result": result, "id": id_} for offer, (result, id_) in zip(offers, results)]
+
+
+class BulkOfferCancel(BulkExchangeView):
+    """ Отозвать несколько своих предложений: {"ids": [id, ...]}. """
+    serializer_class = BulkCancelSerializer
+
+    def apply(self, data, user_id):
+        return [{"id": id_, "result": result} for id_, result in zip(data["ids"], cancel_proposals(data["ids"], user_id))]
+
+
+class BulkExchangeResponse(BulkExchangeView):
+    """ Принять или отклонить несколько предложений: {"decisions": [{"id": id, "type": "accept" | "reject"}, ...]}. """
+    serializer_class = BulkDecisionSerializer
+
+    def apply(self, data, user_id):
+        decisions = data["decisions"]
+        results = decide_proposals([(decision["id"], decision["type"]) for decision in decisions], user_id)
+        return [{**decision, "result": result} for decision, result in zip(decisions, results)]
+
@@ -0,0 +1,177 @@
+""" Потоковая загрузка предметов из JSON ({"ads": [...]}) или NDJSON (по одному объекту в строке).
+Тело запроса читается частями, записи проверяются и сохраняются пачками (bulk_create) в отдельных транзакциях,
+ошибки отдельных записей не прерывают загрузку остальных. """
+import json
+import codecs
+import typing
+from collections import Counter
+from django.contrib.auth.models import User
+from django.db import transaction
+from ad.models import AdItem, ArticleCategory
+from ad.images import discard_written_images
+from ad.search import get_search_backend
+from ad.thumbnails import schedule_thumbnails
+from ad.response_cache import response_cache, CATALOG_TAG
+from ad.counters import new_deltas, update_user_counters
+from ad.facets import update_facet_counts
+from ad.journal import record_changes, ITEM, CREATE
+from .serializers import AdItemImportSerializer
+
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ImportFormatError(ValueError):
+    """ Тело запроса не удаётся разобрать (за пределами отдельной записи). """
+
+
+def iter_ndjson(stream) -> typing.Iterator[typing.Any]:
+    """ Объекты NDJSON по одному; пустые строки пропускаются. Нераспознанная строка отдаётся как ImportFormatError. """
+    for line in stream:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            yield ImportFormatError(str(error))
+
+
+def iter_json_array(stream, key="ads", chunk_size=READ_CHUNK_SIZE) -> typing.Iterator[typing.Any]:
+    """ Элементы массива по ключу key в JSON-объекте верхнего уровня, без чтения всего тела в память.
+    Массив должен идти первым ключом объекта: {"ads": [...]}. """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()  # Многобайтный символ может разделиться между частями
+    buffer, position, is_eof = "", 0, False
+
+    def read_more():
+        nonlocal buffer, position, is_eof
+        data = stream.read(chunk_size)
+        if not data:
+            is_eof = True
+            return
+        buffer = buffer[position:] + (text_decoder.decode(data) if isinstance(data, bytes) else data)
+        position = 0
+
+    def skip(chars=" \t\r\n"):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+            if position < len(buffer) or is_eof:
+                return
+            read_more()
+
+    def expect(token):
+        nonlocal position
+        skip()
+        while len(buffer) - position < len(token) and not is_eof:
+            read_more()
+        if not buffer.startswith(token, position):
+            raise ImportFormatError(f"Ожидается {token}")
+        position += len(token)
+
+    expect("{")
+    expect(json.dumps(key))
+    expect(":")
+    expect("[")
+    skip()
+    if buffer.startswith("]", position):
+        return
+    while True:
+        skip()
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            if is_eof:
+                raise ImportFormatError(str(error))
+            read_more()
+            continue
+        position = end
+        yield item
+        skip()
+        if buffer.startswith(",", position):
+            position += 1
+            continue
+        if buffer.startswith("]", position):
+            return
+        raise ImportFormatError("Ожидается , или ]")
+
+
+class BulkImporter:
+    """ Проверка и сохранение записей пачками по batch_size. Категории и владельцы пачки читаются одним запросом. """
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.created = 0
+        self.errors: typing.List[dict] = []
+        self._row_number = 0
+
+    def run(self, rows: typing.Iterable) -> "BulkImporter":
+        batch = []
+        for row in rows:
+            self._row_number += 1
+            batch.append((self._row_number, row))
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+        self.save_batch(batch)
+        return self
+
+    def save_batch(self, batch: typing.List[tuple]):
+        if not batch:
+            return
+        rows = [(number, row) for number, row in batch if self._check_row(number, row)]
+        categories = ArticleCategory.objects.in_bulk(self._ids(rows, "category"))
+        owners = User.objects.in_bulk(self._ids(rows, "owner"))
+        context = {"categories": categories, "owners": owners}
+        items = []
+        try:
+            for number, row in rows:
+                serializer = AdItemImportSerializer(data=row, context=context)
+                if not serializer.is_valid():
+                    self.errors.append({"row": number, "errors": serializer.errors})
+                    continue
+                items.append(serializer.build_instance())
+            if not items:
+                return
+            with transaction.atomic():
+                AdItem.objects.bulk_create(items, batch_size=self.batch_size)
+                get_search_backend().index_items(items, created=True)  # bulk_create не отправляет сигналы post_save
+                record_changes((ITEM, CREATE, item.pk) for item in items)
+                schedule_thumbnails(items)
+                deltas = new_deltas()
+                for item in items:
+                    deltas[item.owner_id]["items_count"] += 1
+                update_user_counters(deltas)
+                update_facet_counts(Counter((item.category_id, item.status) for item in items))
+                response_cache.invalidate([CATALOG_TAG])
+        except BaseException:
+            discard_written_images(items)  # Изображения записываются до транзакции - файлы пачки не должны остаться
+            raise
+        self.created += len(items)
+
+    def _check_row(self, number, row) -> bool:
+        if isinstance(row, ImportFormatError):
+            self.errors.append({"row": number, "errors": {"non_field_errors": [str(row)]}})
+            return False
+        if not isinstance(row, dict):
+            self.errors.append({"row": number, "errors": {"non_field_errors": ["Ожидается объект"]}})
+            return False
+        return True
+
+    @staticmethod
+    def _ids(rows, key) -> set:
+        ids = set()
+        for _, row in rows:
+            try:
+                ids.add(int(row.get(key)))
+            except (TypeError, ValueError):
+                continue
+        return ids
+
+    @property
+    def report(self) -> dict:
+        return {"created": self.created, "failed": len(self.errors),
+                "errors": sorted(self.errors, key=lambda error: error["row"])}
@@ -1,12 +1,62 @@
+import base64
+import binascii
+import io
+from django.utils.translation import gettext
 from rest_framework import serializers
+from ad.images import ingest_image
 from ad.models import AdItem
 
 
 class AdItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = AdItem
-        exclude = ("id",)
+        exclude = ("id", "pending_out_count", "pending_in_count",)
 
 
 class AdBulkSerializer(serializers.Serializer):
     ads = AdItemSerializer(many=True)
+
+
+class AdItemImportSerializer(serializers.ModelSerializer):
+    """ Проверка одной записи потоковой загрузки. Категории и владельцы передаются в context
+    уже загруженными (словари id -> экземпляр), поэтому проверка записи не обращается к БД. """
+    class Meta:
+        model = AdItem
+        fields = ("name", "description", "status", "category", "owner", "image")
+    category = serializers.IntegerField()
+    owner = serializers.IntegerField()
+    image = serializers.CharField(required=False, allow_blank=True, write_only=True)  # Содержимое файла в base64
+
+    def validate_category(self, value):
+        if value not in self.context["categories"]:
+            raise serializers.ValidationError(gettext("does_not_exist"))
+        return value
+
+    def validate_owner(self, value):
+        if value not in self.context["owners"]:
+            raise serializers.ValidationError(gettext("does_not_exist"))
+        return value
+
+    def validate_image(self, value):
+        if not value:
+            return None
+        try:
+            content = base64.b64decode(value, validate=True)
+        except (binascii.Error, ValueError):
+            raise serializers.ValidationError(gettext("invalid_image"))
+        return ingest_image(io.BytesIO(content))
+
+    def build_instance(self) -> AdItem:
+        """ Несохранённый экземпляр для bulk_create. Изображение записывается в хранилище сразу; если пачка
+        не сохранится, новый файл удаляет BulkImporter (ad.images.discard_written_images). """
+        data = dict(self.validated_data)
+        data["category"] = self.context["categories"][data["category"]]
+        data["owner"] = self.context["owners"][data["owner"]]
+        image = data.pop("image", None)
+        instance = AdItem(**data)
+        if image is not None:
+            instance.image.save(image.name, image, save=False)
+        return instance
+
+    def create(self, validated_data):
+        raise serializers.ValidationError("Записи сохраняются пачками через build_instance")
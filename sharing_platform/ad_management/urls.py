@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import AdItemsJsonLoader
+from .views import AdItemsJsonLoader, ChangeFeed
 
 urlpatterns = [
-    path("bulk-json-load/", AdItemsJsonLoader.as_view(), name="ad-json-loader")
+    path("bulk-json-load/", AdItemsJsonLoader.as_view(), name="ad-json-loader"),
+    path("changes/", ChangeFeed.as_view(), name="change-feed"),  # Лента изменений (NDJSON) для синхронизации
 ]
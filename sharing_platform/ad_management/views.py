@@ -1,23 +1,89 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework.parsers import JSONParser
 from rest_framework.generics import ListCreateAPIView
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import AdBulkSerializer, AdItemSerializer
-from ad.models import AdItem
+from ad.fast_serializers import FastJSONRenderer
+from ad.journal import read_changes, last_seq, is_pruned
+from .serializers import AdBulkSerializer
+from .importer import BulkImporter, ImportFormatError, iter_json_array, iter_ndjson
+
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+MAX_BATCH_SIZE = 10000
+MAX_CHANGE_FEED_LIMIT = 100000
 
 
 class AdItemsJsonLoader(ListCreateAPIView):
+    """ Загрузка предметов: {"ads": [...]} (application/json) или по объекту в строке (application/x-ndjson).
+    Тело читается потоково, размер пачки - параметр ?batch_size= (по умолчанию AD_BULK_IMPORT_BATCH_SIZE). """
     serializer_class = AdBulkSerializer
     parser_classes = (JSONParser,)
     permission_classes = (IsAdminUser,)
 
     def create(self, request, *args, **kwargs):
-        print(request.data)
-        if "ads" not in request.data:
+        stream = request.stream
+        if stream is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        serializer = AdItemSerializer(data=request.data["ads"], many=True)
-        serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        if request.content_type.split(";")[0].strip() in NDJSON_CONTENT_TYPES:
+            rows = iter_ndjson(stream)
+        else:
+            rows = iter_json_array(stream, key="ads")
+        importer = BulkImporter(batch_size=self.get_batch_size(request))
+        try:
+            importer.run(rows)
+        except ImportFormatError as error:
+            return Response(data={**importer.report, "detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        if not importer.created and importer.errors:
+            return Response(data=importer.report, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data=importer.report, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def get_batch_size(request) -> int:
+        default = getattr(settings, "AD_BULK_IMPORT_BATCH_SIZE", 1000)
+        try:
+            value = int(request.query_params.get("batch_size", default))
+        except (TypeError, ValueError):
+            return default
+        return max(1, min(value, MAX_BATCH_SIZE))
+
+
+class ChangeFeed(APIView):
+    """ Изменения предметов и предложений обмена после номера ?since= (ad.journal) в формате NDJSON:
+    строка на запись журнала ({"seq", "model", "id", "action", "data"}), последняя строка -
+    {"next_since": номер для следующего запроса, "has_more": возможно, есть ещё записи}.
+    Не более ?limit= записей (по умолчанию AD_CHANGE_FEED_LIMIT). Если записи после since уже удалены по сроку
+    хранения - 410 и номер последней записи: потребителю нужна полная синхронизация. """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        since = self.get_int(request, "since", 0)
+        limit = self.get_int(request, "limit", getattr(settings, "AD_CHANGE_FEED_LIMIT", 10000))
+        if since is None or limit is None or limit < 1:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        if is_pruned(since):
+            return Response(data={"detail": "journal_pruned", "last_seq": last_seq()}, status=status.HTTP_410_GONE)
+        return StreamingHttpResponse(self.stream(since, min(limit, MAX_CHANGE_FEED_LIMIT)),
+                                     content_type=NDJSON_CONTENT_TYPES[0])
+
+    @staticmethod
+    def stream(since, limit):
+        renderer = FastJSONRenderer()
+        count = 0
+        for change in read_changes(since, limit, getattr(settings, "AD_CHANGE_FEED_BATCH_SIZE", 500)):
+            since = change["seq"]
+            count += 1
+            yield renderer.render(change) + b"\n"
+        yield renderer.render({"next_since": since, "has_more": count == limit}) + b"\n"
+
+    @staticmethod
+    def get_int(request, name, default):
+        try:
+            value = int(request.query_params.get(name, default))
+        except (TypeError, ValueError):
+            return None
+        return value if value >= 0 else None
+
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -52,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ad.replicas.replica_stickiness_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -93,12 +95,68 @@ LOCALE_PATHS = (
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Профиль БД задаётся переменными окружения: DB_ENGINE (sqlite | postgresql), DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST, DB_PORT. DB_CONN_MAX_AGE - время жизни постоянного соединения (сек.; по умолчанию 0 - соединение
+# на каждый запрос, единственный безопасный вариант под ASGI; под WSGI можно задать, например, 60).
+# DB_PGBOUNCER=1 - соединения идут через пулер PgBouncer в режиме транзакций.
+
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 0))
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("DB_NAME", "sharing_platform"),
+            'USER': os.environ.get("DB_USER", ""),
+            'PASSWORD': os.environ.get("DB_PASSWORD", ""),
+            'HOST': os.environ.get("DB_HOST", ""),
+            'PORT': os.environ.get("DB_PORT", ""),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get("DB_PGBOUNCER", "0") == "1",
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get("DB_CONNECT_TIMEOUT", 5)),
+            },
+        }
     }
-}
+elif DB_ENGINE == "sqlite":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                'timeout': 5,  # Ожидание блокировки записи (сек.), то же что PRAGMA busy_timeout
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Неизвестный DB_ENGINE: {DB_ENGINE}")
+
+
+# Реплики для чтения (ad.replicas): DB_REPLICAS - через запятую файлы SQLite или хосты PostgreSQL.
+# На реплики идут чтения каталога, страницы предмета и списков обменов; клиент, выполнивший запись,
+# AD_REPLICA_STICKY_SECONDS сек. читает из основной БД. Реплики SQLite обновляет команда sync_replicas.
+
+DB_REPLICAS = [name for name in os.environ.get("DB_REPLICAS", "").split(",") if name]
+for index, replica in enumerate(DB_REPLICAS, start=1):
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        'NAME' if DB_ENGINE == "sqlite" else 'HOST': replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+AD_READ_REPLICAS = [f"replica_{index}" for index in range(1, len(DB_REPLICAS) + 1)]
+AD_REPLICA_STICKY_SECONDS = 10
+DATABASE_ROUTERS = ["ad.replicas.ReplicaRouter"]
+
+
+# Параметры соединений SQLite (ad.database): PRAGMA, выполняемые при подключении, дополняют и переопределяют
+# значения по умолчанию (busy_timeout, mmap, кеш). Значение None отключает PRAGMA. DB_SQLITE_WAL=1 включает
+# журнал WAL - он переводит в этот режим сам файл БД, поэтому для db.sqlite3 из репозитория не включается.
+
+AD_SQLITE_PRAGMAS = {"journal_mode": "wal"} if os.environ.get("DB_SQLITE_WAL", "0") == "1" else {}
 
 
 # Password validation
@@ -147,6 +205,68 @@ STATIC_ROOT = os.path.join(BASE_DIR, STATIC_URL)
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, MEDIA_URL)
 
+
+# Поиск предметов по ключевым словам (ad.search)
+
+AD_SEARCH_BACKEND = "ad.search.SQLiteFTSSearchBackend"
+
+
+# Потоковая загрузка предметов (api/bulk-json-load/): кол-во записей в одной транзакции
+
+AD_BULK_IMPORT_BATCH_SIZE = 1000
+
+
+# Потоки, создающие миниатюры изображений предметов (ad.thumbnails)
+
+AD_THUMBNAIL_WORKERS = 2
+
+
+# Приём изображений предметов (ad.images): наибольшие размеры оригинала, формат и качество перекодирования
+
+AD_IMAGE_MAX_SIZE = (1600, 1600)
+AD_IMAGE_FORMAT = "WEBP"
+AD_IMAGE_QUALITY = 80
+
+
+# Кеш категорий и формы фильтра каталога (ad.categories): срок жизни (сек.) и псевдоним общего кеша из CACHES
+# (None - только память процесса)
+
+AD_CATEGORY_CACHE_TTL = 300
+AD_CATEGORY_CACHE_ALIAS = None
+
+
+# Кеш ответов для анонимных пользователей (ad.response_cache): псевдоним из CACHES и срок жизни записи (сек.)
+
+AD_RESPONSE_CACHE_ALIAS = "default"
+AD_RESPONSE_CACHE_TTL = 60
+
+
+# События предложений обмена (ad.events, поток /ad/async/events/): бэкенд, кол-во хранимых для повтора событий,
+# очередь одного подключения, интервал keepalive и наибольшая длительность потока (сек.).
+# AD_EVENT_STREAM_ENABLED - подключать ли страницы списков к потоку; None - только под ASGI (uvicorn, daphne):
+# под WSGI/runserver поток занимал бы рабочий поток на всю длительность и не доставлял событий
+
+AD_EVENT_STREAM_ENABLED = None
+AD_EVENT_BACKEND = "ad.events.InProcessEventBackend"
+AD_EVENT_HISTORY_SIZE = 1000
+AD_EVENT_QUEUE_SIZE = 100
+AD_EVENT_KEEPALIVE = 15
+AD_EVENT_STREAM_MAX_DURATION = 300
+
+
+# Журнал изменений (ad.journal, лента /api/changes/?since=): записей в одном запросе к журналу, наибольшее кол-во
+# записей в одном ответе и срок хранения журнала (дн.)
+
+AD_CHANGE_FEED_BATCH_SIZE = 500
+AD_CHANGE_FEED_LIMIT = 10000
+AD_CHANGE_JOURNAL_RETENTION_DAYS = 30
+
+# Срок ожидающих предложений обмена (ad.exchange.expire_proposals, команда expire_proposals): возраст (дн.),
+# после которого предложение отклоняется, и кол-во предложений в одной транзакции
+
+AD_PROPOSAL_MAX_AGE_DAYS = 30
+AD_PROPOSAL_EXPIRE_BATCH_SIZE = 1000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
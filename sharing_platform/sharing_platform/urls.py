@@ -22,6 +22,7 @@ from rest_framework.authtoken import views
 
 urlpatterns = [
     path('admin/', admin.site.urls, name="admin"),
+    path("ad/async/", include("ad.async_urls")),  # Асинхронные JSON-представления (ASGI)
     path("ad/", include("ad.urls")),
     path("api/", include("ad_management.urls")),
     path('api-token-auth/', views.obtain_auth_token)